@@ -0,0 +1,171 @@
+"""
+Ограничение числа одновременно обрабатываемых запросов.
+
+Тяжёлые отчёты (полный список заказов, рейтинг, трассировка, баланс,
+массовые загрузки) могут занять весь пул соединений с базой, и ввод смен с
+планшетов встаёт в очередь за ними. AdmissionMiddleware делит запросы на
+группы по методу и пути:
+
+- shift_writes - изменения extrusion, paketki, flexa, finished-products
+  и отложенные записи планшетов (POST /sync);
+- heavy - отчёты и массовые операции;
+- writes - остальные изменения;
+- reads - остальные чтения.
+
+Всего одновременно обрабатывается не больше ADMISSION_CAPACITY запросов,
+из них ADMISSION_RESERVED мест доступны только shift_writes: остальные
+группы начинают работу, лишь пока свободно больше резерва. У каждой
+группы свой предел (ADMISSION_<GROUP>_LIMIT) и время ожидания в очереди
+(ADMISSION_<GROUP>_TIMEOUT, секунды). Не дождавшийся места запрос
+получает 503 с Retry-After. /metrics, /debug и документация не
+ограничиваются. ADMISSION_CAPACITY=0 отключает ограничение.
+
+Пределы действуют в пределах одного процесса: при запуске через
+app.serve их стоит делить на число процессов.
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from fastapi.responses import ORJSONResponse
+from prometheus_client import Counter, Gauge, Histogram
+
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", "16"))
+ADMISSION_RESERVED = int(os.getenv("ADMISSION_RESERVED", "4"))
+
+READ_METHODS = ("GET", "HEAD")
+EXEMPT_PATHS = re.compile(r"^/(metrics|debug/|docs|redoc|openapi\.json|$)")
+SHIFT_WRITES = re.compile(r"^/(extrusion|paketki|flexa|finished-products|sync)(/|$)")
+HEAVY_READS = re.compile(r"^/(orders/?$|workers/ranking|trace/|balance/?$)")
+HEAVY_WRITES = re.compile(r"^/(orders/import|orders/bulk|batches/bulk)/?$")
+
+# Группа: (предел одновременных запросов, ожидание в очереди в секундах)
+DEFAULT_LIMITS = {
+    "shift_writes": (8, 10.0),
+    "writes": (8, 5.0),
+    "reads": (12, 5.0),
+    "heavy": (2, 2.0),
+}
+# Группы, которым доступен резерв
+RESERVED_GROUPS = ("shift_writes",)
+
+IN_FLIGHT = Gauge("admission_in_flight", "Requests being served by admission group", ["group"],
+                  multiprocess_mode="livesum")
+REJECTED = Counter("admission_rejected_total", "Requests rejected with 503 by admission group", ["group"])
+WAIT_TIME = Histogram(
+    "admission_wait_seconds", "Time spent waiting for an admission slot", ["group"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+def group_limits(group: str) -> tuple:
+    limit, timeout = DEFAULT_LIMITS[group]
+    prefix = f"ADMISSION_{group.upper()}"
+    return (int(os.getenv(f"{prefix}_LIMIT", str(limit))),
+            float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))))
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Группа запроса или None, если он не ограничивается."""
+    if EXEMPT_PATHS.match(path):
+        return None
+    if method in READ_METHODS:
+        return "heavy" if HEAVY_READS.match(path) else "reads"
+    if SHIFT_WRITES.match(path):
+        return "shift_writes"
+    return "heavy" if HEAVY_WRITES.match(path) else "writes"
+
+
+class Overloaded(Exception):
+    def __init__(self, group: str, retry_after: int):
+        self.group = group
+        self.retry_after = retry_after
+
+
+class Admission:
+    """
+    Счётчики занятых мест. Ожидающие перепроверяют условие при каждом
+    освобождении; release синхронный, чтобы отмена запроса не теряла место.
+    """
+
+    def __init__(self, capacity: int, reserved: int, limits: Dict[str, tuple]):
+        self.capacity = capacity
+        self.reserved = min(reserved, capacity)
+        self.limits = limits
+        self.active = {group: 0 for group in limits}
+        self.total = 0
+        self.waiters: List[asyncio.Future] = []
+
+    def can_start(self, group: str) -> bool:
+        if self.active[group] >= self.limits[group][0]:
+            return False
+        if group in RESERVED_GROUPS:
+            return self.total < self.capacity
+        return self.total < self.capacity - self.reserved
+
+    async def acquire(self, group: str) -> None:
+        loop = asyncio.get_running_loop()
+        timeout = self.limits[group][1]
+        deadline = loop.time() + timeout
+        while not self.can_start(group):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise Overloaded(group, max(1, math.ceil(timeout)))
+            waiter = loop.create_future()
+            self.waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+        self.active[group] += 1
+        self.total += 1
+
+    def release(self, group: str) -> None:
+        self.active[group] -= 1
+        self.total -= 1
+        waiters, self.waiters = self.waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class AdmissionMiddleware:
+    """ASGI-middleware: пределы одновременных запросов по группам маршрутов."""
+
+    def __init__(self, app):
+        self.app = app
+        self.admission = Admission(
+            ADMISSION_CAPACITY, ADMISSION_RESERVED,
+            {name: group_limits(name) for name in DEFAULT_LIMITS}
+        )
+
+    async def __call__(self, scope, receive, send):
+        group = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if group is None or ADMISSION_CAPACITY <= 0:
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        try:
+            await self.admission.acquire(group)
+        except Overloaded as exc:
+            REJECTED.labels(group).inc()
+            response = ORJSONResponse(
+                {"detail": f"Server is busy serving {group} requests, retry in {exc.retry_after} s"},
+                status_code=503,
+                headers={"Retry-After": str(exc.retry_after)}
+            )
+            return await response(scope, receive, send)
+        WAIT_TIME.labels(group).observe(time.perf_counter() - started)
+
+        IN_FLIGHT.labels(group).inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            IN_FLIGHT.labels(group).dec()
+            self.admission.release(group)
@@ -0,0 +1,357 @@
+"""
+Холодный архив закрытых заказов в Parquet.
+
+    python -m app.archive --months 12
+    python -m app.archive --reindex     # индекс для архива без него
+
+Заказ считается закрытым, когда у всех его партий заполнена completionDate.
+Заказы, закрытые раньше чем N месяцев назад, вместе со всеми связанными
+записями переносятся в файлы ARCHIVE_DIR/<таблица>/month=YYYY-MM/part.parquet
+(месяц закрытия заказа) и удаляются из рабочих таблиц. В каждую строку
+архива добавляется order_id, чтобы дерево заказа читалось одним фильтром.
+
+Поиск записи по ключу или заказу идёт через индекс
+ARCHIVE_DIR/_index/<таблица>.parquet: первичный ключ, order_id и месяц
+каждой архивной записи, отсортированные по ключу, так что чтение
+индекса по статистике групп строк затрагивает одну группу, а затем
+читаются только файлы найденных месяцев. Без индекса (архив, созданный
+до его появления) просматриваются все файлы; построить индекс для
+такого архива - python -m app.archive --reindex.
+
+Чтение архива синхронное (pyarrow), обработчики вызывают его через
+run_in_threadpool.
+
+Файлы пишутся до удаления строк из базы: при сбое запись может остаться
+в обоих местах, но не потеряется. Повторный запуск перезапишет её в архиве
+и удалит из рабочих таблиц.
+"""
+import argparse
+import os
+from datetime import date
+from typing import Dict, List, Optional
+
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from app.concurrency import VERSION_FIELD
+from app.sync import UPDATED_FIELD
+from app.models import (Orders, Batches, Winding, Extrusion, Cutting, Paketki,
+                        Printing, Flexa, FinishedProducts)
+
+# pyarrow импортируется при первом обращении к архиву: импорт занимает
+# заметную часть холодного старта, а без каталога архива он не нужен.
+# Архив необязателен, без pyarrow чтение из него отключено.
+pa = pc = ds = pq = None
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "12"))
+INDEX_DIR = "_index"
+# Строк в группе индекса: поиск по ключу читает одну такую группу
+INDEX_ROW_GROUP = 65536
+
+# Порядок важен: дочерние таблицы удаляются раньше родительских
+MODELS = {
+    "paketki": Paketki,
+    "flexa": Flexa,
+    "extrusion": Extrusion,
+    "finished_products": FinishedProducts,
+    "winding": Winding,
+    "cutting": Cutting,
+    "printing": Printing,
+    "batches": Batches,
+    "orders": Orders,
+}
+
+ARROW_TYPES = {
+    "IntField": "int64",
+    "SmallIntField": "int64",
+    "BigIntField": "int64",
+    "FloatField": "float64",
+    "CharField": "string",
+    "TextField": "string",
+    "DateField": "date32",
+    "BooleanField": "bool_",
+}
+
+CLOSED_ORDERS_SQL = """
+SELECT order_id, MAX("completionDate") AS closed
+FROM batches
+GROUP BY order_id
+HAVING COUNT(*) = COUNT("completionDate") AND MAX("completionDate") < $1
+"""
+
+
+def load_arrow() -> bool:
+    global pa, pc, ds, pq
+    if pa is None:
+        try:
+            import pyarrow
+            import pyarrow.compute
+            import pyarrow.dataset
+            import pyarrow.parquet
+        except ImportError:
+            return False
+        pa, pc, ds, pq = pyarrow, pyarrow.compute, pyarrow.dataset, pyarrow.parquet
+    return True
+
+
+def enabled() -> bool:
+    return os.path.isdir(ARCHIVE_DIR) and load_arrow()
+
+
+def arrow_schema(table: str) -> "pa.Schema":
+    meta = MODELS[table]._meta
+    columns = [
+        pa.field(name, getattr(pa, ARROW_TYPES[type(meta.fields_map[name]).__name__])())
+        for name in meta.fields_db_projection if name not in (VERSION_FIELD, UPDATED_FIELD)
+    ]
+    if "order_id" not in meta.fields_db_projection:
+        columns.append(pa.field("order_id", pa.int64()))
+    return pa.schema(columns)
+
+
+def dataset(table: str, months: Optional[List[str]] = None) -> Optional["ds.Dataset"]:
+    """Архив таблицы целиком или только файлы месяцев months."""
+    path = os.path.join(ARCHIVE_DIR, table)
+    if not enabled() or not os.path.isdir(path):
+        return None
+    if months is None:
+        return ds.dataset(path, format="parquet", partitioning="hive")
+    files = [os.path.join(path, f"month={month}", "part.parquet") for month in months]
+    files = [file for file in files if os.path.exists(file)]
+    return ds.dataset(files, format="parquet") if files else None
+
+
+def read(table: str, expression, months: Optional[List[str]] = None) -> List[dict]:
+    source = dataset(table, months)
+    if source is None:
+        return []
+    rows = source.to_table(filter=expression).to_pylist()
+    versioned = VERSION_FIELD in MODELS[table]._meta.fields_map
+    for row in rows:
+        row.pop("month", None)
+        if versioned:
+            # Версия нужна только для правок, архивные записи не меняются
+            row[VERSION_FIELD] = 1
+    return rows
+
+
+def index_path(table: str) -> str:
+    return os.path.join(ARCHIVE_DIR, INDEX_DIR, f"{table}.parquet")
+
+
+def index_rows(table: str, column: str, values: List[int]) -> Optional[List[dict]]:
+    """Строки индекса таблицы (order_id, month) с column из values; None - индекса нет."""
+    path = index_path(table)
+    if not os.path.exists(path):
+        return None
+    return pq.read_table(path, columns=["order_id", "month"],
+                         filters=[(column, "in", values)]).to_pylist()
+
+
+def write_index(table: str, index: "pa.Table") -> None:
+    path = index_path(table)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(index.sort_by(MODELS[table]._meta.pk_attr), tmp_path, row_group_size=INDEX_ROW_GROUP)
+    os.replace(tmp_path, path)
+
+
+def update_index(table: str, month: str, rows: List[dict]) -> None:
+    """Записать в индекс таблицы ключи записей, перенесённых в месяц month."""
+    pk = MODELS[table]._meta.pk_attr
+    # У orders первичный ключ и есть order_id
+    new = pa.table({
+        pk: pa.array([row[pk] for row in rows], pa.int64()),
+        "order_id": pa.array([row["order_id"] for row in rows], pa.int64()),
+        "month": pa.array([month] * len(rows), pa.string()),
+    })
+    path = index_path(table)
+    if os.path.exists(path):
+        existing = pq.read_table(path)
+        existing = existing.filter(pc.invert(pc.is_in(existing[pk], value_set=new[pk])))
+        new = pa.concat_tables([existing, new])
+    write_index(table, new)
+
+
+def rebuild_index(table: str) -> int:
+    """Построить индекс таблицы заново по файлам архива; вернуть число записей."""
+    source = dataset(table)
+    if source is None:
+        return 0
+    pk = MODELS[table]._meta.pk_attr
+    columns = list(dict.fromkeys([pk, "order_id", "month"]))
+    index = source.to_table(columns=columns)
+    index = index.set_column(index.schema.get_field_index("month"), "month",
+                             pc.cast(index["month"], pa.string()))
+    write_index(table, index)
+    return index.num_rows
+
+
+def find_records(table: str, record_id: int) -> List[dict]:
+    """Архивная запись таблицы table по первичному ключу (пустой список, если нет)."""
+    if not enabled():
+        return []
+    pk = MODELS[table]._meta.pk_attr
+    indexed = index_rows(table, pk, [record_id])
+    months = None if indexed is None else sorted({row["month"] for row in indexed})
+    if months == []:
+        return []
+    return read(table, ds.field(pk) == record_id, months)
+
+
+def find_order_ids(table: str, record_id: int) -> List[int]:
+    """Заказы, к которым относится архивная запись таблицы table."""
+    if not enabled():
+        return []
+    indexed = index_rows(table, MODELS[table]._meta.pk_attr, [record_id])
+    if indexed is None:
+        indexed = find_records(table, record_id)
+    return sorted({row["order_id"] for row in indexed})
+
+
+def load_order_tree(order_ids: List[int]) -> Dict[str, List[dict]]:
+    """Архивное дерево заказов в том же виде, что и app.trace.load_order_tree."""
+    if not enabled():
+        return {table: [] for table in MODELS}
+    # Всё дерево заказа лежит в месяце его закрытия
+    indexed = index_rows("orders", "order_id", order_ids)
+    months = None if indexed is None else sorted({row["month"] for row in indexed})
+    if months == []:
+        return {table: [] for table in MODELS}
+    expression = ds.field("order_id").isin(order_ids)
+    return {table: read(table, expression, months) for table in MODELS}
+
+
+def shift_totals(start: date, end: date) -> Dict[int, dict]:
+    """Суммы по работникам из архивных смен за период [start, end)."""
+    totals: Dict[int, dict] = {}
+    if not enabled():
+        return totals
+
+    expression = (ds.field("date") >= start) & (ds.field("date") < end)
+    for table in ("extrusion", "paketki", "flexa", "finished_products"):
+        for row in read(table, expression):
+            worker = totals.setdefault(row["worker_id"], {
+                "shifts": 0, "output": 0.0, "norm": 0.0,
+                "finishedQuantity": 0, "finishedWeight": 0.0,
+            })
+            if table == "finished_products":
+                worker["finishedQuantity"] += row["quantity"]
+                worker["finishedWeight"] += row["weight"]
+            else:
+                worker["shifts"] += 1
+                worker["output"] += row["totalShift"]
+                worker["norm"] += row["shiftNorm"]
+    return totals
+
+
+def write_month(table: str, month: str, rows: List[dict]) -> None:
+    """Дописать строки в файл месяца; повторный перенос тех же записей их заменяет."""
+    directory = os.path.join(ARCHIVE_DIR, table, f"month={month}")
+    path = os.path.join(directory, "part.parquet")
+    os.makedirs(directory, exist_ok=True)
+
+    schema = arrow_schema(table)
+    new = pa.Table.from_pylist(rows, schema=schema)
+    if os.path.exists(path):
+        pk = MODELS[table]._meta.pk_attr
+        existing = pq.read_table(path, schema=schema)
+        existing = existing.filter(pc.invert(pc.is_in(existing[pk], value_set=new[pk])))
+        new = pa.concat_tables([existing, new])
+
+    tmp_path = path + ".tmp"
+    pq.write_table(new, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def tag_order_ids(tree: Dict[str, List[dict]]) -> None:
+    """Проставить order_id каждой записи дерева по цепочке родителей."""
+    order_of = {"batches": {row["batch_id"]: row["order_id"] for row in tree["batches"]}}
+    for table, parent, fk in (
+            ("winding", "batches", "batch_id"),
+            ("cutting", "batches", "batch_id"),
+            ("printing", "batches", "batch_id"),
+            ("finished_products", "batches", "batch_id"),
+            ("extrusion", "winding", "winding_id"),
+            ("flexa", "printing", "printing_id"),
+    ):
+        pk = MODELS[table]._meta.pk_attr
+        order_of[table] = {}
+        for row in tree[table]:
+            row["order_id"] = order_of[parent][row[fk]]
+            order_of[table][row[pk]] = row["order_id"]
+    for row in tree["paketki"]:
+        row["order_id"] = order_of["cutting"][row["cutting_id"]]
+
+
+async def archive_orders(months: int = ARCHIVE_AFTER_MONTHS) -> int:
+    """Перенести в архив заказы, закрытые раньше чем months месяцев назад."""
+    if not load_arrow():
+        raise RuntimeError("pyarrow is required to archive orders")
+
+    from app.partitioning import add_months
+    from app.trace import load_order_tree as load_hot_tree
+
+    cutoff = add_months(date.today().replace(day=1), -months)
+    conn = Tortoise.get_connection("default")
+    closed = await conn.execute_query_dict(CLOSED_ORDERS_SQL, [cutoff])
+
+    by_month: Dict[str, List[int]] = {}
+    for row in closed:
+        # SQLite возвращает дату строкой YYYY-MM-DD
+        month = str(row["closed"])[:7]
+        by_month.setdefault(month, []).append(row["order_id"])
+
+    for month, order_ids in sorted(by_month.items()):
+        tree = await load_hot_tree(order_ids)
+        # Пакеты переносятся вместе со своей резкой. Пакет из плёнки этого
+        # заказа, нарезанный в другом, ещё рабочем заказе, остаётся в рабочей
+        # таблице: ссылка на экструзию без ограничения в базе, висячая не мешает
+        cutting_ids = {row["cutting_ID"] for row in tree["cutting"]}
+        tree["paketki"] = [row for row in tree["paketki"] if row["cutting_id"] in cutting_ids]
+        tag_order_ids(tree)
+        for table in MODELS:
+            if tree[table]:
+                write_month(table, month, tree[table])
+                update_index(table, month, tree[table])
+
+        async with in_transaction() as tx:
+            for table, model in MODELS.items():
+                pk = model._meta.pk_attr
+                ids = [row[pk] for row in tree[table]]
+                if ids:
+                    await model.filter(**{f"{pk}__in": ids}).using_db(tx).delete()
+
+    return sum(len(order_ids) for order_ids in by_month.values())
+
+
+async def main() -> None:
+    from app.database import init_db
+
+    parser = argparse.ArgumentParser(description="Archive closed orders to Parquet")
+    parser.add_argument(
+        "--months", type=int, default=ARCHIVE_AFTER_MONTHS,
+        help="archive orders closed more than this many months ago"
+    )
+    parser.add_argument(
+        "--reindex", action="store_true",
+        help="rebuild lookup indexes of an existing archive instead of archiving"
+    )
+    args = parser.parse_args()
+
+    await init_db()
+    if args.reindex:
+        if not enabled():
+            raise RuntimeError(f"No archive in {ARCHIVE_DIR} or pyarrow is not installed")
+        for table in MODELS:
+            print(f"{table}: {rebuild_index(table)} records indexed")
+        return
+
+    print(f"Archived {await archive_orders(args.months)} orders to {ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    from tortoise import run_async
+
+    run_async(main())
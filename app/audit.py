@@ -0,0 +1,278 @@
+"""
+Журнал изменений: кто, когда и что поменял в записях.
+
+Обработчики изменения и удаления всех ресурсов передают в record()
+прежние и новые значения изменённых полей (при удалении - всю прежнюю
+запись). Записи не пишутся в базу в самом запросе: они копятся в памяти
+и фоновая задача write_audit() сбрасывает их в audit_log пачками по
+AUDIT_BATCH_SIZE - в Postgres через COPY, в SQLite многострочной
+вставкой - раз в AUDIT_FLUSH_INTERVAL секунд или сразу, как наберётся
+пачка. При остановке приложения очередь дописывается (close_audit).
+
+Очередь ограничена AUDIT_QUEUE_SIZE записями. Если база недоступна,
+записи остаются в очереди до следующей попытки, а при переполнении
+самые старые отбрасываются (счётчик audit_dropped_total и
+предупреждение в логе), но запросы не замедляются.
+
+Прежние значения при изменении по версии и массовом изменении партий
+Postgres возвращает тем же UPDATE (update_rows), в SQLite они читаются
+перед ним. Удаление без загрузки записи - DELETE ... RETURNING
+(delete_row).
+
+Кто изменил - заголовок X-User, а без него адрес клиента: своей
+авторизации у API нет. Журнал только дополняется: изменение и удаление
+его строк запрещены триггером (миграция 0007_audit_log).
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterable, List, Optional, Tuple, Type
+
+import orjson
+from prometheus_client import Counter
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.models import Model
+
+from app import metrics
+from app.sync import UPDATED_FIELD
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "100000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "1000"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1"))
+
+COLUMNS = ["at", "resource", "record_id", "action", "actor", "before", "after"]
+# Параметров одной вставки в SQLite не больше 32766
+INSERT_CHUNK = min(1000, 32000 // len(COLUMNS))
+ACTOR_HEADER = b"x-user"
+ACTOR_LENGTH = 255
+# Приставка прежних значений в строках update_rows
+OLD_PREFIX = "old."
+
+DROPPED = Counter("audit_dropped_total", "Audit entries dropped because the queue was full")
+
+log = logging.getLogger(__name__)
+
+# (время, ресурс, id, действие, кто, прежние значения, новые значения)
+_queue: Deque[tuple] = deque()
+# Пачка, которую сейчас пишет flush
+_writing: List[tuple] = []
+_dropped = 0
+_wakeup = asyncio.Event()
+_flush_lock = asyncio.Lock()
+
+
+def actor() -> Optional[str]:
+    """Автор изменения в текущем запросе."""
+    stats = metrics.current_stats()
+    if stats is None or stats.scope is None:
+        return None
+    for name, value in stats.scope.get("headers", ()):
+        if name == ACTOR_HEADER and value:
+            return value.decode("latin-1")[:ACTOR_LENGTH]
+    client = stats.scope.get("client")
+    return client[0] if client else None
+
+
+def record(resource: str, record_id: int, action: str, before: dict, after: Optional[dict] = None) -> None:
+    """
+    Поставить запись в очередь журнала. Для изменения (after задан)
+    остаются только поля, значение которых действительно поменялось.
+    """
+    global _dropped
+    if after is not None:
+        changed = [field for field in after if field in before and before[field] != after[field]]
+        if not changed:
+            return
+        before = {field: before[field] for field in changed}
+        after = {field: after[field] for field in changed}
+    if len(_queue) >= AUDIT_QUEUE_SIZE:
+        _queue.popleft()
+        _dropped += 1
+        DROPPED.inc()
+    _queue.append((datetime.now(timezone.utc), resource, record_id, action, actor(), before, after))
+    if len(_queue) >= AUDIT_BATCH_SIZE:
+        _wakeup.set()
+
+
+def snapshot(obj: Model, fields: Optional[Iterable[str]] = None) -> dict:
+    """Значения полей fields объекта ORM (по умолчанию - всех столбцов)."""
+    if fields is None:
+        fields = [field for field in obj._meta.fields_db_projection if field != UPDATED_FIELD]
+    return {field: getattr(obj, field) for field in fields}
+
+
+def record_update(obj: Model, before: dict) -> None:
+    """Изменение объекта ORM; before - snapshot(obj, поля) до update_from_dict."""
+    record(obj._meta.db_table, obj.pk, "update", before, snapshot(obj, before))
+
+
+def record_delete(obj: Model) -> None:
+    record(obj._meta.db_table, obj.pk, "delete", snapshot(obj))
+
+
+async def update_rows(conn: BaseDBAsyncClient, table: str, pk: str, assignments: str, where: str,
+                      values: list, fields: List[str]) -> Tuple[List[dict], Dict[int, dict]]:
+    """
+    UPDATE table SET assignments WHERE where RETURNING * вместе с прежними
+    значениями fields: (новые строки, {id: прежние значения}). В values
+    сначала по параметру на каждое поле fields из assignments, затем
+    параметры where; столбцы в where - без имени таблицы.
+    """
+    if not fields:
+        rows = await conn.execute_query_dict(
+            f'UPDATE "{table}" SET {assignments} WHERE {where} RETURNING *', values
+        )
+        return rows, {}
+    columns = ", ".join(f'"{column}"' for column in [pk, *fields])
+    if conn.capabilities.dialect == "postgres":
+        # Подзапрос блокирует строки, поэтому old - значения непосредственно
+        # до изменения; условие where после ожидания блокировки проверяется заново
+        prior = ", ".join(f'old."{field}" AS "{OLD_PREFIX}{field}"' for field in fields)
+        rows = await conn.execute_query_dict(
+            f'UPDATE "{table}" SET {assignments} '
+            f'FROM (SELECT {columns} FROM "{table}" WHERE {where} FOR UPDATE) AS old '
+            f'WHERE "{table}"."{pk}" = old."{pk}" RETURNING "{table}".*, {prior}',
+            values
+        )
+        old = {row[pk]: {field: row.pop(OLD_PREFIX + field) for field in fields} for row in rows}
+        return rows, old
+
+    # RETURNING в SQLite не видит прежних значений
+    before = await conn.execute_query_dict(
+        f'SELECT {columns} FROM "{table}" WHERE {where}', values[len(fields):]
+    )
+    rows = await conn.execute_query_dict(
+        f'UPDATE "{table}" SET {assignments} WHERE {where} RETURNING *', values
+    )
+    return rows, {row.pop(pk): row for row in before}
+
+
+async def delete_row(model: Type[Model], record_id: int) -> Optional[dict]:
+    """Удалить запись одним DELETE ... RETURNING и записать её в журнал; удалённая строка или None."""
+    meta = model._meta
+    rows = await Tortoise.get_connection("default").execute_query_dict(
+        f'DELETE FROM "{meta.db_table}" WHERE "{meta.db_pk_column}" = $1 RETURNING *', [record_id]
+    )
+    if not rows:
+        return None
+    rows[0].pop(UPDATED_FIELD, None)
+    record(meta.db_table, record_id, "delete", rows[0])
+    return rows[0]
+
+
+def dumps(values: Optional[dict]) -> Optional[str]:
+    return None if values is None else orjson.dumps(values, default=str).decode()
+
+
+async def write(entries: List[tuple]) -> None:
+    conn = Tortoise.get_connection("default")
+    if conn.capabilities.dialect == "postgres":
+        records = [(*entry[:5], dumps(entry[5]), dumps(entry[6])) for entry in entries]
+        async with conn.acquire_connection() as raw:
+            await raw.copy_records_to_table("audit_log", records=records, columns=COLUMNS)
+        return
+
+    # Время - в том же текстовом формате, что пишет Tortoise
+    records = [(entry[0].strftime("%Y-%m-%d %H:%M:%S.%f+00:00"), *entry[1:5], dumps(entry[5]),
+                dumps(entry[6])) for entry in entries]
+    names = ", ".join(f'"{column}"' for column in COLUMNS)
+    row = "(" + ", ".join("?" * len(COLUMNS)) + ")"
+    for start in range(0, len(records), INSERT_CHUNK):
+        chunk = records[start:start + INSERT_CHUNK]
+        await conn.execute_query(
+            f"INSERT INTO audit_log ({names}) VALUES {', '.join([row] * len(chunk))}",
+            [value for record_values in chunk for value in record_values]
+        )
+
+
+async def flush() -> None:
+    """Записать всю очередь; при ошибке записи непереданные записи остаются в очереди."""
+    global _dropped, _writing
+    async with _flush_lock:
+        while _queue:
+            batch = [_queue.popleft() for _ in range(min(len(_queue), AUDIT_BATCH_SIZE))]
+            _writing = batch
+            try:
+                await write(batch)
+            except BaseException:
+                _queue.extendleft(reversed(batch))
+                while len(_queue) > AUDIT_QUEUE_SIZE:
+                    _queue.popleft()
+                    _dropped += 1
+                    DROPPED.inc()
+                raise
+            finally:
+                _writing = []
+        if _dropped:
+            log.warning("Audit queue overflow: %d entries dropped", _dropped)
+            _dropped = 0
+
+
+async def write_audit() -> None:
+    """Фоновая запись журнала, запускается при старте приложения."""
+    while True:
+        try:
+            await asyncio.wait_for(_wakeup.wait(), AUDIT_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        try:
+            await flush()
+        except Exception:
+            log.exception("Audit log write failed, %d entries kept in queue", len(_queue))
+            # Не повторять сразу: новые записи будят задачу, пока очередь полна
+            await asyncio.sleep(AUDIT_FLUSH_INTERVAL)
+
+
+async def close_audit() -> None:
+    """Дописать очередь при остановке приложения, после отмены write_audit."""
+    try:
+        await flush()
+    except Exception:
+        log.exception("Audit log was not flushed on shutdown, %d entries lost", len(_queue))
+
+
+def pending(resource: str, record_id: int) -> List[dict]:
+    """Записи о записи record_id, ещё не попавшие в audit_log, новые первыми."""
+    entries = []
+    for entry in reversed([*_writing, *_queue]):
+        if entry[1] != resource or entry[2] != record_id:
+            continue
+        at, _, _, action, who, before, after = entry
+        entries.append({
+            "id": None, "at": at, "resource": resource, "record_id": record_id, "action": action,
+            "actor": who,
+            # Значения - в том же виде, в каком их вернёт audit_log
+            "before": None if before is None else orjson.loads(dumps(before)),
+            "after": None if after is None else orjson.loads(dumps(after)),
+        })
+    return entries
+
+
+async def history(resource: str, record_id: int, limit: int, skip: int = 0) -> List[dict]:
+    """
+    Записи журнала о записи record_id ресурса, новые первыми. Записи этого
+    процесса, ещё не записанные фоновой задачей, берутся из памяти: чтение
+    журнала в базу не пишет.
+    """
+    queued = pending(resource, record_id)
+    entries = queued[skip:skip + limit]
+    if len(entries) == limit:
+        return entries
+    rows = await Tortoise.get_connection("default").execute_query_dict(
+        'SELECT id, at, resource, record_id, action, actor, "before", "after" FROM audit_log '
+        f"WHERE resource = $1 AND record_id = $2 ORDER BY id DESC "
+        f"LIMIT {limit - len(entries)} OFFSET {max(skip - len(queued), 0)}",
+        [resource, record_id]
+    )
+    for row in rows:
+        if isinstance(row["at"], str):
+            # SQLite возвращает время строкой
+            row["at"] = datetime.fromisoformat(row["at"])
+        for column in ("before", "after"):
+            if isinstance(row[column], (str, bytes)):
+                row[column] = orjson.loads(row[column])
+    return entries + rows
@@ -0,0 +1,387 @@
+"""
+Материальный баланс заказов и партий.
+
+Для каждой партии сравнивается план с фактом:
+- план - orderWeight заказа (и weightWithCutting, с учётом отходов на
+  резке), поровну разделённый между партиями заказа;
+- экструзия - totalShift и брак смен экструзии по намотке партии;
+- печать - totalShift и брак флексопечати;
+- резка - totalShift и брак пакетов по резке партии;
+- готовая продукция - вес и количество FinishedProducts.
+
+losses - выдавленное, не дошедшее до готовой продукции; deviation -
+отклонение веса готовой продукции от плана в процентах.
+
+Суммы считаются сгруппированными по партиям запросами, по одному на
+таблицу фактов, план - ещё одним. Баланс закрытой партии (с completionDate) почти не меняется,
+поэтому он кэшируется и в следующих расчётах не пересчитывается. Кэш
+сбрасывается при изменении заказов и партий (в том числе закрытии
+партии), а правка смены или готовой продукции через API сбрасывает
+только свою партию (forget_batches). Целиком кэш устаревает через
+BALANCE_CACHE_TTL секунд - это предел для изменений в обход обработчиков.
+
+Баланс заказа, перенесённого в архив (app.archive), считается по его
+архивному дереву теми же правилами. Баланс завода - только по рабочим
+таблицам: архивные заказы в него не входят (archiveIncluded = false).
+
+Отчёты читаются с реплики (replicas.read_connection), заполнение при
+закрытии партии - в основной базе: при закрытии партии пустые accepted,
+acceptedPCS и deviation заполняются из её баланса (fill_on_close,
+fill_closed).
+"""
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from app import archive, cachebus, replicas
+
+BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", "3600"))
+# Имя кэша закрытых партий в app.cachebus
+CACHE_NAME = "balance"
+
+MEASURES = ("extruded", "extrusionDefects", "printed", "printDefects", "cut", "cuttingDefects",
+            "finishedWeight", "finishedQuantity")
+# Показатели, которые складываются при переходе от партий к заказу и заводу
+SUMMED = ("plannedWeight", "plannedGross") + MEASURES + ("losses",)
+
+# Суммы по партиям из каждой таблицы фактов; {where} ограничивает партии.
+# Отдельные запросы по таблицам выполняются параллельно на разных
+# соединениях и быстрее одного UNION ALL с общей группировкой.
+ACTUALS_SQL = {
+    "extrusion": """
+SELECT w.batch_id, SUM(e."totalShift") AS extruded,
+       SUM(e."whiteDefective" + e."transparentDefective" + e."coloredDefective") AS "extrusionDefects"
+FROM extrusion e
+JOIN winding w ON w."winding_ID" = e.winding_id
+JOIN batches b ON b.batch_id = w.batch_id
+{where}
+GROUP BY w.batch_id
+""",
+    "flexa": """
+SELECT p.batch_id, SUM(f."totalShift") AS printed,
+       SUM(f."whiteDefective" + f."printDefective" + f."coloredDefective") AS "printDefects"
+FROM flexa f
+JOIN printing p ON p."printing_ID" = f.printing_id
+JOIN batches b ON b.batch_id = p.batch_id
+{where}
+GROUP BY p.batch_id
+""",
+    "paketki": """
+SELECT c.batch_id, SUM(pk."totalShift") AS cut,
+       SUM(pk."whiteDefective" + pk."transparentDefective" + pk."coloredDefective") AS "cuttingDefects"
+FROM paketki pk
+JOIN cutting c ON c."cutting_ID" = pk.cutting_id
+JOIN batches b ON b.batch_id = c.batch_id
+{where}
+GROUP BY c.batch_id
+""",
+    "finished_products": """
+SELECT fp.batch_id, SUM(fp.weight) AS "finishedWeight", SUM(fp.quantity) AS "finishedQuantity"
+FROM finished_products fp
+JOIN batches b ON b.batch_id = fp.batch_id
+{where}
+GROUP BY fp.batch_id
+""",
+}
+
+# Таблицы фактов: таблица -> (родитель со связью с партией, внешний ключ,
+# {показатель: столбцы}); по ним же считаются суммы архивного дерева
+ARCHIVE_ACTUALS = {
+    "extrusion": ("winding", "winding_id", {
+        "extruded": ("totalShift",),
+        "extrusionDefects": ("whiteDefective", "transparentDefective", "coloredDefective"),
+    }),
+    "flexa": ("printing", "printing_id", {
+        "printed": ("totalShift",),
+        "printDefects": ("whiteDefective", "printDefective", "coloredDefective"),
+    }),
+    "paketki": ("cutting", "cutting_id", {
+        "cut": ("totalShift",),
+        "cuttingDefects": ("whiteDefective", "transparentDefective", "coloredDefective"),
+    }),
+    "finished_products": ("batches", "batch_id", {
+        "finishedWeight": ("weight",),
+        "finishedQuantity": ("quantity",),
+    }),
+}
+
+PLAN_SQL = """
+SELECT b.batch_id, b.order_id, b."batchNumber", b."completionDate",
+       b.accepted, b."acceptedPCS", b.deviation AS "storedDeviation",
+       o."orderNumber", o."orderWeight", o."weightWithCutting",
+       (SELECT COUNT(*) FROM batches x WHERE x.order_id = b.order_id) AS "batchCount"
+FROM batches b
+JOIN orders o ON o.order_id = b.order_id
+{where}
+ORDER BY b.order_id, b.batch_id
+"""
+
+# batch_id -> баланс закрытой партии
+_closed: Dict[int, dict] = {}
+# Кэш содержит все закрытые партии (после расчёта по всему заводу)
+_closed_complete = False
+_closed_since = time.monotonic()
+
+
+def forget() -> None:
+    global _closed_complete, _closed_since
+    _closed.clear()
+    _closed_complete = False
+    _closed_since = time.monotonic()
+
+
+def forget_batch(key: str) -> None:
+    _closed.pop(int(key), None)
+
+
+cachebus.subscribe(("orders", "batches"), forget)
+cachebus.subscribe_keys(CACHE_NAME, forget_batch)
+
+
+def expire() -> None:
+    if time.monotonic() - _closed_since > BALANCE_CACHE_TTL:
+        forget()
+
+
+def deviation(actual: float, planned: float) -> Optional[float]:
+    return (actual - planned) / planned * 100 if planned else None
+
+
+def batch_balance(plan: dict, actuals: Optional[dict]) -> dict:
+    share = plan["batchCount"] or 1
+    row = {
+        "batch_id": plan["batch_id"],
+        "order_id": plan["order_id"],
+        "orderNumber": plan["orderNumber"],
+        "batchNumber": plan["batchNumber"],
+        "closed": plan["completionDate"] is not None,
+        "plannedWeight": plan["orderWeight"] / share,
+        "plannedGross": plan["weightWithCutting"] / share,
+    }
+    for measure in MEASURES:
+        row[measure] = (actuals or {}).get(measure) or 0
+    row["losses"] = row["extruded"] - row["finishedWeight"]
+    row["deviation"] = deviation(row["finishedWeight"], row["plannedWeight"])
+    return row
+
+
+def order_balance(batches: List[dict]) -> dict:
+    row = {
+        "order_id": batches[0]["order_id"],
+        "orderNumber": batches[0]["orderNumber"],
+        "batchCount": len(batches),
+        "closedBatches": 0,
+        **dict.fromkeys(SUMMED, 0),
+    }
+    for batch in batches:
+        row["closedBatches"] += batch["closed"]
+        for key in SUMMED:
+            row[key] += batch[key]
+    row["deviation"] = deviation(row["finishedWeight"], row["plannedWeight"])
+    return row
+
+
+async def actuals(conn: BaseDBAsyncClient, where: str, values: list) -> Dict[int, dict]:
+    """Суммы фактов по партиям: batch_id -> {показатель: сумма}."""
+    results = await asyncio.gather(*(
+        conn.execute_query_dict(sql.format(where=where), values) for sql in ACTUALS_SQL.values()
+    ))
+    totals: Dict[int, dict] = {}
+    for rows in results:
+        for row in rows:
+            totals.setdefault(row.pop("batch_id"), {}).update(row)
+    return totals
+
+
+def ids_where(batch_ids: List[int]) -> str:
+    placeholders = ", ".join(f"${index}" for index in range(1, len(batch_ids) + 1))
+    return f"WHERE b.batch_id IN ({placeholders})"
+
+
+async def load(conn: BaseDBAsyncClient, where: str, values: list,
+               open_only: bool = False, cache: bool = True) -> List[dict]:
+    """
+    Балансы партий, отобранных условием where. Суммы запрашиваются для
+    партий, которых нет в кэше закрытых; с open_only - только для
+    открытых, когда кэш заведомо полон. С cache=False закрытые партии в кэш
+    не попадают: conn - незавершённая транзакция, которая может откатиться.
+    """
+    plans = await conn.execute_query_dict(PLAN_SQL.format(where=where), values)
+    missing = [plan for plan in plans if plan["batch_id"] not in _closed]
+    found = {}
+    if missing:
+        found = await actuals(conn, 'WHERE b."completionDate" IS NULL' if open_only else where, values)
+        if open_only:
+            # Партии, закрытые, пока шёл запрос плана, в кэш ещё не попали
+            strays = [plan["batch_id"] for plan in missing if plan["completionDate"] is not None]
+            if strays:
+                found.update(await actuals(conn, ids_where(strays), strays))
+
+    balances = []
+    for plan in plans:
+        balance = _closed.get(plan["batch_id"])
+        if balance is None:
+            balance = batch_balance(plan, found.get(plan["batch_id"]))
+            if balance["closed"] and cache:
+                _closed[plan["batch_id"]] = balance
+        balances.append(balance)
+    return balances
+
+
+def archived_balances(tree: Dict[str, List[dict]]) -> List[dict]:
+    """Балансы партий архивного дерева заказов (archive.load_order_tree)."""
+    orders = {row["order_id"]: row for row in tree["orders"]}
+    counts = Counter(row["order_id"] for row in tree["batches"])
+    found: Dict[int, dict] = {}
+    for table, (parent, fk, measures) in ARCHIVE_ACTUALS.items():
+        pk = archive.MODELS[parent]._meta.pk_attr
+        batch_of = {row[pk]: row["batch_id"] for row in tree[parent]}
+        for row in tree[table]:
+            batch_id = batch_of.get(row[fk])
+            if batch_id is None:
+                continue
+            totals = found.setdefault(batch_id, {})
+            for measure, columns in measures.items():
+                totals[measure] = totals.get(measure, 0) + sum(row[column] for column in columns)
+
+    balances = []
+    for batch in sorted(tree["batches"], key=lambda row: (row["order_id"], row["batch_id"])):
+        order = orders[batch["order_id"]]
+        plan = {
+            "batch_id": batch["batch_id"], "order_id": batch["order_id"],
+            "batchNumber": batch["batchNumber"], "completionDate": batch["completionDate"],
+            "orderNumber": order["orderNumber"], "orderWeight": order["orderWeight"],
+            "weightWithCutting": order["weightWithCutting"], "batchCount": counts[batch["order_id"]],
+        }
+        balances.append(batch_balance(plan, found.get(batch["batch_id"])))
+    return balances
+
+
+async def forget_batches(table: str, parent_ids: Iterable[Optional[int]]) -> None:
+    """
+    Сбросить во всех процессах кэш партий, к которым относятся записи
+    table (смены или готовая продукция). parent_ids - их winding_id,
+    printing_id, cutting_id или batch_id, при изменении прежний и новый.
+    """
+    ids = sorted({parent_id for parent_id in parent_ids if parent_id is not None})
+    if not ids:
+        return
+    parent = ARCHIVE_ACTUALS[table][0]
+    if parent != "batches":
+        pk = archive.MODELS[parent]._meta.pk_attr
+        placeholders = ", ".join(f"${index}" for index in range(1, len(ids) + 1))
+        rows = await Tortoise.get_connection("default").execute_query_dict(
+            f'SELECT DISTINCT batch_id FROM "{parent}" WHERE "{pk}" IN ({placeholders})', ids
+        )
+        ids = [row["batch_id"] for row in rows]
+    if ids:
+        await cachebus.publish(*(cachebus.keyed(CACHE_NAME, batch_id) for batch_id in ids))
+
+
+async def get_order_balance(order_id: int) -> Optional[dict]:
+    """
+    Баланс заказа с разбивкой по партиям, для заказа из архива - по
+    архиву; None, если у заказа нет партий.
+    """
+    expire()
+    conn = replicas.read_connection()
+    batches = await load(conn, "WHERE b.order_id = $1", [order_id])
+    archived = False
+    if not batches and not await conn.execute_query_dict(
+            "SELECT 1 FROM orders WHERE order_id = $1", [order_id]
+    ):
+        batches = archived_balances(await run_in_threadpool(archive.load_order_tree, [order_id]))
+        archived = True
+    if not batches:
+        return None
+    return {**order_balance(batches), "archived": archived, "batches": batches}
+
+
+async def get_plant_balance() -> dict:
+    """Баланс по всем заказам рабочих таблиц с партиями и итог по заводу, без архива."""
+    global _closed_complete
+    expire()
+    conn = replicas.read_connection()
+    # Когда закрытые партии уже в кэше, суммы нужны только по открытым
+    batches = await load(conn, "", [], open_only=_closed_complete)
+    _closed_complete = True
+
+    orders, current = [], []
+    for batch in batches:
+        if current and current[-1]["order_id"] != batch["order_id"]:
+            orders.append(order_balance(current))
+            current = []
+        current.append(batch)
+    if current:
+        orders.append(order_balance(current))
+
+    totals = dict.fromkeys(SUMMED, 0)
+    for order in orders:
+        for key in SUMMED:
+            totals[key] += order[key]
+    totals["deviation"] = deviation(totals["finishedWeight"], totals["plannedWeight"])
+    return {"totals": totals, "orders": orders, "archiveIncluded": False}
+
+
+def accepted_values(balance: dict) -> Optional[dict]:
+    """accepted, acceptedPCS и deviation по балансу; None, если продукции ещё нет."""
+    if not balance["finishedQuantity"] and not balance["finishedWeight"]:
+        return None
+    return {
+        "accepted": balance["finishedWeight"],
+        "acceptedPCS": int(balance["finishedQuantity"]),
+        "deviation": balance["deviation"],
+    }
+
+
+async def fill_on_close(batch_id: int, changes: dict) -> None:
+    """
+    Дополнить изменения закрываемой партии accepted, acceptedPCS и
+    deviation из баланса, если они не переданы и не заполнены раньше.
+    """
+    if changes.get("completionDate") is None:
+        return
+    conn = Tortoise.get_connection("default")
+    where = "WHERE b.batch_id = $1"
+    plans = await conn.execute_query_dict(PLAN_SQL.format(where=where), [batch_id])
+    if not plans:
+        return
+    found = await actuals(conn, where, [batch_id])
+    values = accepted_values(batch_balance(plans[0], found.get(batch_id)))
+    if values is None:
+        return
+    stored = {"accepted": plans[0]["accepted"], "acceptedPCS": plans[0]["acceptedPCS"],
+              "deviation": plans[0]["storedDeviation"]}
+    for field, value in values.items():
+        if field not in changes and stored[field] is None:
+            changes[field] = value
+
+
+async def fill_closed(conn: BaseDBAsyncClient, batch_ids: Iterable[int]) -> None:
+    """Заполнить пустые accepted, acceptedPCS и deviation у закрытых партий batch_ids."""
+    batch_ids = list(batch_ids)
+    if not batch_ids:
+        return
+    rows = []
+    for balance in await load(conn, ids_where(batch_ids), batch_ids, cache=False):
+        values = accepted_values(balance)
+        if balance["closed"] and values is not None:
+            rows.append([values["accepted"], values["acceptedPCS"], values["deviation"],
+                         balance["batch_id"]])
+    if not rows:
+        return
+
+    param = "${}" if conn.capabilities.dialect == "postgres" else "?"
+    p1, p2, p3, p4 = (param.format(index) for index in range(1, 5))
+    await conn.execute_many(
+        f'UPDATE batches SET accepted = COALESCE(accepted, {p1}), '
+        f'"acceptedPCS" = COALESCE("acceptedPCS", {p2}), deviation = COALESCE(deviation, {p3}) '
+        f'WHERE batch_id = {p4}',
+        rows
+    )
@@ -0,0 +1,238 @@
+"""
+Сброс кэшей между процессами.
+
+При запуске в несколько процессов (python -m app.serve) у каждого свои
+кэши в памяти, и запись, выполненная в одном процессе, должна сбросить
+их во всех. Кэш регистрирует через subscribe() функцию сброса и таблицы,
+от которых зависит. Роутеры объявляют зависимость invalidates(таблица):
+после успешного изменяющего запроса publish() сразу сбрасывает кэши
+своего процесса и рассылает имена таблиц остальным.
+
+Транспорт выбирается переменной CACHE_BUS:
+- postgres - NOTIFY/LISTEN на канале cache_invalidation; уведомление
+  уходит после коммита, поэтому другие процессы не успеют прочитать
+  старые данные заново. После переподключения слушателя сбрасываются все
+  кэши: пропущенные уведомления не восстановить;
+- unix - датаграммы через Unix-сокеты в каталоге CACHE_BUS_DIR, по
+  сокету на процесс; для SQLite и процессов на одной машине;
+- off - только сброс в своём процессе;
+- auto (по умолчанию) - postgres для Postgres, иначе unix, если ОС
+  поддерживает Unix-сокеты.
+
+Удаления каскадом отдельно не публикуются: подписчик перечисляет и
+вышестоящие таблицы, удаление из которых затрагивает его данные.
+
+Кэш, который сбрасывается по записям, а не целиком, регистрирует через
+subscribe_keys() функцию сброса одной записи; publish(keyed(имя, ключ))
+вызывает её с ключом во всех процессах.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import tempfile
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional
+
+import asyncpg
+from fastapi import Request
+from tortoise import Tortoise
+
+CACHE_BUS = os.getenv("CACHE_BUS", "auto")
+CACHE_BUS_DIR = os.getenv("CACHE_BUS_DIR", os.path.join(tempfile.gettempdir(), "cronck-cache-bus"))
+CHANNEL = "cache_invalidation"
+# Проверка соединения слушателя и пауза перед переподключением
+KEEPALIVE_INTERVAL = 5
+
+READ_METHODS = ("GET", "HEAD")
+KEY_SEPARATOR = ":"
+
+log = logging.getLogger(__name__)
+
+_subscribers: Dict[str, List[Callable[[], None]]] = {}
+_key_subscribers: Dict[str, List[Callable[[str], None]]] = {}
+# Процесс не обрабатывает собственные уведомления: свои кэши он уже сбросил
+_sender = uuid.uuid4().hex
+_bus = None
+
+
+def subscribe(resources: Iterable[str], callback: Callable[[], None]) -> None:
+    for resource in resources:
+        _subscribers.setdefault(resource, []).append(callback)
+
+
+def subscribe_keys(name: str, callback: Callable[[str], None]) -> None:
+    _key_subscribers.setdefault(name, []).append(callback)
+
+
+def keyed(name: str, key) -> str:
+    """Имя для publish(), сбрасывающее запись key кэша name (см. subscribe_keys)."""
+    return f"{name}{KEY_SEPARATOR}{key}"
+
+
+def invalidate_local(resources: Iterable[str]) -> None:
+    callbacks = []
+    for resource in resources:
+        name, _, key = resource.partition(KEY_SEPARATOR)
+        if key:
+            for callback in _key_subscribers.get(name, ()):
+                callback(key)
+            continue
+        for callback in _subscribers.get(resource, ()):
+            if callback not in callbacks:
+                callbacks.append(callback)
+    for callback in callbacks:
+        callback()
+
+
+def invalidate_all() -> None:
+    invalidate_local(list(_subscribers))
+
+
+def received(payload) -> None:
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        log.warning("Malformed cache invalidation message: %r", payload)
+        return
+    if message.get("sender") != _sender:
+        invalidate_local(message.get("resources", []))
+
+
+async def publish(*resources: str) -> None:
+    invalidate_local(resources)
+    if _bus is None:
+        return
+    payload = json.dumps({"sender": _sender, "resources": list(resources)})
+    try:
+        await _bus.publish(payload)
+    except Exception:
+        # Запись уже выполнена; другие процессы догонят после переподключения
+        log.exception("Cache invalidation broadcast failed")
+
+
+def invalidates(*resources: str):
+    """Зависимость роутера: после успешного изменяющего запроса сбросить кэши resources."""
+
+    async def dependency(request: Request):
+        yield
+        if request.method not in READ_METHODS:
+            await publish(*resources)
+
+    return dependency
+
+
+class PostgresBus:
+    def __init__(self):
+        self.connection: Optional[asyncpg.Connection] = None
+
+    async def publish(self, payload: str) -> None:
+        await Tortoise.get_connection("default").execute_query(
+            "SELECT pg_notify($1, $2)", [CHANNEL, payload]
+        )
+
+    async def connect(self) -> asyncpg.Connection:
+        client = Tortoise.get_connection("default")
+        return await asyncpg.connect(
+            host=client.host, port=client.port, user=client.user,
+            password=client.password, database=client.database,
+        )
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                self.connection = await self.connect()
+                await self.connection.add_listener(CHANNEL, lambda *args: received(args[-1]))
+                invalidate_all()
+                while True:
+                    await asyncio.sleep(KEEPALIVE_INTERVAL)
+                    await self.connection.execute("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                log.warning("Cache invalidation listener disconnected: %s", exc)
+            finally:
+                if self.connection is not None:
+                    self.connection.terminate()
+                    self.connection = None
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+
+
+class UnixSocketBus(asyncio.DatagramProtocol):
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self.transport = None
+        self.sender = None
+
+    def datagram_received(self, data, addr) -> None:
+        received(data)
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, local_addr=self.path, family=socket.AF_UNIX
+        )
+        self.sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sender.setblocking(False)
+
+    async def publish(self, payload: str) -> None:
+        data = payload.encode()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".sock") or path == self.path:
+                continue
+            try:
+                self.sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Сокет процесса, завершившегося без close()
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                log.warning("Cache invalidation queue of %s is full", name)
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+        if self.sender is not None:
+            self.sender.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def backend() -> str:
+    if CACHE_BUS != "auto":
+        return CACHE_BUS
+    if Tortoise.get_connection("default").capabilities.dialect == "postgres":
+        return "postgres"
+    return "unix" if hasattr(socket, "AF_UNIX") else "off"
+
+
+async def start() -> Optional[asyncio.Task]:
+    """Подключить процесс к шине; для Postgres возвращает задачу слушателя."""
+    global _bus
+    kind = backend()
+    if kind == "postgres":
+        _bus = PostgresBus()
+        return asyncio.create_task(_bus.listen())
+    if kind == "unix":
+        bus = UnixSocketBus(CACHE_BUS_DIR)
+        await bus.start()
+        _bus = bus
+    elif kind != "off":
+        raise ValueError(f"Unknown CACHE_BUS: {kind}")
+    return None
+
+
+def stop() -> None:
+    global _bus
+    if isinstance(_bus, UnixSocketBus):
+        _bus.close()
+    _bus = None
@@ -0,0 +1,168 @@
+"""
+Сжатие ответов по Accept-Encoding: zstd, brotli или gzip.
+
+Клиент получает лучший из поддерживаемых обеими сторонами способов с
+учётом q-весов; при равных весах предпочтение zstd, затем br, затем gzip.
+brotli и zstandard необязательны: без пакета способ просто не
+предлагается. Готовые ответы короче COMPRESS_MIN_SIZE байт и типы, которые
+не сжимаются (не текст и не JSON), отдаются как есть. Тело длиннее
+COMPRESS_THREAD_SIZE сжимается в пуле потоков, чтобы не держать цикл
+событий. Потоковые ответы (списки, app.responses.list_response) сжимаются
+по частям, и каждая часть сбрасывается клиенту сразу.
+"""
+import os
+import zlib
+from typing import Dict, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_THREAD_SIZE = int(os.getenv("COMPRESS_THREAD_SIZE", "65536"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+def available() -> Tuple[str, ...]:
+    """Поддерживаемые сервером способы в порядке предпочтения."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return tuple(encodings)
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    weights = {}
+    for item in value.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    return weights
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    weights = parse_accept_encoding(accept_encoding)
+    best, best_weight = None, 0.0
+    for encoding in available():
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class Compressor:
+    """Потоковый компрессор: compress для части тела, flush - сброс, finish - конец."""
+
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self.compress = obj.compress
+            self.flush = lambda: obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            self.finish = obj.flush
+        elif encoding == "br":
+            obj = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress = obj.process
+            self.flush = obj.flush
+            self.finish = obj.finish
+        else:
+            obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self.compress = obj.compress
+            self.flush = lambda: obj.flush(zlib.Z_SYNC_FLUSH)
+            self.finish = obj.flush
+
+    def chunk(self, body: bytes, more: bool) -> bytes:
+        return self.compress(body) + (self.flush() if more else self.finish())
+
+
+def compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "")
+    return "content-encoding" not in headers and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI-middleware: сжатие ответов по Accept-Encoding."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start: Optional[dict] = None
+        compressor: Optional[Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if passthrough:
+                return await send(message)
+            if message["type"] == "http.response.start":
+                # Решение принимается по первой части тела
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=list(start["headers"]))
+                if not compressible(headers) or (not more and len(body) < COMPRESS_MIN_SIZE):
+                    passthrough = True
+                    await send(start)
+                    return await send(message)
+
+                compressor = Compressor(encoding)
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more:
+                    del headers["content-length"]
+                else:
+                    body = await compress(compressor, body, more)
+                    headers["content-length"] = str(len(body))
+                    await send({**start, "headers": headers.raw})
+                    return await send({"type": "http.response.body", "body": body})
+                await send({**start, "headers": headers.raw})
+
+            await send({
+                "type": "http.response.body",
+                "body": await compress(compressor, body, more),
+                "more_body": more,
+            })
+
+        await self.app(scope, receive, send_compressed)
+
+
+async def compress(compressor: Compressor, body: bytes, more: bool) -> bytes:
+    if len(body) > COMPRESS_THREAD_SIZE:
+        return await run_in_threadpool(compressor.chunk, body, more)
+    return compressor.chunk(body, more)
@@ -0,0 +1,103 @@
+"""
+Оптимистическая блокировка записей, которые одновременно правят
+несколько планировщиков: партии, намотка и резка.
+
+Каждое изменение строки увеличивает её столбец version. Клиент передаёт
+версию, которую видел, заголовком If-Match (ETag из GET или PUT) или
+полем version в теле. Проверка и запись выполняются одним
+UPDATE ... WHERE id = ? AND version = ?, поэтому блокировки строк не
+держатся: если запись успели изменить, UPDATE ничего не находит и клиент
+получает 409 с текущей версией в ETag. Без версии изменение применяется
+безусловно, как раньше.
+"""
+from typing import Optional, Type
+
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+from tortoise import Tortoise
+from tortoise.models import Model
+
+from app import audit
+
+VERSION_FIELD = "version"
+
+
+def etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def expected_version(if_match: Optional[str], body_version: Optional[int]) -> Optional[int]:
+    """Ожидаемая версия из If-Match или тела запроса; None - без проверки."""
+    version = None
+    if if_match is not None and if_match.strip() != "*":
+        tag = if_match.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        try:
+            version = int(tag.strip('"'))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid If-Match header: {if_match}")
+    if body_version is not None:
+        if version is not None and version != body_version:
+            raise HTTPException(
+                status_code=400,
+                detail=f"If-Match version {version} differs from version {body_version} in body"
+            )
+        version = body_version
+    return version
+
+
+def reject_nulls(model: Type[Model], changes: dict) -> None:
+    """400 на явный null в столбце NOT NULL, иначе база ответит ошибкой целостности."""
+    fields = [field for field, value in changes.items()
+              if value is None and not model._meta.fields_map[field].null]
+    if fields:
+        raise HTTPException(status_code=400, detail=f"Fields cannot be null: {', '.join(fields)}")
+
+
+async def versioned_update(model: Type[Model], record_id: int, changes: dict, version: Optional[int],
+                           schema: Type[BaseModel], label: str) -> ORJSONResponse:
+    """
+    Применить changes к записи record_id одним UPDATE ... RETURNING и
+    вернуть её новое состояние. label - название записи в сообщениях об
+    ошибках ("Batch", "Winding record"). Изменение пишется в журнал
+    (app.audit) с прежними значениями, полученными тем же запросом.
+    """
+    reject_nulls(model, changes)
+    meta = model._meta
+    conn = Tortoise.get_connection("default")
+    postgres = conn.capabilities.dialect == "postgres"
+    values = []
+
+    def param(value) -> str:
+        values.append(value)
+        return f"${len(values)}" if postgres else "?"
+
+    assignments = [f'"{field}" = {param(value)}' for field, value in changes.items()]
+    assignments.append(f'"{VERSION_FIELD}" = "{VERSION_FIELD}" + 1')
+    where = f'"{meta.db_pk_column}" = {param(record_id)}'
+    if version is not None:
+        where += f' AND "{VERSION_FIELD}" = {param(version)}'
+
+    rows, old = await audit.update_rows(conn, meta.db_table, meta.db_pk_column, ", ".join(assignments),
+                                        where, values, list(changes))
+    if not rows:
+        current = await model.filter(pk=record_id).first().values_list(VERSION_FIELD, flat=True)
+        if current is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"{label} with id {record_id} not found"
+            )
+        raise HTTPException(
+            status_code=409,
+            detail=f"{label} {record_id} was modified by someone else: "
+                   f"current version {current}, expected {version}",
+            headers={"ETag": etag(current)}
+        )
+
+    if old:
+        audit.record(meta.db_table, record_id, "update", old[record_id],
+                     {field: rows[0][field] for field in changes})
+    data = schema.model_validate(rows[0]).model_dump()
+    return ORJSONResponse(data, headers={"ETag": etag(data[VERSION_FIELD])})
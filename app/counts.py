@@ -0,0 +1,110 @@
+"""
+Общее число строк списка для постраничного вывода: ?count=true
+добавляет к ответу X-Total-Count и X-Total-Count-Estimated.
+
+Точный COUNT(*) по большим сменным таблицам стоит столько же, сколько
+сам запрос, поэтому в Postgres сначала берётся оценка: для запроса без
+фильтров - reltuples из pg_class (с секциями), для запроса с фильтрами -
+число строк из плана EXPLAIN. Если оценка не больше COUNT_EXACT_LIMIT,
+считается точное число, иначе отдаётся оценка с
+X-Total-Count-Estimated: true. В SQLite оценок нет, число всегда точное.
+
+Результат кэшируется на COUNT_CACHE_TTL секунд по тексту запроса и
+параметрам, так что частые фильтры не пересчитываются на каждой
+странице. Запись в таблицу сбрасывает её счётчики через app.cachebus.
+"""
+import json
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import Query
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.queryset import QuerySet
+
+from app import cachebus
+
+COUNT_EXACT_LIMIT = int(os.getenv("COUNT_EXACT_LIMIT", "10000"))
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "10"))
+COUNT_CACHE_SIZE = 1000
+
+# Сумма по конечным секциям (у обычной таблицы это она сама): у
+# секционированной таблицы reltuples уже включает строки секций
+RELTUPLES_SQL = """
+SELECT SUM(GREATEST(reltuples, 0)) AS estimate, MAX(reltuples) AS analyzed
+FROM pg_class
+WHERE oid IN (SELECT relid FROM pg_partition_tree($1::regclass) WHERE isleaf)
+"""
+
+_cache: Dict[tuple, Tuple[float, int, bool]] = {}
+_subscribed: set = set()
+
+
+def count_requested(
+        count: bool = Query(False, description="Return the total number of rows in X-Total-Count")
+) -> bool:
+    return count
+
+
+def forget(table: str) -> None:
+    for key in [key for key in _cache if key[0] == table]:
+        del _cache[key]
+
+
+def remember(key: tuple, count: int, estimated: bool) -> None:
+    now = time.monotonic()
+    if len(_cache) >= COUNT_CACHE_SIZE:
+        for old in [old for old, entry in _cache.items() if entry[0] <= now]:
+            del _cache[old]
+        while len(_cache) >= COUNT_CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+    _cache[key] = (now + COUNT_CACHE_TTL, count, estimated)
+    if key[0] not in _subscribed:
+        _subscribed.add(key[0])
+        cachebus.subscribe([key[0]], lambda table=key[0]: forget(table))
+
+
+async def estimate(db: BaseDBAsyncClient, table: str, sql: str, params: list,
+                   filtered: bool) -> Optional[int]:
+    """Оценка планировщика Postgres или None, если её нет."""
+    if not filtered:
+        rows = await db.execute_query_dict(RELTUPLES_SQL, [f'"{table}"'])
+        # reltuples = -1 у таблиц, которые ещё не анализировались
+        if not rows or rows[0]["analyzed"] is None or rows[0]["analyzed"] < 0:
+            return None
+        return int(rows[0]["estimate"])
+
+    if not sql.startswith("SELECT COUNT(*) "):
+        return None
+    plan_sql = "EXPLAIN (FORMAT JSON) SELECT 1 " + sql[len("SELECT COUNT(*) "):]
+    _, rows = await db.execute_query(plan_sql, params)
+    plan = rows[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def total_count(query: QuerySet) -> Tuple[int, bool]:
+    """(число строк без учёта offset/limit, оценка ли это)."""
+    count_query = query.count()
+    count_query._choose_db_if_not_chosen()
+    count_query._make_query()
+    sql, params = count_query.query.get_parameterized_sql()
+    db = count_query._db
+    table = query.model._meta.db_table
+
+    key = (table, sql, tuple(params))
+    cached = _cache.get(key)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1], cached[2]
+
+    count, estimated = None, False
+    if db.capabilities.dialect == "postgres":
+        count = await estimate(db, table, sql, params, bool(query._q_objects))
+        estimated = count is not None and count > COUNT_EXACT_LIMIT
+    if not estimated:
+        _, rows = await db.execute_query(sql, params)
+        count = list(dict(rows[0]).values())[0] if rows else 0
+
+    remember(key, count, estimated)
+    return count, estimated
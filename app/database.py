@@ -4,18 +4,27 @@ from tortoise import Tortoise
 from tortoise.contrib.fastapi import register_tortoise
 from fastapi import FastAPI
 
+from app import replicas
+
 DB_URL = os.getenv("DATABASE_URL", "").replace("postgresql://", "postgres://")
 
 if not DB_URL:
     raise ValueError("DATABASE_URL is not set in environment variables!")
 
 
+def tortoise_config() -> dict:
+    config = {
+        "connections": {"default": DB_URL, **replicas.connections()},
+        "apps": {"models": {"models": ["app.models"], "default_connection": "default"}},
+    }
+    if replicas.enabled():
+        config["routers"] = ["app.replicas.ReplicaRouter"]
+    return config
+
+
 async def init_db():
-    await Tortoise.init(
-        db_url=DB_URL,
-        modules={"models": ["app.models"]}
-    )
-    await Tortoise.generate_schemas()
+    # Схема создаётся и обновляется миграциями: python -m app.migrate
+    await Tortoise.init(config=tortoise_config())
 
 
 def register_db(app: FastAPI):
@@ -0,0 +1,293 @@
+"""
+Прогноз даты завершения открытых заказов.
+
+Открытый заказ - тот, у которого есть партия без completionDate. Для
+каждой партии берутся остатки намотки (remainToWind), печати
+(remainToPrint) и резки (remainToCut) и часовая выработка из истории
+смен: экструзия для намотки, флексопечать для печати, пакеты для резки.
+Скорость задания - средняя hourlyProduction его собственных смен (то есть
+назначенных на него линии и работников), без смен - средняя по линии
+задания, без неё - средняя по всему участку.
+
+Задания намотки и резки выстраиваются в очередь на своей линии по
+priority (меньше - раньше), поэтому задание заканчивается, когда линия
+отработает всё, что стоит перед ним. Партия готова, когда пройдены
+намотка, печать и резка и освободилась её очередь на резке; заказ готов
+вместе с последней партией. Часы переводятся в дни по
+FORECAST_HOURS_PER_DAY часов работы линии в сутки.
+
+Риск считается относительно desiredCompletionDate: late - прогноз позже
+желаемой даты, at_risk - запас меньше FORECAST_RISK_DAYS дней, unknown -
+прогноза нет (ни у задания, ни у линии, ни у участка нет истории смен),
+on_track - успевает, no_deadline - дата не задана.
+
+Всё считается NumPy сразу по всем открытым заказам. Суммы выработки по
+заданиям хранятся в памяти и при обновлении дочитываются только по
+сменам с идентификатором больше уже учтённого; правки старых смен
+попадают в прогноз при полном пересчёте раз в FORECAST_FULL_REFRESH
+секунд. Запись в связанные таблицы (через app.cachebus, в том числе из
+других процессов) запускает пересчёт в фоне, а GET /orders/forecast
+отдаёт последний готовый результат.
+"""
+import asyncio
+import logging
+import math
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+import orjson
+from tortoise import Tortoise
+
+from app import cachebus
+
+FORECAST_HOURS_PER_DAY = float(os.getenv("FORECAST_HOURS_PER_DAY", "16"))
+FORECAST_RISK_DAYS = int(os.getenv("FORECAST_RISK_DAYS", "3"))
+FORECAST_FULL_REFRESH = float(os.getenv("FORECAST_FULL_REFRESH", "3600"))
+# Пауза перед пересчётом, чтобы серия записей смен дала один пересчёт
+FORECAST_REFRESH_DELAY = float(os.getenv("FORECAST_REFRESH_DELAY", "1"))
+
+RISKS = ("late", "at_risk", "unknown", "on_track", "no_deadline")
+
+log = logging.getLogger(__name__)
+
+
+class Stage(NamedTuple):
+    job_table: str
+    job_pk: str
+    remain: str
+    shift_table: str
+    shift_pk: str
+    # Линия, на которой выполняется задание; у печати её нет
+    equipment: bool
+
+
+STAGES = {
+    "winding": Stage("winding", "winding_ID", "remainToWind", "extrusion", "extrusion_ID", True),
+    "printing": Stage("printing", "printing_ID", "remainToPrint", "flexa", "flexa_ID", False),
+    "cutting": Stage("cutting", "cutting_ID", "remainToCut", "paketki", "paketki_ID", True),
+}
+
+OPEN_ORDERS_SQL = """
+SELECT o.order_id, o."orderNumber", o.client, o."desiredCompletionDate"
+FROM orders o
+WHERE EXISTS (SELECT 1 FROM batches b WHERE b.order_id = o.order_id AND b."completionDate" IS NULL)
+ORDER BY o.order_id
+"""
+
+
+def open_jobs_sql(stage: Stage) -> str:
+    equipment = "j.equipment_id" if stage.equipment else "0"
+    priority = "j.priority" if stage.equipment else "0"
+    return f"""
+SELECT j."{stage.job_pk}" AS job, j.batch_id, b.order_id, {equipment} AS equipment,
+       {priority} AS priority, j."{stage.remain}" AS remaining
+FROM {stage.job_table} j JOIN batches b ON b.batch_id = j.batch_id
+WHERE b."completionDate" IS NULL AND j."{stage.remain}" > 0
+"""
+
+
+def shift_rates_sql(stage: Stage) -> str:
+    equipment = "j.equipment_id" if stage.equipment else "0"
+    return f"""
+SELECT s.{stage.job_table}_id AS job, MAX({equipment}) AS equipment,
+       SUM(s."hourlyProduction") AS total, COUNT(*) AS shifts, MAX(s."{stage.shift_pk}") AS last
+FROM {stage.shift_table} s JOIN {stage.job_table} j ON j."{stage.job_pk}" = s.{stage.job_table}_id
+WHERE s."{stage.shift_pk}" > $1 AND s."hourlyProduction" > 0
+GROUP BY s.{stage.job_table}_id
+"""
+
+
+class StageRates:
+    """Накопленные суммы часовой выработки по заданиям этапа."""
+
+    def __init__(self):
+        # задание -> [сумма hourlyProduction, число смен, линия]
+        self.jobs: Dict[int, list] = {}
+        self.watermark = 0
+
+    def add(self, rows: List[dict]) -> None:
+        for row in rows:
+            job = self.jobs.setdefault(row["job"], [0.0, 0, row["equipment"]])
+            job[0] += row["total"]
+            job[1] += row["shifts"]
+            job[2] = row["equipment"]
+            self.watermark = max(self.watermark, row["last"])
+
+    def lookup(self, jobs: np.ndarray, equipment: np.ndarray) -> np.ndarray:
+        """Скорость для каждого задания: своя, линии или участка (NaN - истории нет)."""
+        if not self.jobs:
+            return np.full(len(jobs), np.nan)
+        known = np.fromiter(self.jobs, dtype=np.int64, count=len(self.jobs))
+        stats = np.array(list(self.jobs.values()), dtype=np.float64)
+        totals, shifts, lines = stats[:, 0], stats[:, 1], stats[:, 2].astype(np.int64)
+
+        overall = totals.sum() / shifts.sum()
+        line_totals = np.bincount(lines, weights=totals)
+        line_shifts = np.bincount(lines, weights=shifts)
+        line_rate = np.full(max(len(line_totals), int(equipment.max(initial=0)) + 1), overall)
+        has_line = line_shifts > 0
+        line_rate[:len(line_totals)][has_line] = line_totals[has_line] / line_shifts[has_line]
+
+        rates = line_rate[equipment]
+        order = np.argsort(known)
+        position = np.searchsorted(known, jobs, sorter=order).clip(max=len(known) - 1)
+        found = known[order][position] == jobs
+        rates[found] = (totals / shifts)[order][position[found]]
+        return rates
+
+
+def queue_finish(equipment: np.ndarray, priority: np.ndarray, jobs: np.ndarray,
+                 hours: np.ndarray) -> np.ndarray:
+    """Час окончания каждого задания при работе линии по очереди приоритетов."""
+    order = np.lexsort((jobs, priority, equipment))
+    done = np.cumsum(hours[order])
+    lines = equipment[order]
+    starts = np.flatnonzero(np.r_[True, lines[1:] != lines[:-1]])
+    # Вычесть часы заданий предыдущих линий
+    offset = np.repeat(np.r_[0.0, done][starts], np.diff(np.r_[starts, len(order)]))
+    finish = np.empty_like(hours)
+    finish[order] = done - offset
+    return finish
+
+
+class Forecaster:
+    def __init__(self):
+        self.rates = {name: StageRates() for name in STAGES}
+        self.full_at = 0.0
+        self.result: Optional[List[dict]] = None
+        self.body: Optional[bytes] = None
+        self.computed_at: Optional[datetime] = None
+        self.lock = asyncio.Lock()
+        self.dirty = False
+        self.task: Optional[asyncio.Task] = None
+
+    async def load_rates(self, conn) -> None:
+        if time.monotonic() - self.full_at > FORECAST_FULL_REFRESH:
+            self.rates = {name: StageRates() for name in STAGES}
+            self.full_at = time.monotonic()
+        for name, stage in STAGES.items():
+            rates = self.rates[name]
+            rates.add(await conn.execute_query_dict(shift_rates_sql(stage), [rates.watermark]))
+
+    async def stage_hours(self, conn, name: str) -> Dict[str, np.ndarray]:
+        rows = await conn.execute_query_dict(open_jobs_sql(STAGES[name]))
+        columns = {
+            key: np.array([row[key] for row in rows], dtype=np.int64)
+            for key in ("job", "batch_id", "order_id", "equipment", "priority")
+        }
+        remaining = np.array([row["remaining"] for row in rows], dtype=np.float64)
+        rates = self.rates[name].lookup(columns["job"], columns["equipment"])
+        columns["hours"] = remaining / rates
+        if STAGES[name].equipment:
+            columns["finish"] = queue_finish(columns["equipment"], columns["priority"],
+                                             columns["job"], columns["hours"])
+        return columns
+
+    async def compute(self) -> List[dict]:
+        conn = Tortoise.get_connection("default")
+        await self.load_rates(conn)
+        orders = await conn.execute_query_dict(OPEN_ORDERS_SQL)
+        stages = {name: await self.stage_hours(conn, name) for name in STAGES}
+
+        batches = np.unique(np.concatenate([stage["batch_id"] for stage in stages.values()]))
+        batch_order = np.zeros(len(batches), dtype=np.int64)
+        wind_end, print_hours, cut_hours, cut_end = (np.zeros(len(batches)) for _ in range(4))
+        for name, stage in stages.items():
+            index = np.searchsorted(batches, stage["batch_id"])
+            batch_order[index] = stage["order_id"]
+            if name == "winding":
+                np.maximum.at(wind_end, index, stage["finish"])
+            elif name == "printing":
+                np.add.at(print_hours, index, stage["hours"])
+            else:
+                np.add.at(cut_hours, index, stage["hours"])
+                np.maximum.at(cut_end, index, stage["finish"])
+        # Резка начинается после намотки и печати, но ждёт и своей очереди на линии
+        batch_hours = np.maximum(wind_end + print_hours + cut_hours, cut_end)
+
+        # Заказы упорядочены по order_id; партии, чей заказ закрылся между
+        # запросами, пропускаются
+        order_ids = np.array([row["order_id"] for row in orders], dtype=np.int64)
+        order_hours = np.zeros(len(orders))
+        if len(orders):
+            index = np.searchsorted(order_ids, batch_order).clip(max=len(orders) - 1)
+            present = order_ids[index] == batch_order
+            np.maximum.at(order_hours, index[present], batch_hours[present])
+
+        today = date.today()
+        days = np.ceil(order_hours / FORECAST_HOURS_PER_DAY)
+        result = []
+        for row, hours, day_count in zip(orders, order_hours.tolist(), days.tolist()):
+            desired = row["desiredCompletionDate"]
+            if isinstance(desired, str):
+                # SQLite возвращает даты строками
+                desired = date.fromisoformat(desired)
+            if math.isnan(hours):
+                # Нет истории смен, по которой считать скорость
+                projected, slack, risk = None, None, "no_deadline" if desired is None else "unknown"
+            else:
+                projected = today + timedelta(days=int(day_count))
+                slack = (desired - projected).days if desired is not None else None
+                if slack is None:
+                    risk = "no_deadline"
+                elif slack < 0:
+                    risk = "late"
+                elif slack < FORECAST_RISK_DAYS:
+                    risk = "at_risk"
+                else:
+                    risk = "on_track"
+            result.append({
+                "order_id": row["order_id"],
+                "orderNumber": row["orderNumber"],
+                "client": row["client"],
+                "desiredCompletionDate": desired,
+                "projectedCompletionDate": projected,
+                "remainingHours": None if math.isnan(hours) else round(hours, 2),
+                "slackDays": slack,
+                "risk": risk,
+            })
+        result.sort(key=lambda item: (RISKS.index(item["risk"]),
+                                      item["slackDays"] if item["slackDays"] is not None else 0,
+                                      item["order_id"]))
+        return result
+
+    async def refresh(self) -> None:
+        async with self.lock:
+            self.dirty = False
+            result = await self.compute()
+            self.result = result
+            self.body = orjson.dumps(result)
+            self.computed_at = datetime.now(timezone.utc)
+
+    async def refresh_later(self) -> None:
+        while self.dirty:
+            await asyncio.sleep(FORECAST_REFRESH_DELAY)
+            try:
+                await self.refresh()
+            except Exception:
+                log.exception("Order forecast refresh failed")
+                return
+
+    def invalidate(self) -> None:
+        self.dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self.task is None or self.task.done():
+            self.task = loop.create_task(self.refresh_later())
+
+    async def current(self) -> List[dict]:
+        if self.result is None:
+            await self.refresh()
+        return self.result
+
+
+forecaster = Forecaster()
+cachebus.subscribe(
+    ("orders", "batches", "winding", "cutting", "printing", "extrusion", "paketki", "flexa"),
+    forecaster.invalidate
+)
@@ -0,0 +1,254 @@
+"""
+Массовая загрузка заказов: потоковый импорт из CSV и XLSX и upsert по
+orderNumber для интеграций.
+
+Файл читается пачками по IMPORT_CHUNK строк: разбор и проверка схемой
+OrderCreate идут в пуле потоков, чтобы не держать цикл событий, а в
+памяти одновременно находится только текущая пачка и номера уже
+встреченных заказов. Все пачки пишутся в одной транзакции: через COPY в
+Postgres и bulk_create в остальных базах.
+"""
+import csv
+import io
+import os
+import zipfile
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from app.models import Orders
+from app.schemas import OrderCreate
+
+IMPORT_CHUNK = int(os.getenv("IMPORT_CHUNK", "2000"))
+# Отчёт об ошибках ограничен, счётчик ведётся по всем строкам
+MAX_REPORTED_ERRORS = 1000
+
+COLUMNS = list(OrderCreate.model_fields)
+# Заказов в одном INSERT ... ON CONFLICT: не больше 1000 и не больше
+# ~32k параметров на запрос
+UPSERT_CHUNK = min(1000, 32000 // len(COLUMNS))
+REQUIRED = [name for name, field in OrderCreate.model_fields.items() if field.is_required()]
+
+
+class ImportFormatError(ValueError):
+    """Файл нельзя разобрать целиком: неизвестный формат или нет колонок."""
+
+
+# Ошибки, после которых файл дальше не читается
+READ_ERRORS = (ImportFormatError, UnicodeDecodeError, csv.Error, zipfile.BadZipFile)
+
+
+def csv_rows(file: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    header = text.readline()
+    try:
+        # Excel в русской локали сохраняет CSV через точку с запятой
+        dialect = csv.Sniffer().sniff(header, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    columns = next(csv.reader([header], dialect))
+    check_columns(columns)
+    for line, values in enumerate(csv.reader(text, dialect), start=2):
+        if any(values):
+            yield line, dict(zip(columns, values))
+
+
+def xlsx_rows(file: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFormatError("XLSX import requires openpyxl")
+
+    # read_only читает лист потоково, не загружая книгу целиком
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = [str(value).strip() if value is not None else "" for value in next(rows, ())]
+        check_columns(columns)
+        for line, values in enumerate(rows, start=2):
+            if any(value is not None and value != "" for value in values):
+                yield line, dict(zip(columns, values))
+    finally:
+        workbook.close()
+
+
+def check_columns(columns: List[str]) -> None:
+    missing = [name for name in REQUIRED if name not in columns]
+    if missing:
+        raise ImportFormatError(f"Missing columns: {', '.join(missing)}")
+
+
+def open_rows(filename: str, file: BinaryIO) -> Iterator[Tuple[int, dict]]:
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv":
+        return csv_rows(file)
+    if extension == ".xlsx":
+        return xlsx_rows(file)
+    raise ImportFormatError(f"Unsupported file type: {filename}")
+
+
+def clean(row: dict) -> dict:
+    """Пустые ячейки - отсутствующие значения, лишние колонки отбрасываются."""
+    return {
+        name: None if isinstance(value, str) and not value.strip() else value
+        for name, value in row.items() if name in COLUMNS
+    }
+
+
+def validate_chunk(rows: Iterator[Tuple[int, dict]], seen: set) -> Tuple[List[tuple], List[dict], int]:
+    """
+    Следующая пачка: (строки для вставки, ошибки, число прочитанных строк).
+    Вызывается в пуле потоков.
+    """
+    valid, errors, count = [], [], 0
+    for line, row in rows:
+        count += 1
+        try:
+            order = OrderCreate.model_validate(clean(row))
+        except ValidationError as exc:
+            errors.append({"row": line, "errors": [
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in exc.errors()
+            ]})
+        else:
+            if order.orderNumber in seen:
+                errors.append({"row": line, "errors": [
+                    f"orderNumber: duplicate {order.orderNumber} in file"
+                ]})
+            else:
+                seen.add(order.orderNumber)
+                valid.append((line, order))
+        if count == IMPORT_CHUNK:
+            break
+    return valid, errors, count
+
+
+async def write_chunk(conn: BaseDBAsyncClient, orders: List[OrderCreate]) -> None:
+    if conn.capabilities.dialect == "postgres":
+        async with conn.acquire_connection() as raw:
+            await raw.copy_records_to_table(
+                Orders._meta.db_table, columns=COLUMNS,
+                records=[tuple(getattr(order, name) for name in COLUMNS) for order in orders]
+            )
+    else:
+        await Orders.bulk_create(
+            [Orders(**order.model_dump()) for order in orders], using_db=conn
+        )
+
+
+async def import_orders(conn: BaseDBAsyncClient, filename: str, file: BinaryIO,
+                        partial: bool = False) -> Dict:
+    """
+    Загрузить заказы из файла в транзакции conn. Без partial при первой же
+    ошибке строки перестают записываться, но файл дочитывается до конца,
+    чтобы отчёт был полным; откат транзакции - на вызывающей стороне.
+    """
+    rows = await run_in_threadpool(open_rows, filename, file)
+    seen: set = set()
+    report = {"rows": 0, "imported": 0, "error_count": 0, "errors": []}
+
+    while True:
+        valid, errors, count = await run_in_threadpool(validate_chunk, rows, seen)
+        if not count:
+            break
+        report["rows"] += count
+
+        if valid:
+            numbers = [order.orderNumber for _, order in valid]
+            existing = set(await Orders.filter(orderNumber__in=numbers)
+                           .using_db(conn).values_list("orderNumber", flat=True))
+            for line, order in valid:
+                if order.orderNumber in existing:
+                    errors.append({"row": line, "errors": [
+                        f"orderNumber: order {order.orderNumber} already exists"
+                    ]})
+            valid = [(line, order) for line, order in valid if order.orderNumber not in existing]
+
+        report["error_count"] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(report["errors"])
+        report["errors"].extend(sorted(errors, key=lambda error: error["row"])[:room])
+
+        if valid and (partial or not report["error_count"]):
+            await write_chunk(conn, [order for _, order in valid])
+            report["imported"] += len(valid)
+
+    if report["error_count"] and not partial:
+        report["imported"] = 0
+    return report
+
+
+def upsert_sql(dialect: str, rows: int) -> str:
+    """
+    Один оператор на пачку. Строка с тем же orderNumber обновляется только
+    если что-то изменилось, поэтому неизменённые заказы не попадают в
+    RETURNING. В Postgres вставку от обновления отличает xmax = 0.
+    RETURNING отдаёт строки целиком - новые значения для журнала изменений.
+    """
+    table = Orders._meta.db_table
+    columns = ", ".join(f'"{name}"' for name in COLUMNS)
+    if dialect == "postgres":
+        values = ", ".join(
+            "(" + ", ".join(f"${row * len(COLUMNS) + index + 1}" for index in range(len(COLUMNS))) + ")"
+            for row in range(rows)
+        )
+    else:
+        # Именованные $N SQLite разбирает за квадратичное время от их числа
+        values = ", ".join("(" + ", ".join("?" for _ in COLUMNS) + ")" for _ in range(rows))
+    updated = [name for name in COLUMNS if name != "orderNumber"]
+    assignments = ", ".join(f'"{name}" = EXCLUDED."{name}"' for name in updated)
+    distinct = "IS DISTINCT FROM" if dialect == "postgres" else "IS NOT"
+    changed = " OR ".join(f'"{table}"."{name}" {distinct} EXCLUDED."{name}"' for name in updated)
+    returning = "*, xmax = 0 AS inserted" if dialect == "postgres" else "*"
+    return (
+        f'INSERT INTO "{table}" ({columns}) VALUES {values} '
+        f'ON CONFLICT ("orderNumber") DO UPDATE SET {assignments} WHERE {changed} '
+        f"RETURNING {returning}"
+    )
+
+
+async def upsert_orders(conn: BaseDBAsyncClient, orders: List[OrderCreate],
+                        updates: Optional[List[tuple]] = None) -> Dict[str, int]:
+    """
+    Вставить или обновить заказы по orderNumber в транзакции conn. В
+    updates добавляются (order_id, прежние значения, новые значения)
+    обновлённых заказов - для журнала изменений после фиксации транзакции.
+    """
+    dialect = conn.capabilities.dialect
+    table = Orders._meta.db_table
+    columns = ", ".join(f'"{name}"' for name in COLUMNS)
+    result = {"inserted": 0, "updated": 0, "unchanged": 0}
+    for start in range(0, len(orders), UPSERT_CHUNK):
+        chunk = orders[start:start + UPSERT_CHUNK]
+        numbers = [order.orderNumber for order in chunk]
+        # Прежние значения существующих заказов. В Postgres строки блокируются
+        # до конца транзакции, SQLite и так сериализует запись
+        if dialect == "postgres":
+            where, lock = '"orderNumber" = ANY($1)', " FOR UPDATE"
+            params = [numbers]
+        else:
+            where, lock = f'"orderNumber" IN ({", ".join("?" for _ in numbers)})', ""
+            params = numbers
+        existing = {row["orderNumber"]: row for row in await conn.execute_query_dict(
+            f'SELECT order_id, {columns} FROM "{table}" WHERE {where}{lock}', params
+        )}
+
+        values = [getattr(order, name) for order in chunk for name in COLUMNS]
+        rows = await conn.execute_query_dict(upsert_sql(dialect, len(chunk)), values)
+        if dialect == "postgres":
+            inserted = sum(1 for row in rows if row["inserted"])
+        else:
+            # Без xmax вставки - номера, которых не было до запроса
+            inserted = sum(1 for row in rows if row["orderNumber"] not in existing)
+
+        if updates is not None:
+            for row in rows:
+                before = existing.get(row["orderNumber"])
+                if before is not None:
+                    updates.append((row["order_id"], {name: before[name] for name in COLUMNS},
+                                    {name: row[name] for name in COLUMNS}))
+        result["inserted"] += inserted
+        result["updated"] += len(rows) - inserted
+        result["unchanged"] += len(chunk) - len(rows)
+    return result
@@ -1,23 +1,65 @@
-from click.core import batch
+import asyncio
+
 from fastapi import FastAPI
+from tortoise import Tortoise
+
+from app import cachebus, replicas
+from app.admission import AdmissionMiddleware
+from app.audit import close_audit, write_audit
+from app.compression import CompressionMiddleware
 from app.database import init_db
+from app.forecast import forecaster
+from app.metrics import MetricsMiddleware, instrument_db
+from app.partitioning import maintain_partitions
 from app.routes import (orders, batches, equipment, workers,
                         winding, extrusion, cutting, paketki,
-                        printing, flexa, fproducts
+                        printing, flexa, fproducts, trace, metrics, debug,
+                        balance, sync, audit
                         )
 
 app = FastAPI(title="Cronck API")
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(replicas.ReplicaMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+background_tasks = set()
 
 
 # taskkill /PID 10416 /F
 # netstat -ano | findstr :8080
 # uvicorn app.main:app --host 127.0.0.1 --port 8080 --reload
+# python -m app.serve --workers 4
 # http://127.0.0.1:8080/docs#/
 # pip install -r requirements.txt
+# python -m app.migrate
+# python -m app.norms (раз в сутки)
 
 @app.on_event("startup")
 async def startup():
     await init_db()
+    instrument_db(type(Tortoise.get_connection("default")))
+    listener = await cachebus.start()
+    if listener is not None:
+        background_tasks.add(listener)
+    if replicas.enabled():
+        background_tasks.add(asyncio.create_task(replicas.monitor()))
+    # Первый прогноз заказов считается в фоне, не задерживая запуск
+    forecaster.invalidate()
+    background_tasks.add(forecaster.task)
+    background_tasks.add(asyncio.create_task(write_audit()))
+    # Будущие секции сменных таблиц - в фоне сразу и затем раз в сутки
+    background_tasks.add(asyncio.create_task(maintain_partitions()))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in background_tasks:
+        task.cancel()
+    cachebus.stop()
+    # Журнал изменений дописывается до закрытия соединений
+    await close_audit()
+    await Tortoise.close_connections()
 
 
 app.include_router(orders.router)
@@ -31,6 +73,12 @@ app.include_router(paketki.router)
 app.include_router(printing.router)
 app.include_router(flexa.router)
 app.include_router(fproducts.router)
+app.include_router(trace.router)
+app.include_router(balance.router)
+app.include_router(sync.router)
+app.include_router(audit.router)
+app.include_router(metrics.router)
+app.include_router(debug.router)
 
 
 
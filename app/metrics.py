@@ -0,0 +1,152 @@
+"""
+Метрики Prometheus по запросам к API и к базе.
+
+MetricsMiddleware пишет гистограмму длительности по шаблону маршрута
+(/orders/{order_id}, а не /orders/17) и добавляет к ответу заголовки
+X-DB-Queries и X-DB-Time-Ms. instrument_db оборачивает execute_* клиента
+Tortoise и считает запросы текущего HTTP-запроса; по гистограмме
+db_queries_per_request видно маршруты с N+1. Всё отдаётся в /metrics.
+Медленные запросы дополнительно уходят в app.slowlog.
+"""
+import contextvars
+import time
+from typing import Optional
+
+from prometheus_client import Counter, Histogram
+
+from app import slowlog
+
+DB_METHODS = ("execute_query", "execute_query_dict", "execute_insert", "execute_many", "execute_script")
+
+# Запросы вне маршрутов (404, служебные) сводятся в одну метку
+UNMATCHED = "<unmatched>"
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+REQUEST_QUERIES = Histogram(
+    "db_queries_per_request", "Database queries issued while serving one request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+REQUEST_DB_TIME = Histogram(
+    "db_time_per_request_seconds", "Time spent in the database while serving one request",
+    ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "Latency of single database calls",
+    ["route", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+QUERY_ERRORS = Counter("db_query_errors_total", "Failed database calls", ["route", "operation"])
+
+
+class RequestStats:
+    """Счётчики одного HTTP-запроса; маршрут известен только после роутинга."""
+
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_template(self.scope) if self.scope is not None else UNMATCHED
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = \
+    contextvars.ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def route_template(scope: dict) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", UNMATCHED)
+
+
+def observe_query(operation: str, args: tuple, seconds: float, failed: bool = False) -> None:
+    stats = _request_stats.get()
+    route = stats.route if stats is not None else "<background>"
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
+    QUERY_LATENCY.labels(route, operation).observe(seconds)
+    if failed:
+        QUERY_ERRORS.labels(route, operation).inc()
+    slowlog.record(operation, args, seconds, route)
+
+
+def _client_classes(client_class: type) -> list:
+    classes = [client_class]
+    for cls in classes:
+        classes.extend(sub for sub in cls.__subclasses__() if sub not in classes)
+    return classes
+
+
+def instrument_db(client_class: type) -> None:
+    """
+    Обернуть execute_* у класса клиента и всех его подклассов (транзакции
+    Tortoise - отдельные подклассы). Повторный вызов ничего не меняет.
+    """
+    for cls in _client_classes(client_class):
+        for name in DB_METHODS:
+            original = cls.__dict__.get(name)
+            if original is None or getattr(original, "_instrumented", False):
+                continue
+
+            async def wrapper(self, *args, _original=original, _name=name, **kwargs):
+                started = time.perf_counter()
+                failed = True
+                try:
+                    result = await _original(self, *args, **kwargs)
+                    failed = False
+                    return result
+                finally:
+                    observe_query(_name, args, time.perf_counter() - started, failed)
+
+            wrapper._instrumented = True
+            setattr(cls, name, wrapper)
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: латентность по маршрутам и заголовки со статистикой базы."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(scope)
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_stats(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Для потоковых ответов учитываются запросы до первого байта
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-db-queries", str(stats.queries).encode()),
+                    (b"x-db-time-ms", f"{stats.db_seconds * 1000:.3f}".encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _request_stats.reset(token)
+            method, route = scope["method"], stats.route
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(time.perf_counter() - started)
+            REQUEST_QUERIES.labels(method, route).observe(stats.queries)
+            REQUEST_DB_TIME.labels(method, route).observe(stats.db_seconds)
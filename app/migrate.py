@@ -0,0 +1,112 @@
+"""
+Версионные миграции схемы.
+
+    python -m app.migrate            # применить новые миграции
+    python -m app.migrate status     # показать применённые и ожидающие
+
+Миграции лежат в app/migrations/NNNN_name.py и объявляют
+async def upgrade(conn). Каждая применяется в своей транзакции вместе с
+записью в schema_migrations, так что упавшая миграция не оставляет
+половины изменений. В Postgres одновременные запуски (несколько
+экземпляров при выкладке) сериализуются advisory-блокировкой.
+
+Приложение схему не трогает: команду запускают перед стартом новой версии.
+После миграций создаются секции на ближайшие месяцы; дальше их раз в
+сутки создаёт фоновая задача приложения (app.partitioning).
+"""
+import argparse
+import importlib
+import os
+import re
+from typing import List, Tuple
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+from app.partitioning import ensure_partitions
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+# Произвольный ключ advisory-блокировки миграций
+LOCK_KEY = 7_202_611
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version VARCHAR(4) NOT NULL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def available() -> List[Tuple[str, str]]:
+    """Миграции из app/migrations по возрастанию версии: [(version, name)]."""
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((match.group(1), match.group(2)))
+    return sorted(migrations)
+
+
+async def applied(conn: BaseDBAsyncClient) -> List[str]:
+    await conn.execute_script(CREATE_TABLE_SQL)
+    rows = await conn.execute_query_dict("SELECT version FROM schema_migrations")
+    return sorted(row["version"] for row in rows)
+
+
+async def pending() -> List[Tuple[str, str]]:
+    done = set(await applied(Tortoise.get_connection("default")))
+    return [migration for migration in available() if migration[0] not in done]
+
+
+async def apply(version: str, name: str) -> bool:
+    """Применить одну миграцию; False, если её уже применил другой процесс."""
+    module = importlib.import_module(f"app.migrations.{version}_{name}")
+    async with in_transaction() as tx:
+        if tx.capabilities.dialect == "postgres":
+            await tx.execute_query("SELECT pg_advisory_xact_lock($1)", [LOCK_KEY])
+        if await tx.execute_query_dict(
+            "SELECT 1 FROM schema_migrations WHERE version = $1", [version]
+        ):
+            return False
+        await module.upgrade(tx)
+        await tx.execute_query(
+            "INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", [version, name]
+        )
+    return True
+
+
+async def upgrade() -> List[str]:
+    """Применить все ожидающие миграции, вернуть их версии."""
+    done = []
+    for version, name in await pending():
+        if await apply(version, name):
+            done.append(version)
+    await ensure_partitions()
+    return done
+
+
+async def main() -> None:
+    from app.database import init_db
+
+    parser = argparse.ArgumentParser(description="Versioned schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=("upgrade", "status"))
+    args = parser.parse_args()
+
+    await init_db()
+    if args.command == "status":
+        done = set(await applied(Tortoise.get_connection("default")))
+        for version, name in available():
+            print(f"{version} {name:<32} {'applied' if version in done else 'pending'}")
+        return
+
+    versions = await upgrade()
+    print(f"Applied {len(versions)} migration(s){': ' + ', '.join(versions) if versions else ''}")
+
+
+if __name__ == "__main__":
+    from tortoise import run_async
+
+    run_async(main())
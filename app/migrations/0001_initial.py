@@ -0,0 +1,314 @@
+"""
+Исходная схема: таблицы моделей с индексами внешних ключей.
+
+Все операторы безопасны для баз, созданных ещё через generate_schemas:
+существующие таблицы и индексы пропускаются, недостающие индексы
+досоздаются.
+"""
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+POSTGRES = """
+CREATE TABLE IF NOT EXISTS "equipment" (
+    "equipment_ID" SERIAL NOT NULL PRIMARY KEY,
+    "description" TEXT,
+    "name" VARCHAR(255) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "orders" (
+    "order_id" SERIAL NOT NULL PRIMARY KEY,
+    "client" VARCHAR(255) NOT NULL,
+    "orderStatus" VARCHAR(100) NOT NULL,
+    "orderNumber" VARCHAR(100) NOT NULL UNIQUE,
+    "productName" VARCHAR(255) NOT NULL,
+    "sleeveName" VARCHAR(255) NOT NULL,
+    "orderDate" DATE NOT NULL,
+    "desiredCompletionDate" DATE,
+    "quantity" INT NOT NULL,
+    "orderWeight" DOUBLE PRECISION NOT NULL,
+    "productType" VARCHAR(100) NOT NULL,
+    "pack" INT NOT NULL,
+    "packaging" INT NOT NULL,
+    "comments" TEXT,
+    "width" DOUBLE PRECISION NOT NULL,
+    "length" DOUBLE PRECISION NOT NULL,
+    "thickness" DOUBLE PRECISION NOT NULL,
+    "widthSquared" DOUBLE PRECISION NOT NULL,
+    "lengthSquared" DOUBLE PRECISION NOT NULL,
+    "thicknessSquared" DOUBLE PRECISION NOT NULL,
+    "density" DOUBLE PRECISION NOT NULL,
+    "weightWithoutCutting" DOUBLE PRECISION NOT NULL,
+    "weightWithCutting" DOUBLE PRECISION NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "batches" (
+    "batch_id" SERIAL NOT NULL PRIMARY KEY,
+    "batchNumber" VARCHAR(100) NOT NULL,
+    "batchStatus" VARCHAR(100) NOT NULL,
+    "labelName" VARCHAR(255),
+    "completionDate" DATE,
+    "shipment" BOOL NOT NULL DEFAULT False,
+    "print" VARCHAR(255),
+    "accepted" DOUBLE PRECISION,
+    "acceptedPCS" INT,
+    "deviation" DOUBLE PRECISION,
+    "order_id" INT NOT NULL REFERENCES "orders" ("order_id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_batches_order_i_387918" ON "batches" ("order_id");
+CREATE TABLE IF NOT EXISTS "cutting" (
+    "cutting_ID" SERIAL NOT NULL PRIMARY KEY,
+    "priority" INT NOT NULL,
+    "status" VARCHAR(100) NOT NULL,
+    "cutting" DOUBLE PRECISION NOT NULL,
+    "cuttingPSC" INT NOT NULL,
+    "remainToCut" DOUBLE PRECISION NOT NULL,
+    "remainToCutPSC" INT NOT NULL,
+    "days" DOUBLE PRECISION NOT NULL,
+    "norm" DOUBLE PRECISION NOT NULL,
+    "startDate" DATE,
+    "PSCCheck" INT,
+    "batch_id" INT NOT NULL REFERENCES "batches" ("batch_id") ON DELETE CASCADE,
+    "equipment_id" INT NOT NULL REFERENCES "equipment" ("equipment_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_cutting_batch_i_401ec3" ON "cutting" ("batch_id");
+CREATE INDEX IF NOT EXISTS "idx_cutting_equipme_943c0b" ON "cutting" ("equipment_id");
+CREATE TABLE IF NOT EXISTS "printing" (
+    "printing_ID" SERIAL NOT NULL PRIMARY KEY,
+    "printing" DOUBLE PRECISION NOT NULL,
+    "remainToPrint" DOUBLE PRECISION NOT NULL,
+    "batch_id" INT NOT NULL REFERENCES "batches" ("batch_id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_printing_batch_i_7d4ba2" ON "printing" ("batch_id");
+CREATE TABLE IF NOT EXISTS "winding" (
+    "winding_ID" SERIAL NOT NULL PRIMARY KEY,
+    "priority" INT NOT NULL,
+    "status" VARCHAR(100) NOT NULL,
+    "cuttingDate" DATE,
+    "norm" DOUBLE PRECISION NOT NULL,
+    "days" DOUBLE PRECISION NOT NULL,
+    "winding" DOUBLE PRECISION NOT NULL,
+    "requiredToWind" DOUBLE PRECISION NOT NULL,
+    "remainToWind" DOUBLE PRECISION NOT NULL,
+    "weightCheck" DOUBLE PRECISION,
+    "batch_id" INT NOT NULL REFERENCES "batches" ("batch_id") ON DELETE CASCADE,
+    "equipment_id" INT NOT NULL REFERENCES "equipment" ("equipment_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_winding_batch_i_d243f8" ON "winding" ("batch_id");
+CREATE INDEX IF NOT EXISTS "idx_winding_equipme_a33286" ON "winding" ("equipment_id");
+CREATE TABLE IF NOT EXISTS "workers" (
+    "worker_ID" SERIAL NOT NULL PRIMARY KEY,
+    "FIO" VARCHAR(255) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "extrusion" (
+    "extrusion_ID" SERIAL NOT NULL PRIMARY KEY,
+    "date" DATE NOT NULL,
+    "equipmentOperatinTime" DOUBLE PRECISION NOT NULL,
+    "shiftNorm" DOUBLE PRECISION NOT NULL,
+    "totalShift" DOUBLE PRECISION NOT NULL,
+    "whiteDefective" DOUBLE PRECISION NOT NULL,
+    "transparentDefective" DOUBLE PRECISION NOT NULL,
+    "coloredDefective" DOUBLE PRECISION NOT NULL,
+    "hourlyProduction" DOUBLE PRECISION NOT NULL,
+    "seasonal" DOUBLE PRECISION NOT NULL,
+    "winding_id" INT NOT NULL REFERENCES "winding" ("winding_ID") ON DELETE CASCADE,
+    "worker_id" INT NOT NULL REFERENCES "workers" ("worker_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_extrusion_winding_bee606" ON "extrusion" ("winding_id");
+CREATE INDEX IF NOT EXISTS "idx_extrusion_worker__726f51" ON "extrusion" ("worker_id");
+CREATE TABLE IF NOT EXISTS "finished_products" (
+    "finishedProducts_ID" SERIAL NOT NULL PRIMARY KEY,
+    "date" DATE NOT NULL,
+    "quantity" INT NOT NULL,
+    "weight" DOUBLE PRECISION NOT NULL,
+    "batch_id" INT NOT NULL REFERENCES "batches" ("batch_id") ON DELETE CASCADE,
+    "worker_id" INT NOT NULL REFERENCES "workers" ("worker_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_finished_pr_batch_i_385ee7" ON "finished_products" ("batch_id");
+CREATE INDEX IF NOT EXISTS "idx_finished_pr_worker__c0a2cd" ON "finished_products" ("worker_id");
+CREATE TABLE IF NOT EXISTS "flexa" (
+    "flexa_ID" SERIAL NOT NULL PRIMARY KEY,
+    "date" DATE NOT NULL,
+    "operatinTime" DOUBLE PRECISION NOT NULL,
+    "shiftNorm" DOUBLE PRECISION NOT NULL,
+    "totalShift" DOUBLE PRECISION NOT NULL,
+    "whiteDefective" DOUBLE PRECISION NOT NULL,
+    "printDefective" DOUBLE PRECISION NOT NULL,
+    "coloredDefective" DOUBLE PRECISION NOT NULL,
+    "hourlyProduction" DOUBLE PRECISION NOT NULL,
+    "remark" TEXT,
+    "printing_id" INT NOT NULL REFERENCES "printing" ("printing_ID") ON DELETE CASCADE,
+    "worker_id" INT NOT NULL REFERENCES "workers" ("worker_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_flexa_printin_51407b" ON "flexa" ("printing_id");
+CREATE INDEX IF NOT EXISTS "idx_flexa_worker__43bf42" ON "flexa" ("worker_id");
+CREATE TABLE IF NOT EXISTS "paketki" (
+    "paketki_ID" SERIAL NOT NULL PRIMARY KEY,
+    "date" DATE NOT NULL,
+    "operatinTime" DOUBLE PRECISION NOT NULL,
+    "shiftNorm" DOUBLE PRECISION NOT NULL,
+    "totalShift" DOUBLE PRECISION NOT NULL,
+    "whiteDefective" DOUBLE PRECISION NOT NULL,
+    "transparentDefective" DOUBLE PRECISION NOT NULL,
+    "coloredDefective" DOUBLE PRECISION NOT NULL,
+    "hourlyProduction" DOUBLE PRECISION NOT NULL,
+    "seasonal" DOUBLE PRECISION NOT NULL,
+    "cutting_id" INT NOT NULL REFERENCES "cutting" ("cutting_ID") ON DELETE CASCADE,
+    "extrusion_id" INT NOT NULL,
+    "worker_id" INT NOT NULL REFERENCES "workers" ("worker_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_paketki_cutting_14697f" ON "paketki" ("cutting_id");
+CREATE INDEX IF NOT EXISTS "idx_paketki_extrusi_0dc49b" ON "paketki" ("extrusion_id");
+CREATE INDEX IF NOT EXISTS "idx_paketki_worker__b72917" ON "paketki" ("worker_id");
+"""
+
+SQLITE = """
+CREATE TABLE IF NOT EXISTS "equipment" (
+    "equipment_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "description" TEXT,
+    "name" VARCHAR(255) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "orders" (
+    "order_id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "client" VARCHAR(255) NOT NULL,
+    "orderStatus" VARCHAR(100) NOT NULL,
+    "orderNumber" VARCHAR(100) NOT NULL UNIQUE,
+    "productName" VARCHAR(255) NOT NULL,
+    "sleeveName" VARCHAR(255) NOT NULL,
+    "orderDate" DATE NOT NULL,
+    "desiredCompletionDate" DATE,
+    "quantity" INT NOT NULL,
+    "orderWeight" REAL NOT NULL,
+    "productType" VARCHAR(100) NOT NULL,
+    "pack" INT NOT NULL,
+    "packaging" INT NOT NULL,
+    "comments" TEXT,
+    "width" REAL NOT NULL,
+    "length" REAL NOT NULL,
+    "thickness" REAL NOT NULL,
+    "widthSquared" REAL NOT NULL,
+    "lengthSquared" REAL NOT NULL,
+    "thicknessSquared" REAL NOT NULL,
+    "density" REAL NOT NULL,
+    "weightWithoutCutting" REAL NOT NULL,
+    "weightWithCutting" REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "batches" (
+    "batch_id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "batchNumber" VARCHAR(100) NOT NULL,
+    "batchStatus" VARCHAR(100) NOT NULL,
+    "labelName" VARCHAR(255),
+    "completionDate" DATE,
+    "shipment" INT NOT NULL DEFAULT 0,
+    "print" VARCHAR(255),
+    "accepted" REAL,
+    "acceptedPCS" INT,
+    "deviation" REAL,
+    "order_id" INT NOT NULL REFERENCES "orders" ("order_id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_batches_order_i_387918" ON "batches" ("order_id");
+CREATE TABLE IF NOT EXISTS "cutting" (
+    "cutting_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "priority" INT NOT NULL,
+    "status" VARCHAR(100) NOT NULL,
+    "cutting" REAL NOT NULL,
+    "cuttingPSC" INT NOT NULL,
+    "remainToCut" REAL NOT NULL,
+    "remainToCutPSC" INT NOT NULL,
+    "days" REAL NOT NULL,
+    "norm" REAL NOT NULL,
+    "startDate" DATE,
+    "PSCCheck" INT,
+    "batch_id" INT NOT NULL REFERENCES "batches" ("batch_id") ON DELETE CASCADE,
+    "equipment_id" INT NOT NULL REFERENCES "equipment" ("equipment_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_cutting_batch_i_401ec3" ON "cutting" ("batch_id");
+CREATE INDEX IF NOT EXISTS "idx_cutting_equipme_943c0b" ON "cutting" ("equipment_id");
+CREATE TABLE IF NOT EXISTS "printing" (
+    "printing_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "printing" REAL NOT NULL,
+    "remainToPrint" REAL NOT NULL,
+    "batch_id" INT NOT NULL REFERENCES "batches" ("batch_id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_printing_batch_i_7d4ba2" ON "printing" ("batch_id");
+CREATE TABLE IF NOT EXISTS "winding" (
+    "winding_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "priority" INT NOT NULL,
+    "status" VARCHAR(100) NOT NULL,
+    "cuttingDate" DATE,
+    "norm" REAL NOT NULL,
+    "days" REAL NOT NULL,
+    "winding" REAL NOT NULL,
+    "requiredToWind" REAL NOT NULL,
+    "remainToWind" REAL NOT NULL,
+    "weightCheck" REAL,
+    "batch_id" INT NOT NULL REFERENCES "batches" ("batch_id") ON DELETE CASCADE,
+    "equipment_id" INT NOT NULL REFERENCES "equipment" ("equipment_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_winding_batch_i_d243f8" ON "winding" ("batch_id");
+CREATE INDEX IF NOT EXISTS "idx_winding_equipme_a33286" ON "winding" ("equipment_id");
+CREATE TABLE IF NOT EXISTS "workers" (
+    "worker_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "FIO" VARCHAR(255) NOT NULL
+);
+CREATE TABLE IF NOT EXISTS "extrusion" (
+    "extrusion_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "date" DATE NOT NULL,
+    "equipmentOperatinTime" REAL NOT NULL,
+    "shiftNorm" REAL NOT NULL,
+    "totalShift" REAL NOT NULL,
+    "whiteDefective" REAL NOT NULL,
+    "transparentDefective" REAL NOT NULL,
+    "coloredDefective" REAL NOT NULL,
+    "hourlyProduction" REAL NOT NULL,
+    "seasonal" REAL NOT NULL,
+    "winding_id" INT NOT NULL REFERENCES "winding" ("winding_ID") ON DELETE CASCADE,
+    "worker_id" INT NOT NULL REFERENCES "workers" ("worker_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_extrusion_winding_bee606" ON "extrusion" ("winding_id");
+CREATE INDEX IF NOT EXISTS "idx_extrusion_worker__726f51" ON "extrusion" ("worker_id");
+CREATE TABLE IF NOT EXISTS "finished_products" (
+    "finishedProducts_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "date" DATE NOT NULL,
+    "quantity" INT NOT NULL,
+    "weight" REAL NOT NULL,
+    "batch_id" INT NOT NULL REFERENCES "batches" ("batch_id") ON DELETE CASCADE,
+    "worker_id" INT NOT NULL REFERENCES "workers" ("worker_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_finished_pr_batch_i_385ee7" ON "finished_products" ("batch_id");
+CREATE INDEX IF NOT EXISTS "idx_finished_pr_worker__c0a2cd" ON "finished_products" ("worker_id");
+CREATE TABLE IF NOT EXISTS "flexa" (
+    "flexa_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "date" DATE NOT NULL,
+    "operatinTime" REAL NOT NULL,
+    "shiftNorm" REAL NOT NULL,
+    "totalShift" REAL NOT NULL,
+    "whiteDefective" REAL NOT NULL,
+    "printDefective" REAL NOT NULL,
+    "coloredDefective" REAL NOT NULL,
+    "hourlyProduction" REAL NOT NULL,
+    "remark" TEXT,
+    "printing_id" INT NOT NULL REFERENCES "printing" ("printing_ID") ON DELETE CASCADE,
+    "worker_id" INT NOT NULL REFERENCES "workers" ("worker_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_flexa_printin_51407b" ON "flexa" ("printing_id");
+CREATE INDEX IF NOT EXISTS "idx_flexa_worker__43bf42" ON "flexa" ("worker_id");
+CREATE TABLE IF NOT EXISTS "paketki" (
+    "paketki_ID" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "date" DATE NOT NULL,
+    "operatinTime" REAL NOT NULL,
+    "shiftNorm" REAL NOT NULL,
+    "totalShift" REAL NOT NULL,
+    "whiteDefective" REAL NOT NULL,
+    "transparentDefective" REAL NOT NULL,
+    "coloredDefective" REAL NOT NULL,
+    "hourlyProduction" REAL NOT NULL,
+    "seasonal" REAL NOT NULL,
+    "cutting_id" INT NOT NULL REFERENCES "cutting" ("cutting_ID") ON DELETE CASCADE,
+    "extrusion_id" INT NOT NULL,
+    "worker_id" INT NOT NULL REFERENCES "workers" ("worker_ID") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_paketki_cutting_14697f" ON "paketki" ("cutting_id");
+CREATE INDEX IF NOT EXISTS "idx_paketki_extrusi_0dc49b" ON "paketki" ("extrusion_id");
+CREATE INDEX IF NOT EXISTS "idx_paketki_worker__b72917" ON "paketki" ("worker_id");
+"""
+
+
+async def upgrade(conn: BaseDBAsyncClient) -> None:
+    await conn.execute_script(POSTGRES if conn.capabilities.dialect == "postgres" else SQLITE)
@@ -0,0 +1,17 @@
+"""
+Помесячное секционирование extrusion, paketki и flexa (только Postgres).
+
+Таблицы, уже переведённые через python -m app.partitioning migrate,
+пропускаются.
+"""
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+from app.partitioning import PARTITIONED_TABLES, is_partitioned, is_postgres, partition_table
+
+
+async def upgrade(conn: BaseDBAsyncClient) -> None:
+    if not is_postgres(conn):
+        return
+    for table in PARTITIONED_TABLES:
+        if not await is_partitioned(conn, table):
+            await partition_table(conn, table)
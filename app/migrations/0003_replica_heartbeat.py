@@ -0,0 +1,14 @@
+"""
+Строка heartbeat для проверки отставания реплик (app.replicas).
+
+at - время записи в секундах Unix, чтобы сравнение не зависело от часовых
+поясов сервера базы.
+"""
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+
+async def upgrade(conn: BaseDBAsyncClient) -> None:
+    at_type = "DOUBLE PRECISION" if conn.capabilities.dialect == "postgres" else "REAL"
+    await conn.execute_script(
+        f"CREATE TABLE IF NOT EXISTS replica_heartbeat (id INT NOT NULL PRIMARY KEY, at {at_type} NOT NULL)"
+    )
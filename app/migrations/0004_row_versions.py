@@ -0,0 +1,12 @@
+"""
+Столбец version для оптимистической блокировки (app.concurrency) у
+партий, намотки и резки. Существующие строки получают версию 1.
+"""
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+VERSIONED_TABLES = ("batches", "winding", "cutting")
+
+
+async def upgrade(conn: BaseDBAsyncClient) -> None:
+    for table in VERSIONED_TABLES:
+        await conn.execute_script(f"ALTER TABLE {table} ADD COLUMN version INT NOT NULL DEFAULT 1")
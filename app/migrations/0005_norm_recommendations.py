@@ -0,0 +1,27 @@
+"""
+Таблица рекомендуемых норм (app.norms). Пересчитывается целиком раз в
+сутки; пустые столбцы признаков означают «любое значение» - это строки
+для более общих уровней, которые используются, когда точной группы нет.
+"""
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+
+async def upgrade(conn: BaseDBAsyncClient) -> None:
+    postgres = conn.capabilities.dialect == "postgres"
+    real = "DOUBLE PRECISION" if postgres else "REAL"
+    await conn.execute_script(f"""
+CREATE TABLE IF NOT EXISTS norm_recommendations (
+    stage VARCHAR(20) NOT NULL,
+    equipment_id INT,
+    "productType" VARCHAR(100),
+    "thicknessBand" {real},
+    "widthBand" {real},
+    "seasonalBand" {real},
+    shifts INT NOT NULL,
+    "hourlyP25" {real} NOT NULL,
+    "hourlyP50" {real} NOT NULL,
+    "hourlyP75" {real} NOT NULL,
+    "operatingTime" {real} NOT NULL,
+    norm {real} NOT NULL,
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)""")
@@ -0,0 +1,109 @@
+"""
+Отслеживание изменений для синхронизации планшетов (app.sync).
+
+Во всех таблицах моделей появляется updated_at - время последней вставки
+или изменения строки, а удалённые строки оставляют запись в
+sync_tombstones. Оба ставятся триггерами, поэтому учитываются и запросы
+мимо ORM (массовые правки, импорт, COPY), и каскадные удаления.
+
+В Postgres время берётся из clock_timestamp() сервера базы. В SQLite
+столбец заполняется триггером, только если запрос сам его не задал (ORM
+ставит его через auto_now), в том же текстовом формате, что пишет
+Tortoise, чтобы строки сравнивались по порядку времени. Существующие
+строки получают время миграции.
+"""
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+TRACKED_TABLES = {
+    "orders": "order_id",
+    "batches": "batch_id",
+    "equipment": "equipment_ID",
+    "workers": "worker_ID",
+    "winding": "winding_ID",
+    "extrusion": "extrusion_ID",
+    "cutting": "cutting_ID",
+    "paketki": "paketki_ID",
+    "printing": "printing_ID",
+    "flexa": "flexa_ID",
+    "finished_products": "finishedProducts_ID",
+}
+
+POSTGRES = """
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id BIGSERIAL NOT NULL PRIMARY KEY,
+    resource VARCHAR(32) NOT NULL,
+    record_id INT NOT NULL,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted ON sync_tombstones (deleted_at, id);
+
+CREATE OR REPLACE FUNCTION sync_touch() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END $$;
+
+-- Аргументы: имя ресурса и столбец первичного ключа
+CREATE OR REPLACE FUNCTION sync_tombstone() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    EXECUTE format(
+        'INSERT INTO sync_tombstones (resource, record_id) SELECT %L, %I FROM deleted_rows',
+        TG_ARGV[0], TG_ARGV[1]
+    );
+    RETURN NULL;
+END $$;
+"""
+
+# Триггер на удаление - на уровне оператора: массовое удаление (архив,
+# каскад) пишет надгробия одним INSERT ... SELECT
+POSTGRES_TABLE = """
+ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+CREATE INDEX IF NOT EXISTS "idx_{table}_updated_at" ON "{table}" (updated_at, "{pk}");
+CREATE TRIGGER "sync_{table}_touch" BEFORE INSERT OR UPDATE ON "{table}"
+    FOR EACH ROW EXECUTE FUNCTION sync_touch();
+CREATE TRIGGER "sync_{table}_tombstone" AFTER DELETE ON "{table}"
+    REFERENCING OLD TABLE AS deleted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION sync_tombstone('{table}', '{pk}');
+"""
+
+SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f000+00:00', 'now')"
+
+SQLITE = """
+CREATE TABLE IF NOT EXISTS sync_tombstones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    resource VARCHAR(32) NOT NULL,
+    record_id INT NOT NULL,
+    deleted_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted ON sync_tombstones (deleted_at, id);
+"""
+
+SQLITE_TABLE = """
+ALTER TABLE "{table}" ADD COLUMN updated_at TIMESTAMP;
+UPDATE "{table}" SET updated_at = {now};
+CREATE INDEX IF NOT EXISTS "idx_{table}_updated_at" ON "{table}" (updated_at, "{pk}");
+CREATE TRIGGER "sync_{table}_insert" AFTER INSERT ON "{table}" FOR EACH ROW
+    WHEN NEW.updated_at IS NULL
+BEGIN
+    UPDATE "{table}" SET updated_at = {now} WHERE "{pk}" = NEW."{pk}";
+END;
+CREATE TRIGGER "sync_{table}_update" AFTER UPDATE ON "{table}" FOR EACH ROW
+    WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE "{table}" SET updated_at = {now} WHERE "{pk}" = NEW."{pk}";
+END;
+CREATE TRIGGER "sync_{table}_tombstone" AFTER DELETE ON "{table}" FOR EACH ROW
+BEGIN
+    INSERT INTO sync_tombstones (resource, record_id, deleted_at) VALUES ('{table}', OLD."{pk}", {now});
+END;
+"""
+
+
+async def upgrade(conn: BaseDBAsyncClient) -> None:
+    postgres = conn.capabilities.dialect == "postgres"
+    await conn.execute_script(POSTGRES if postgres else SQLITE)
+    for table, pk in TRACKED_TABLES.items():
+        if postgres:
+            await conn.execute_script(POSTGRES_TABLE.format(table=table, pk=pk))
+        else:
+            await conn.execute_script(SQLITE_TABLE.format(table=table, pk=pk, now=SQLITE_NOW))
@@ -0,0 +1,58 @@
+"""
+Журнал изменений записей (app.audit).
+
+Строки пишутся пачками через COPY / многострочную вставку и читаются по
+ресурсу и записи, новые первыми, - отсюда индекс (resource, record_id, id).
+Журнал только дополняется: изменение и удаление строк запрещены
+триггером.
+"""
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+POSTGRES = """
+CREATE TABLE IF NOT EXISTS audit_log (
+    id BIGSERIAL NOT NULL PRIMARY KEY,
+    at TIMESTAMPTZ NOT NULL,
+    resource VARCHAR(32) NOT NULL,
+    record_id INT NOT NULL,
+    action VARCHAR(8) NOT NULL,
+    actor VARCHAR(255),
+    "before" JSONB,
+    "after" JSONB
+);
+CREATE INDEX IF NOT EXISTS idx_audit_log_record ON audit_log (resource, record_id, id);
+
+CREATE OR REPLACE FUNCTION audit_log_append_only() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    RAISE EXCEPTION 'audit_log is append-only';
+END $$;
+
+CREATE TRIGGER audit_log_append_only BEFORE UPDATE OR DELETE ON audit_log
+    FOR EACH STATEMENT EXECUTE FUNCTION audit_log_append_only();
+"""
+
+SQLITE = """
+CREATE TABLE IF NOT EXISTS audit_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    at TIMESTAMP NOT NULL,
+    resource VARCHAR(32) NOT NULL,
+    record_id INT NOT NULL,
+    action VARCHAR(8) NOT NULL,
+    actor VARCHAR(255),
+    "before" TEXT,
+    "after" TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_audit_log_record ON audit_log (resource, record_id, id);
+
+CREATE TRIGGER audit_log_no_update BEFORE UPDATE ON audit_log
+BEGIN
+    SELECT RAISE(ABORT, 'audit_log is append-only');
+END;
+CREATE TRIGGER audit_log_no_delete BEFORE DELETE ON audit_log
+BEGIN
+    SELECT RAISE(ABORT, 'audit_log is append-only');
+END;
+"""
+
+
+async def upgrade(conn: BaseDBAsyncClient) -> None:
+    await conn.execute_script(POSTGRES if conn.capabilities.dialect == "postgres" else SQLITE)
@@ -26,6 +26,8 @@ class Orders(Model):
     density = fields.FloatField()
     weightWithoutCutting = fields.FloatField()
     weightWithCutting = fields.FloatField()
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     batches: fields.ReverseRelation["Batches"]
 
@@ -36,7 +38,7 @@ class Orders(Model):
 class Batches(Model):
     batch_id = fields.IntField(pk=True)
     order: fields.ForeignKeyRelation[Orders] = fields.ForeignKeyField(
-        "models.Orders", related_name="batches"
+        "models.Orders", related_name="batches", db_index=True
     )
     batchNumber = fields.CharField(max_length=100)
     batchStatus = fields.CharField(max_length=100)
@@ -47,6 +49,10 @@ class Batches(Model):
     accepted = fields.FloatField(null=True)
     acceptedPCS = fields.IntField(null=True)
     deviation = fields.FloatField(null=True)
+    # Увеличивается при каждом изменении, см. app.concurrency
+    version = fields.IntField(default=1)
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     winding: fields.ReverseRelation["Winding"]
     cutting: fields.ReverseRelation["Cutting"]
@@ -61,6 +67,8 @@ class Equipment(Model):
     equipment_ID = fields.IntField(pk=True)
     description = fields.TextField(null=True)
     name = fields.CharField(max_length=255)
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     winding: fields.ReverseRelation["Winding"]
     cutting: fields.ReverseRelation["Cutting"]
@@ -72,6 +80,8 @@ class Equipment(Model):
 class Workers(Model):
     worker_ID = fields.IntField(pk=True)
     FIO = fields.CharField(max_length=255)
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     extrusion: fields.ReverseRelation["Extrusion"]
     paketki: fields.ReverseRelation["Paketki"]
@@ -85,10 +95,10 @@ class Workers(Model):
 class Winding(Model):
     winding_ID = fields.IntField(pk=True)
     batch: fields.ForeignKeyRelation[Batches] = fields.ForeignKeyField(
-        "models.Batches", related_name="winding"
+        "models.Batches", related_name="winding", db_index=True
     )
     equipment: fields.ForeignKeyRelation[Equipment] = fields.ForeignKeyField(
-        "models.Equipment", related_name="winding"
+        "models.Equipment", related_name="winding", db_index=True
     )
     priority = fields.IntField()
     status = fields.CharField(max_length=100)
@@ -99,6 +109,10 @@ class Winding(Model):
     requiredToWind = fields.FloatField()
     remainToWind = fields.FloatField()
     weightCheck = fields.FloatField(null=True)
+    # Увеличивается при каждом изменении, см. app.concurrency
+    version = fields.IntField(default=1)
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     extrusion: fields.ReverseRelation["Extrusion"]
 
@@ -109,7 +123,7 @@ class Winding(Model):
 class Extrusion(Model):
     extrusion_ID = fields.IntField(pk=True)
     winding: fields.ForeignKeyRelation[Winding] = fields.ForeignKeyField(
-        "models.Winding", related_name="extrusion"
+        "models.Winding", related_name="extrusion", db_index=True
     )
     date = fields.DateField()
     equipmentOperatinTime = fields.FloatField()
@@ -121,8 +135,10 @@ class Extrusion(Model):
     hourlyProduction = fields.FloatField()
     seasonal = fields.FloatField()
     worker: fields.ForeignKeyRelation[Workers] = fields.ForeignKeyField(
-        "models.Workers", related_name="extrusion"
+        "models.Workers", related_name="extrusion", db_index=True
     )
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     paketki: fields.ReverseRelation["Paketki"]
 
@@ -133,10 +149,10 @@ class Extrusion(Model):
 class Cutting(Model):
     cutting_ID = fields.IntField(pk=True)
     batch: fields.ForeignKeyRelation[Batches] = fields.ForeignKeyField(
-        "models.Batches", related_name="cutting"
+        "models.Batches", related_name="cutting", db_index=True
     )
     equipment: fields.ForeignKeyRelation[Equipment] = fields.ForeignKeyField(
-        "models.Equipment", related_name="cutting"
+        "models.Equipment", related_name="cutting", db_index=True
     )
     priority = fields.IntField()
     status = fields.CharField(max_length=100)
@@ -148,6 +164,10 @@ class Cutting(Model):
     norm = fields.FloatField()
     startDate = fields.DateField(null=True)
     PSCCheck = fields.IntField(null=True)
+    # Увеличивается при каждом изменении, см. app.concurrency
+    version = fields.IntField(default=1)
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     paketki: fields.ReverseRelation["Paketki"]
 
@@ -157,11 +177,12 @@ class Cutting(Model):
 
 class Paketki(Model):
     paketki_ID = fields.IntField(pk=True)
+    # extrusion секционирована по date, поэтому ссылка проверяется приложением
     extrusion: fields.ForeignKeyRelation[Extrusion] = fields.ForeignKeyField(
-        "models.Extrusion", related_name="paketki"
+        "models.Extrusion", related_name="paketki", db_index=True, db_constraint=False
     )
     cutting: fields.ForeignKeyRelation[Cutting] = fields.ForeignKeyField(
-        "models.Cutting", related_name="paketki"
+        "models.Cutting", related_name="paketki", db_index=True
     )
     date = fields.DateField()
     operatinTime = fields.FloatField()
@@ -173,8 +194,10 @@ class Paketki(Model):
     hourlyProduction = fields.FloatField()
     seasonal = fields.FloatField()
     worker: fields.ForeignKeyRelation[Workers] = fields.ForeignKeyField(
-        "models.Workers", related_name="paketki"
+        "models.Workers", related_name="paketki", db_index=True
     )
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     class Meta:
         table = "paketki"
@@ -183,10 +206,12 @@ class Paketki(Model):
 class Printing(Model):
     printing_ID = fields.IntField(pk=True)
     batch: fields.ForeignKeyRelation[Batches] = fields.ForeignKeyField(
-        "models.Batches", related_name="printing"
+        "models.Batches", related_name="printing", db_index=True
     )
     printing = fields.FloatField()
     remainToPrint = fields.FloatField()
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     flexa: fields.ReverseRelation["Flexa"]
 
@@ -197,7 +222,7 @@ class Printing(Model):
 class Flexa(Model):
     flexa_ID = fields.IntField(pk=True)
     printing: fields.ForeignKeyRelation[Printing] = fields.ForeignKeyField(
-        "models.Printing", related_name="flexa"
+        "models.Printing", related_name="flexa", db_index=True
     )
     date = fields.DateField()
     operatinTime = fields.FloatField()
@@ -209,8 +234,10 @@ class Flexa(Model):
     hourlyProduction = fields.FloatField()
     remark = fields.TextField(null=True)
     worker: fields.ForeignKeyRelation[Workers] = fields.ForeignKeyField(
-        "models.Workers", related_name="flexa"
+        "models.Workers", related_name="flexa", db_index=True
     )
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     class Meta:
         table = "flexa"
@@ -219,14 +246,16 @@ class Flexa(Model):
 class FinishedProducts(Model):
     finishedProducts_ID = fields.IntField(pk=True)
     batch: fields.ForeignKeyRelation[Batches] = fields.ForeignKeyField(
-        "models.Batches", related_name="finished_products"
+        "models.Batches", related_name="finished_products", db_index=True
     )
     date = fields.DateField()
     quantity = fields.IntField()
     weight = fields.FloatField()
     worker: fields.ForeignKeyRelation[Workers] = fields.ForeignKeyField(
-        "models.Workers", related_name="finished_products"
+        "models.Workers", related_name="finished_products", db_index=True
     )
+    # Время последнего изменения для синхронизации, см. app.sync
+    updated_at = fields.DatetimeField(auto_now=True)
 
     class Meta:
         table = "finished_products"
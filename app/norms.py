@@ -0,0 +1,291 @@
+"""
+Рекомендуемые нормы выработки по истории смен.
+
+    python -m app.norms [--history-days 365]    # раз в сутки, ночью
+
+Нормы shiftNorm (экструзия, пакеты, флексопечать) и norm (намотка,
+резка) вводятся вручную. Пересчёт группирует смены за последние
+NORM_HISTORY_DAYS дней (0 - вся история) по признакам:
+
+    линия, productType заказа, полоса толщины, полоса ширины, полоса seasonal
+
+и считает для каждой группы 25-й, 50-й и 75-й процентили hourlyProduction
+и медиану времени работы (operatinTime). Рекомендуемая норма на смену -
+процентиль NORM_PERCENTILE часовой выработки, умноженный на медиану
+времени работы. Группы меньше NORM_MIN_SHIFTS смен не сохраняются.
+
+Кроме точных групп сохраняются более общие уровни (без seasonal; линия и
+тип продукта; только линия; весь этап) - с пустыми признаками. Подбор
+нормы идёт от точного уровня к общему, пока не найдётся группа.
+
+Процентили считаются NumPy одной сортировкой на уровень сразу для всех
+его групп. Результат целиком заменяет таблицу
+norm_recommendations; процессы API читают её в память и перечитывают
+раз в NORMS_CACHE_TTL секунд.
+
+Намотке соответствует история экструзии, резке - пакетов: create_winding
+и create_cutting подставляют рекомендацию, если norm не передан.
+"""
+import argparse
+import os
+import time
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+NORM_HISTORY_DAYS = int(os.getenv("NORM_HISTORY_DAYS", "365"))
+NORM_PERCENTILE = float(os.getenv("NORM_PERCENTILE", "50"))
+NORM_MIN_SHIFTS = int(os.getenv("NORM_MIN_SHIFTS", "20"))
+NORMS_CACHE_TTL = float(os.getenv("NORMS_CACHE_TTL", "3600"))
+
+# Ширина полос признаков: полоса обозначается нижней границей
+THICKNESS_STEP = 10.0
+WIDTH_STEP = 10.0
+SEASONAL_STEP = 0.05
+
+FEATURES = ("equipment_id", "productType", "thicknessBand", "widthBand", "seasonalBand")
+# Уровни от точного к общему: сколько первых признаков входит в ключ
+LEVELS = (5, 4, 2, 1, 0)
+
+
+class Stage(NamedTuple):
+    shift_table: str
+    job_table: str
+    operating_time: str
+    # Выражения для линии и seasonal; у флексопечати их нет
+    equipment: str
+    seasonal: str
+
+
+STAGES = {
+    "extrusion": Stage("extrusion", "winding", "equipmentOperatinTime", "j.equipment_id", 's.seasonal'),
+    "paketki": Stage("paketki", "cutting", "operatinTime", "j.equipment_id", 's.seasonal'),
+    "flexa": Stage("flexa", "printing", "operatinTime", "NULL", "NULL"),
+}
+# Этап, по которому подбирается norm плана
+JOB_STAGES = {"winding": "extrusion", "cutting": "paketki"}
+
+ORDER_FEATURES_SQL = """
+SELECT o."productType", o.thickness, o.width
+FROM batches b JOIN orders o ON o.order_id = b.order_id
+WHERE b.batch_id = $1
+"""
+
+
+def history_sql(stage: Stage) -> str:
+    return f"""
+SELECT {stage.equipment} AS equipment_id, o."productType", o.thickness, o.width,
+       {stage.seasonal} AS seasonal, s."hourlyProduction" AS hourly,
+       s."{stage.operating_time}" AS "operatingTime"
+FROM {stage.shift_table} s
+JOIN {stage.job_table} j ON j."{stage.job_table}_ID" = s.{stage.job_table}_id
+JOIN batches b ON b.batch_id = j.batch_id
+JOIN orders o ON o.order_id = b.order_id
+WHERE s."hourlyProduction" > 0 AND s."{stage.operating_time}" > 0 AND s.date >= $1
+"""
+
+
+def band_code(values, step: float):
+    # Небольшой запас, чтобы 0.95 / 0.05 не превратилось в 18.999...
+    return np.floor(np.asarray(values, dtype=np.float64) / step + 1e-9).astype(np.int64)
+
+
+def band(value: Optional[float], step: float) -> Optional[float]:
+    """Нижняя граница полосы, в которую попадает value."""
+    return None if value is None else round(float(band_code(value, step) * step), 4)
+
+
+def grouped_percentiles(keys: np.ndarray, values: np.ndarray, quantiles: List[float]) -> tuple:
+    """
+    Процентили values в группах с одинаковым keys, с линейной
+    интерполяцией, как np.percentile. Возвращает ключи групп, число
+    значений в группе и массив [группа, квантиль].
+    """
+    # Устойчивая сортировка по ключу сохраняет порядок значений внутри группы
+    by_value = np.argsort(values)
+    order = by_value[np.argsort(keys[by_value], kind="stable")]
+    ordered_keys, ordered = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, ordered_keys[1:] != ordered_keys[:-1]])
+    counts = np.diff(np.r_[starts, len(order)])
+    result = np.empty((len(starts), len(quantiles)))
+    for column, quantile in enumerate(quantiles):
+        position = starts + quantile * (counts - 1)
+        low = np.floor(position).astype(np.int64)
+        high = np.minimum(low + 1, starts + counts - 1)
+        result[:, column] = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+    return ordered_keys[starts], counts, result
+
+
+def recommend_groups(stage: str, rows: List[tuple]) -> List[dict]:
+    """Строки norm_recommendations этапа по сменам (признаки..., hourly, operatingTime)."""
+    if not rows:
+        return []
+    columns = list(zip(*rows))
+    product_names, products = np.unique(np.array(columns[1], dtype=str), return_inverse=True)
+    seasonal = np.array([np.nan if value is None else value for value in columns[4]], dtype=np.float64)
+    # Коды признаков; -1 - признак у этапа не заполняется (линия и seasonal флексопечати)
+    codes = [
+        np.array([-1 if value is None else value for value in columns[0]], dtype=np.int64),
+        products.ravel(),
+        band_code(columns[2], THICKNESS_STEP),
+        band_code(columns[3], WIDTH_STEP),
+        np.where(np.isnan(seasonal), -1, band_code(np.nan_to_num(seasonal), SEASONAL_STEP)),
+    ]
+    hourly = np.array(columns[5], dtype=np.float64)
+    operating = np.array(columns[6], dtype=np.float64)
+
+    # Признаки складываются в одно число по смешанному основанию, так что
+    # ключ уровня - это ключ смены, делённый нацело на основания
+    # отброшенных признаков
+    offsets = [int(code.min()) for code in codes]
+    radixes = [int(code.max()) - offset + 1 for code, offset in zip(codes, offsets)]
+    key = np.zeros(len(rows), dtype=np.int64)
+    for code, offset, radix in zip(codes, offsets, radixes):
+        key = key * radix + (code - offset)
+
+    steps = (None, None, THICKNESS_STEP, WIDTH_STEP, SEASONAL_STEP)
+    quantiles = [0.25, 0.5, 0.75, NORM_PERCENTILE / 100]
+    recommendations = []
+    seen = set()
+    for size in LEVELS:
+        level_key = key // int(np.prod(radixes[size:], dtype=np.int64))
+        groups, shifts, rates = grouped_percentiles(level_key, hourly, quantiles)
+        _, _, times = grouped_percentiles(level_key, operating, [0.5])
+
+        for index in np.flatnonzero(shifts >= NORM_MIN_SHIFTS):
+            features = [None] * len(FEATURES)
+            rest = int(groups[index])
+            for position in reversed(range(size)):
+                rest, digit = divmod(rest, radixes[position])
+                code = digit + offsets[position]
+                if code < 0:
+                    continue
+                if position == 0:
+                    features[position] = code
+                elif position == 1:
+                    features[position] = str(product_names[code])
+                else:
+                    features[position] = round(code * steps[position], 4)
+            # У флексопечати без линии и seasonal разные уровни совпадают
+            if tuple(features) in seen:
+                continue
+            seen.add(tuple(features))
+            recommendations.append({
+                "stage": stage,
+                **dict(zip(FEATURES, features)),
+                "shifts": int(shifts[index]),
+                "hourlyP25": float(rates[index, 0]),
+                "hourlyP50": float(rates[index, 1]),
+                "hourlyP75": float(rates[index, 2]),
+                "operatingTime": float(times[index, 0]),
+                "norm": float(rates[index, 3] * times[index, 0]),
+            })
+    return recommendations
+
+
+async def recompute(history_days: int = NORM_HISTORY_DAYS) -> Dict[str, int]:
+    """Пересчитать таблицу норм, вернуть число групп по этапам."""
+    conn = Tortoise.get_connection("default")
+    since = date.today() - timedelta(days=history_days) if history_days else date.min
+    recommendations = []
+    counts = {}
+    for name, stage in STAGES.items():
+        _, rows = await conn.execute_query(history_sql(stage), [since])
+        stage_rows = recommend_groups(name, [tuple(row) for row in rows])
+        recommendations.extend(stage_rows)
+        counts[name] = len(stage_rows)
+
+    async with in_transaction() as tx:
+        await tx.execute_script("DELETE FROM norm_recommendations")
+        if recommendations:
+            columns = list(recommendations[0])
+            param = "${}" if tx.capabilities.dialect == "postgres" else "?"
+            placeholders = ", ".join(param.format(index) for index in range(1, len(columns) + 1))
+            names = ", ".join(f'"{column}"' for column in columns)
+            await tx.execute_many(
+                f"INSERT INTO norm_recommendations ({names}) VALUES ({placeholders})",
+                [[row[column] for column in columns] for row in recommendations]
+            )
+    _table.clear()
+    return counts
+
+
+# (этап, признаки...) -> норма; загружается из norm_recommendations
+_table: Dict[tuple, float] = {}
+_loaded_at = 0.0
+
+
+async def load() -> Dict[tuple, float]:
+    global _loaded_at
+    if _table and time.monotonic() - _loaded_at < NORMS_CACHE_TTL:
+        return _table
+    names = ", ".join(f'"{feature}"' for feature in FEATURES)
+    rows = await Tortoise.get_connection("default").execute_query_dict(
+        f"SELECT stage, {names}, norm FROM norm_recommendations"
+    )
+    _table.clear()
+    for row in rows:
+        _table[(row["stage"],) + tuple(row[feature] for feature in FEATURES)] = row["norm"]
+    _loaded_at = time.monotonic()
+    return _table
+
+
+def lookup_keys(stage: str, equipment_id: Optional[int], product_type: Optional[str],
+                thickness: Optional[float], width: Optional[float],
+                seasonal: Optional[float]) -> List[Tuple]:
+    features = [equipment_id, product_type, band(thickness, THICKNESS_STEP), band(width, WIDTH_STEP),
+                band(seasonal, SEASONAL_STEP)]
+    keys = []
+    for size in LEVELS:
+        # Без seasonal точный уровень пропускается
+        if size == len(FEATURES) and seasonal is None:
+            continue
+        keys.append((stage, *features[:size], *[None] * (len(FEATURES) - size)))
+    return keys
+
+
+async def recommend(stage: str, equipment_id: Optional[int], product_type: Optional[str],
+                    thickness: Optional[float], width: Optional[float],
+                    seasonal: Optional[float] = None) -> Optional[float]:
+    """Рекомендуемая норма на смену для этапа или None, если истории нет."""
+    table = await load()
+    for key in lookup_keys(stage, equipment_id, product_type, thickness, width, seasonal):
+        if key in table:
+            return table[key]
+    return None
+
+
+async def default_norm(job: str, batch_id: int, equipment_id: int) -> Optional[float]:
+    """Норма для нового плана намотки или резки по признакам заказа партии."""
+    rows = await Tortoise.get_connection("default").execute_query_dict(ORDER_FEATURES_SQL, [batch_id])
+    if not rows:
+        return None
+    order = rows[0]
+    return await recommend(JOB_STAGES[job], equipment_id, order["productType"],
+                           order["thickness"], order["width"])
+
+
+async def main() -> None:
+    from app.database import init_db
+
+    parser = argparse.ArgumentParser(description="Recompute recommended shift norms")
+    parser.add_argument(
+        "--history-days", type=int, default=NORM_HISTORY_DAYS,
+        help="use shifts from this many last days, 0 for the whole history"
+    )
+    args = parser.parse_args()
+
+    await init_db()
+    started = time.perf_counter()
+    counts = await recompute(args.history_days)
+    print(", ".join(f"{stage}: {count} groups" for stage, count in counts.items())
+          + f" in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    from tortoise import run_async
+
+    run_async(main())
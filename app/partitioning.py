@@ -0,0 +1,267 @@
+"""
+Помесячное секционирование сменных таблиц в Postgres.
+
+    python -m app.partitioning migrate            # перевести таблицы на секции
+    python -m app.partitioning ensure             # создать будущие секции
+    python -m app.partitioning detach extrusion 2022-01
+
+Будущие секции создаются при миграции (python -m app.migrate) и фоновой
+задачей приложения maintain_partitions() - сразу после старта и затем раз
+в PARTITION_CHECK_INTERVAL секунд, так что строки новых месяцев не копятся
+в секции по умолчанию, даже если миграции долго не запускались.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+from datetime import date
+from typing import List
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+PARTITIONED_TABLES = ("extrusion", "paketki", "flexa")
+PRIMARY_KEYS = {
+    "extrusion": "extrusion_ID",
+    "paketki": "paketki_ID",
+    "flexa": "flexa_ID",
+}
+
+# Сколько месяцев вперёд создаются секции
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_CHECK_INTERVAL = float(os.getenv("PARTITION_CHECK_INTERVAL", "86400"))
+# Произвольный ключ advisory-блокировки: секции создаёт один процесс за раз
+LOCK_KEY = 7_202_612
+
+log = logging.getLogger(__name__)
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_range(first: date, last: date) -> List[date]:
+    months = []
+    current = month_start(first)
+    while current <= last:
+        months.append(current)
+        current = add_months(current, 1)
+    return months
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def is_postgres(conn: BaseDBAsyncClient) -> bool:
+    return conn.capabilities.dialect == "postgres"
+
+
+async def is_partitioned(conn: BaseDBAsyncClient, table: str) -> bool:
+    rows = await conn.execute_query_dict(
+        "SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = $1 AND pg_table_is_visible(c.oid)",
+        [table]
+    )
+    return bool(rows)
+
+
+def default_partition(table: str) -> str:
+    return f"{table}_default"
+
+
+async def relation_exists(conn: BaseDBAsyncClient, name: str) -> bool:
+    rows = await conn.execute_query_dict("SELECT to_regclass($1) IS NOT NULL AS found", [f'"{name}"'])
+    return rows[0]["found"]
+
+
+async def create_partition(conn: BaseDBAsyncClient, table: str, month: date) -> None:
+    """
+    Создать секцию месяца. Строки этого месяца, уже попавшие в секцию по
+    умолчанию (смена с будущей датой, запоздавший ensure), переносятся в
+    новую секцию: пока они в секции по умолчанию, Postgres её не создаст.
+    """
+    name = partition_name(table, month)
+    if await relation_exists(conn, name):
+        return
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    create = (f'CREATE TABLE "{name}" PARTITION OF "{table}" '
+              f"FOR VALUES FROM ('{start}') TO ('{end}')")
+    default = default_partition(table)
+    strays = await relation_exists(conn, default) and await conn.execute_query_dict(
+        f'SELECT 1 FROM "{default}" WHERE date >= $1 AND date < $2 LIMIT 1', [month, add_months(month, 1)]
+    )
+    if not strays:
+        await conn.execute_script(create)
+        return
+
+    # Одним скриптом - одна транзакция: секция по умолчанию отсоединяется,
+    # её строки месяца переносятся через родительскую таблицу в новую секцию
+    condition = f"date >= '{start}' AND date < '{end}'"
+    await conn.execute_script(f"""
+        ALTER TABLE "{table}" DETACH PARTITION "{default}";
+        {create};
+        INSERT INTO "{table}" SELECT * FROM "{default}" WHERE {condition};
+        DELETE FROM "{default}" WHERE {condition};
+        ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT;
+    """)
+
+
+async def ensure_partitions(months_ahead: int = MONTHS_AHEAD) -> None:
+    """
+    Создать секции на текущий и следующие месяцы для секционированных таблиц.
+    Рабочие процессы приложения и migrate могут запустить это одновременно,
+    поэтому всё делается в одной транзакции под advisory-блокировкой.
+    """
+    if not is_postgres(Tortoise.get_connection("default")):
+        return
+
+    today = month_start(date.today())
+    async with in_transaction() as tx:
+        await tx.execute_query("SELECT pg_advisory_xact_lock($1)", [LOCK_KEY])
+        for table in PARTITIONED_TABLES:
+            if not await is_partitioned(tx, table):
+                continue
+            for month in month_range(today, add_months(today, months_ahead)):
+                await create_partition(tx, table, month)
+
+
+async def maintain_partitions() -> None:
+    """Фоновое создание будущих секций, запускается при старте приложения."""
+    while True:
+        try:
+            await ensure_partitions()
+        except Exception:
+            log.exception("Creating upcoming partitions failed")
+        await asyncio.sleep(PARTITION_CHECK_INTERVAL)
+
+
+async def partition_table(conn: BaseDBAsyncClient, table: str) -> None:
+    """
+    Перенести обычную таблицу в секционированную по date с теми же колонками,
+    внешними ключами и индексами. Первичный ключ расширяется полем date,
+    как того требует Postgres.
+    """
+    legacy = f"{table}_legacy"
+    pk = PRIMARY_KEYS[table]
+
+    await conn.execute_script(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+    constraints = await conn.execute_query_dict(
+        "SELECT conname, pg_get_constraintdef(oid) AS definition "
+        "FROM pg_constraint WHERE conrelid = to_regclass($1) AND contype = 'f'",
+        [legacy]
+    )
+    indexes = await conn.execute_query_dict(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE tablename = $1 AND indexname NOT IN ("
+        "  SELECT conname FROM pg_constraint WHERE conrelid = to_regclass($1))",
+        [legacy]
+    )
+    # Внешние ключи на секционированную таблицу должны включать date,
+    # поэтому входящие ссылки (paketki -> extrusion) проверяет приложение
+    incoming = await conn.execute_query_dict(
+        "SELECT conrelid::regclass::text AS source, conname FROM pg_constraint "
+        "WHERE confrelid = to_regclass($1) AND contype = 'f'",
+        [legacy]
+    )
+    for constraint in incoming:
+        await conn.execute_script(
+            f'ALTER TABLE {constraint["source"]} DROP CONSTRAINT "{constraint["conname"]}"'
+        )
+
+    await conn.execute_script(
+        f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+        f"PARTITION BY RANGE (date)"
+    )
+
+    bounds = await conn.execute_query_dict(
+        f'SELECT MIN(date) AS first, MAX(date) AS last FROM "{legacy}"'
+    )
+    today = month_start(date.today())
+    first = bounds[0]["first"] or today
+    last = max(bounds[0]["last"] or today, add_months(today, MONTHS_AHEAD))
+    for month in month_range(first, last):
+        await create_partition(conn, table, month)
+    await conn.execute_script(f'CREATE TABLE "{default_partition(table)}" PARTITION OF "{table}" DEFAULT')
+
+    await conn.execute_script(f'INSERT INTO "{table}" SELECT * FROM "{legacy}"')
+
+    # Последовательность идентификаторов остаётся за новой таблицей
+    await conn.execute_script(
+        f"""DO $$ BEGIN
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY "{table}"."{pk}"',
+                           pg_get_serial_sequence('"{legacy}"', '{pk}'));
+        END $$"""
+    )
+    await conn.execute_script(f'DROP TABLE "{legacy}"')
+
+    await conn.execute_script(f'ALTER TABLE "{table}" ADD PRIMARY KEY ("{pk}", date)')
+
+    for constraint in constraints:
+        await conn.execute_script(
+            f'ALTER TABLE "{table}" ADD CONSTRAINT "{constraint["conname"]}" '
+            f'{constraint["definition"]}'
+        )
+    for index in indexes:
+        definition = re.sub(rf'ON (\w+\.)?"?{legacy}"?', f'ON "{table}"', index["indexdef"])
+        await conn.execute_script(definition)
+    await conn.execute_script(
+        f'CREATE INDEX IF NOT EXISTS "idx_{table}_date_brin" ON "{table}" USING brin (date)'
+    )
+
+
+async def migrate() -> None:
+    conn = Tortoise.get_connection("default")
+    if not is_postgres(conn):
+        raise RuntimeError("Partitioning is only supported on Postgres")
+
+    async with in_transaction() as tx:
+        for table in PARTITIONED_TABLES:
+            if not await is_partitioned(tx, table):
+                await partition_table(tx, table)
+
+
+async def detach_partition(table: str, period: str) -> str:
+    """Отсоединить секцию месяца YYYY-MM; данные остаются в отдельной таблице."""
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"Table {table} is not partitioned")
+    year, month = (int(part) for part in period.split("-"))
+    name = partition_name(table, date(year, month, 1))
+    conn = Tortoise.get_connection("default")
+    await conn.execute_script(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+    return name
+
+
+async def main() -> None:
+    from app.database import init_db
+
+    parser = argparse.ArgumentParser(description="Monthly partitions for shift tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="convert tables to partitioned ones")
+    commands.add_parser("ensure", help="create partitions for upcoming months")
+    detach = commands.add_parser("detach", help="detach a month partition")
+    detach.add_argument("table", choices=PARTITIONED_TABLES)
+    detach.add_argument("period", help="YYYY-MM")
+    args = parser.parse_args()
+
+    await init_db()
+    if args.command == "migrate":
+        await migrate()
+    elif args.command == "ensure":
+        await ensure_partitions()
+    else:
+        print(await detach_partition(args.table, args.period))
+
+
+if __name__ == "__main__":
+    from tortoise import run_async
+
+    run_async(main())
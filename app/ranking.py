@@ -0,0 +1,114 @@
+from datetime import date
+from typing import Dict, List
+
+from starlette.concurrency import run_in_threadpool
+
+from app import archive, cachebus, replicas
+from app.models import Workers
+
+# Выработка по всем сменным таблицам, привязанным к работнику, одним запросом.
+# Готовая продукция не имеет нормы, поэтому учитывается отдельными колонками.
+RANKING_SQL = """
+WITH shifts AS (
+    SELECT worker_id, 1 AS shift, "totalShift" AS output, "shiftNorm" AS norm,
+           0 AS quantity, 0.0 AS weight
+    FROM extrusion WHERE date >= $1 AND date < $2
+    UNION ALL
+    SELECT worker_id, 1, "totalShift", "shiftNorm", 0, 0.0
+    FROM paketki WHERE date >= $1 AND date < $2
+    UNION ALL
+    SELECT worker_id, 1, "totalShift", "shiftNorm", 0, 0.0
+    FROM flexa WHERE date >= $1 AND date < $2
+    UNION ALL
+    SELECT worker_id, 0, 0.0, 0.0, quantity, weight
+    FROM finished_products WHERE date >= $1 AND date < $2
+)
+SELECT worker_id,
+       SUM(shift) AS shifts,
+       SUM(output) AS output,
+       SUM(norm) AS norm,
+       SUM(quantity) AS "finishedQuantity",
+       SUM(weight) AS "finishedWeight"
+FROM shifts
+GROUP BY worker_id
+"""
+
+# Рейтинги закрытых периодов меняются только при правке старых данных:
+# снимок считается один раз и сбрасывается через шину во всех процессах
+_closed_snapshots: Dict[str, List[dict]] = {}
+SNAPSHOT_SOURCES = ("orders", "batches", "winding", "cutting", "printing", "workers",
+                    "extrusion", "paketki", "flexa", "finished_products")
+cachebus.subscribe(SNAPSHOT_SOURCES, _closed_snapshots.clear)
+
+
+def period_bounds(period: str) -> tuple[date, date]:
+    """Границы периода вида YYYY-MM: [начало месяца, начало следующего)."""
+    year, month = (int(part) for part in period.split("-"))
+    start = date(year, month, 1)
+    end = date(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def current_period() -> str:
+    return date.today().strftime("%Y-%m")
+
+
+def is_closed(period: str) -> bool:
+    _, end = period_bounds(period)
+    return end <= date.today().replace(day=1)
+
+
+def rank_workers(totals: Dict[int, dict], names: Dict[int, str]) -> List[dict]:
+    """Упорядочить работников по выполнению нормы, затем по выработке."""
+    ranking = []
+    for worker_id, total in totals.items():
+        norm = total["norm"]
+        ranking.append({
+            "worker_ID": worker_id,
+            "FIO": names.get(worker_id, ""),
+            **total,
+            "performance": total["output"] / norm if norm else None,
+        })
+
+    ranking.sort(key=lambda row: (
+        row["performance"] is None, -(row["performance"] or 0), -row["output"], row["worker_ID"]
+    ))
+    previous = None
+    for position, row in enumerate(ranking, start=1):
+        key = (row["performance"], row["output"])
+        row["rank"] = ranking[position - 2]["rank"] if key == previous else position
+        previous = key
+    return ranking
+
+
+async def compute_ranking(period: str) -> List[dict]:
+    start, end = period_bounds(period)
+    rows = await replicas.read_connection().execute_query_dict(RANKING_SQL, [start, end])
+
+    # Смены заархивированных заказов досчитываются из архива
+    totals = await run_in_threadpool(archive.shift_totals, start, end)
+    for row in rows:
+        worker_id = row.pop("worker_id")
+        if worker_id in totals:
+            for key, value in row.items():
+                totals[worker_id][key] += value
+        else:
+            totals[worker_id] = row
+
+    names = dict(await Workers.filter(worker_ID__in=list(totals)).values_list("worker_ID", "FIO")) \
+        if totals else {}
+    return rank_workers(totals, names)
+
+
+async def get_ranking(period: str) -> List[dict]:
+    """
+    Рейтинг работников за период. Закрытые периоды берутся из снимка,
+    текущий открытый период пересчитывается при каждом запросе.
+    """
+    if period in _closed_snapshots:
+        return _closed_snapshots[period]
+
+    ranking = await compute_ranking(period)
+    if is_closed(period):
+        _closed_snapshots[period] = ranking
+    return ranking
@@ -0,0 +1,159 @@
+"""
+Чтение с реплик для GET-запросов.
+
+DATABASE_REPLICA_URLS - список адресов реплик через запятую. Если он пуст,
+всё работает через основную базу, как раньше.
+
+ReplicaMiddleware помечает GET и HEAD как допускающие чтение с реплики,
+а ReplicaRouter (router Tortoise) отправляет чтение моделей в таком
+запросе на одну из свежих реплик по кругу. Записи и чтения внутри
+изменяющих запросов всегда идут в основную базу. После успешной записи
+клиент получает cookie, и следующие REPLICA_MAX_LAG секунд его
+GET-запросы тоже читают из основной базы - так он видит свои изменения.
+
+Свежесть проверяется по строке replica_heartbeat: monitor() раз в
+REPLICA_CHECK_INTERVAL секунд пишет время в основную базу и читает его с
+каждой реплики. Реплика, отставшая больше чем на REPLICA_MAX_LAG секунд
+или недоступная, исключается до следующей проверки; если свежих реплик
+нет, чтение идёт в основную базу. Способ не зависит от вида репликации,
+поэтому работает и с двумя файлами SQLite, которые копируются вручную.
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import os
+import time
+from http.cookies import SimpleCookie
+from typing import Dict, List, Optional
+
+from prometheus_client import Gauge
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+REPLICA_URLS = [
+    url.strip().replace("postgresql://", "postgres://")
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+REPLICAS = [f"replica{index}" for index in range(len(REPLICA_URLS))]
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "1"))
+
+PRIMARY_COOKIE = "db-primary-until"
+READ_METHODS = ("GET", "HEAD")
+
+HEARTBEAT_SQL = (
+    "INSERT INTO replica_heartbeat (id, at) VALUES (1, $1) "
+    "ON CONFLICT (id) DO UPDATE SET at = EXCLUDED.at"
+)
+
+REPLICA_LAG = Gauge("db_replica_lag_seconds", "Replica lag measured by heartbeat", ["replica"],
+                    multiprocess_mode="max")
+
+log = logging.getLogger(__name__)
+
+_read_replica: contextvars.ContextVar[bool] = contextvars.ContextVar("read_replica", default=False)
+_fresh: List[str] = []
+_round_robin = itertools.count()
+
+
+def enabled() -> bool:
+    return bool(REPLICAS)
+
+
+def connections() -> Dict[str, str]:
+    return dict(zip(REPLICAS, REPLICA_URLS))
+
+
+def choose() -> Optional[str]:
+    """Имя реплики для чтения в текущем запросе или None - основная база."""
+    if not _read_replica.get() or not _fresh:
+        return None
+    fresh = list(_fresh)
+    return fresh[next(_round_robin) % len(fresh)]
+
+
+def read_connection() -> BaseDBAsyncClient:
+    """Соединение для сырых SELECT в обработчиках чтения (рейтинг, трассировка)."""
+    return Tortoise.get_connection(choose() or "default")
+
+
+class ReplicaRouter:
+    def db_for_read(self, model) -> Optional[str]:
+        return choose()
+
+    def db_for_write(self, model) -> Optional[str]:
+        return None
+
+
+async def check() -> None:
+    """Записать heartbeat в основную базу и обновить список свежих реплик."""
+    now = time.time()
+    await Tortoise.get_connection("default").execute_query(HEARTBEAT_SQL, [now])
+
+    fresh = []
+    for name in REPLICAS:
+        try:
+            rows = await Tortoise.get_connection(name).execute_query_dict(
+                "SELECT at FROM replica_heartbeat WHERE id = 1"
+            )
+        except Exception as exc:
+            log.warning("Replica %s is unavailable: %s", name, exc)
+            REPLICA_LAG.labels(name).set(float("inf"))
+            continue
+        lag = max(0.0, now - rows[0]["at"]) if rows else float("inf")
+        REPLICA_LAG.labels(name).set(lag)
+        if lag <= REPLICA_MAX_LAG:
+            fresh.append(name)
+    _fresh[:] = fresh
+
+
+async def monitor() -> None:
+    while True:
+        try:
+            await check()
+        except Exception:
+            log.exception("Replica check failed")
+            _fresh.clear()
+        await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+
+def primary_pinned(scope) -> bool:
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            cookie = SimpleCookie(value.decode("latin-1")).get(PRIMARY_COOKIE)
+            if cookie is not None:
+                try:
+                    return float(cookie.value) > time.time()
+                except ValueError:
+                    return False
+    return False
+
+
+class ReplicaMiddleware:
+    """ASGI-middleware: GET читают с реплики, после записи клиент читает из основной базы."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled():
+            return await self.app(scope, receive, send)
+
+        if scope["method"] in READ_METHODS:
+            token = _read_replica.set(not primary_pinned(scope))
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                _read_replica.reset(token)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + REPLICA_MAX_LAG
+                cookie = f"{PRIMARY_COOKIE}={until:.3f}; Max-Age={int(REPLICA_MAX_LAG) + 1}; Path=/"
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"set-cookie", cookie.encode("latin-1")),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,170 @@
+import asyncio
+import os
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional, Tuple, Type
+
+import orjson
+from fastapi import HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter, create_model
+from tortoise.models import Model
+from tortoise.queryset import QuerySet
+
+from app.concurrency import VERSION_FIELD, etag
+from app.counts import total_count
+
+# Списки длиннее LIST_STREAM_CHUNK строк отдаются потоком по столько же
+# строк; 0 отключает потоковую выдачу
+LIST_STREAM_CHUNK = int(os.getenv("LIST_STREAM_CHUNK", "2000"))
+
+
+@lru_cache(maxsize=None)
+def list_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[schema])
+
+
+def selected_fields(
+        fields: Optional[str] = Query(
+            None, description="Comma-separated fields to return, all by default"
+        )
+) -> Optional[List[str]]:
+    """Зависимость для ?fields=a,b,c: список полей или None, если не задан."""
+    if fields is None:
+        return None
+    return [name.strip() for name in fields.split(",") if name.strip()]
+
+
+def schema_fields(schema: Type[BaseModel], fields: Optional[List[str]] = None) -> List[str]:
+    if not fields:
+        return list(schema.model_fields)
+    unknown = [name for name in fields if name not in schema.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(fields))
+
+
+@lru_cache(maxsize=256)
+def partial_schema(schema: Type[BaseModel], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """Схема только с выбранными полями тех же типов."""
+    return create_model(
+        f"{schema.__name__}Partial",
+        **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in fields}
+    )
+
+
+def response_schema(schema: Type[BaseModel], fields: Optional[List[str]]) -> Tuple[Type[BaseModel], List[str]]:
+    names = schema_fields(schema, fields)
+    if not fields:
+        return schema, names
+    return partial_schema(schema, tuple(names)), names
+
+
+async def list_response(query: QuerySet, schema: Type[BaseModel],
+                        fields: Optional[List[str]] = None, count: bool = False):
+    """
+    Список строк схемы без построения ORM-объектов: колонки берутся через
+    .values(), весь список проверяется одним вызовом TypeAdapter, а в JSON
+    кодируются сами строки - asyncpg уже отдаёт их в нужных типах. fields
+    сужает и SELECT, и проверяемую схему.
+
+    Если строк больше LIST_STREAM_CHUNK, ответ идёт потоком (chunked JSON
+    array): следующие страницы читаются по первичному ключу после
+    последнего отданного, так что в памяти одна страница, а клиент
+    получает первые строки, не дожидаясь последних.
+
+    count добавляет X-Total-Count (см. app.counts); число считается
+    параллельно с первой страницей.
+    """
+    target, names = response_schema(schema, fields)
+    if count:
+        total, response = await asyncio.gather(total_count(query), list_response(query, schema, fields))
+        response.headers["X-Total-Count"] = str(total[0])
+        response.headers["X-Total-Count-Estimated"] = "true" if total[1] else "false"
+        return response
+    if LIST_STREAM_CHUNK <= 0 or query._orderings:
+        # Страницы по ключу возможны только при порядке по ключу
+        rows = await query.values(*names)
+        list_adapter(target).validate_python(rows)
+        return ORJSONResponse(rows)
+
+    pk = query.model._meta.pk_attr
+    columns = names if pk in names else [*names, pk]
+    limit = query._limit
+    page_size = LIST_STREAM_CHUNK if limit is None else min(LIST_STREAM_CHUNK, limit)
+    query = query.order_by(pk)
+    rows = await query.limit(page_size).values(*columns)
+    if len(rows) < page_size or page_size == limit:
+        return ORJSONResponse(checked_page(rows, target, names))
+    return StreamingResponse(
+        stream_pages(query, rows, target, columns, page_size, limit),
+        media_type="application/json"
+    )
+
+
+def checked_page(rows: List[dict], schema: Type[BaseModel], names: List[str]) -> List[dict]:
+    if rows and len(rows[0]) != len(names):
+        # Первичный ключ выбирался только для следующей страницы
+        rows = [{name: row[name] for name in names} for row in rows]
+    list_adapter(schema).validate_python(rows)
+    return rows
+
+
+async def stream_pages(query: QuerySet, rows: List[dict], schema: Type[BaseModel], columns: List[str],
+                       page_size: int, limit: Optional[int]) -> AsyncIterator[bytes]:
+    """
+    Части JSON-массива: первая страница уже прочитана. Страницы читаются
+    отдельными запросами, поэтому список не снимок на один момент: строки,
+    добавленные во время выдачи, могут попасть в его конец.
+    """
+    pk = query.model._meta.pk_attr
+    names = list(schema.model_fields)
+    sent = 0
+    yield b"["
+    while rows:
+        last = rows[-1][pk]
+        page = orjson.dumps(checked_page(rows, schema, names))[1:-1]
+        yield page if not sent else b"," + page
+        sent += len(rows)
+        size = page_size if limit is None else min(page_size, limit - sent)
+        if len(rows) < page_size or size <= 0:
+            break
+        rows = await query.filter(**{f"{pk}__gt": last}).offset(0).limit(size).values(*columns)
+    yield b"]"
+
+
+async def row_response(query: QuerySet, schema: Type[BaseModel],
+                       fields: Optional[List[str]] = None) -> Optional[ORJSONResponse]:
+    """
+    Первая строка запроса в виде ответа или None, если строк нет. Версия
+    строки, если она выбрана, дублируется в ETag для If-Match.
+    """
+    target, names = response_schema(schema, fields)
+    row = await query.first().values(*names)
+    if row is None:
+        return None
+    response = dict_response(row, target)
+    if VERSION_FIELD in row:
+        response.headers["ETag"] = etag(row[VERSION_FIELD])
+    return response
+
+
+def dict_response(row: dict, schema: Type[BaseModel],
+                  fields: Optional[List[str]] = None) -> ORJSONResponse:
+    target, names = response_schema(schema, fields)
+    row = {name: row[name] for name in names}
+    target.model_validate(row)
+    return ORJSONResponse(row)
+
+
+def rows_response(rows: List[dict], schema: Type[BaseModel],
+                  fields: Optional[List[str]] = None) -> ORJSONResponse:
+    """Ответ по уже загруженным строкам, например из архива."""
+    target, names = response_schema(schema, fields)
+    rows = [{name: row[name] for name in names} for row in rows]
+    list_adapter(target).validate_python(rows)
+    return ORJSONResponse(rows)
+
+
+def model_response(obj: Model, schema: Type[BaseModel]) -> ORJSONResponse:
+    """Ответ по уже загруженному объекту, например после create или save."""
+    return ORJSONResponse(schema.model_validate(obj).model_dump())
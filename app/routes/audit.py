@@ -0,0 +1,26 @@
+from typing import List
+
+from fastapi import APIRouter, Query
+from fastapi.responses import ORJSONResponse
+
+from app import audit, sync
+from app.schemas import AuditEntrySchema
+
+router = APIRouter(
+    prefix="/audit",
+    tags=["audit"]
+)
+
+
+@router.get("", response_model=List[AuditEntrySchema])
+async def get_audit(
+        resource: str = Query(..., description="Resource name, e.g. batches or finished-products"),
+        id: int = Query(..., description="Record id"),
+        skip: int = Query(0, ge=0),
+        limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    История изменений записи: кто и когда менял поля (прежние и новые
+    значения) или удалил её, новые изменения первыми
+    """
+    return ORJSONResponse(await audit.history(sync.resource_name(resource), id, limit, skip))
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+
+from app.balance import get_plant_balance
+from app.schemas import PlantBalanceSchema
+
+router = APIRouter(
+    prefix="/balance",
+    tags=["balance"]
+)
+
+
+@router.get("", response_model=PlantBalanceSchema)
+async def get_balance():
+    """
+    Материальный баланс по всем заказам: план, выдавленное, брак, резка и
+    готовая продукция, итог по заводу. Только рабочие таблицы: заказы из
+    архива не входят, их баланс - GET /orders/{order_id}/balance
+    """
+    return ORJSONResponse(await get_plant_balance())
@@ -1,19 +1,31 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Header
 from typing import List, Optional
 
+from tortoise import Tortoise
+from tortoise.transactions import in_transaction
+
+from app import audit, balance
+from app.cachebus import invalidates
+from app.concurrency import expected_version, reject_nulls, versioned_update
+from app.counts import count_requested
 from app.models import Batches, Orders
-from app.schemas import BatchSchema, BatchCreate, BatchUpdate
+from app.responses import list_response, row_response, model_response, selected_fields
+from app.schemas import (BatchSchema, BatchCreate, BatchUpdate, BatchBulkUpdate,
+                         BatchBulkResultSchema)
 
 router = APIRouter(
     prefix="/batches",
-    tags=["batches"]
+    tags=["batches"],
+    dependencies=[Depends(invalidates("batches"))]
 )
 
 
 @router.get("/", response_model=List[BatchSchema])
 async def get_all_batches(
         order_id: Optional[int] = None,
-        batch_status: Optional[str] = None
+        batch_status: Optional[str] = None,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     """
     Получить все партии с возможностью фильтрации:
@@ -27,21 +39,21 @@ async def get_all_batches(
     if batch_status:
         query = query.filter(batchStatus__icontains=batch_status)
 
-    return await BatchSchema.from_queryset(query)
+    return await list_response(query, BatchSchema, fields, count)
 
 
 @router.get("/{batch_id}", response_model=BatchSchema)
-async def get_batch(batch_id: int):
+async def get_batch(batch_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
     """
     Получить конкретную партию по ID
     """
-    batch = await Batches.get_or_none(batch_id=batch_id)
-    if not batch:
+    response = await row_response(Batches.filter(batch_id=batch_id), BatchSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Batch with id {batch_id} not found"
         )
-    return await BatchSchema.from_tortoise_orm(batch)
+    return response
 
 
 @router.post("/", response_model=BatchSchema)
@@ -61,26 +73,75 @@ async def create_batch(batch: BatchCreate):
         **batch_dict,
         order_id=batch.order_id
     )
-    return await BatchSchema.from_tortoise_orm(batch_obj)
+    return model_response(batch_obj, BatchSchema)
 
 
-@router.put("/{batch_id}", response_model=BatchSchema)
-async def update_batch(batch_id: int, batch_data: BatchUpdate):
+@router.patch("/bulk", response_model=BatchBulkResultSchema)
+async def bulk_update_batches(data: BatchBulkUpdate):
     """
-    Обновить информацию о партии
+    Изменить поля update у партий из списка ids или подходящих под filter
+    (order_id и/или текущий batchStatus) одним UPDATE. Возвращает
+    идентификаторы изменённых партий. Закрытым партиям заполняются
+    пустые accepted, acceptedPCS и deviation из материального баланса.
     """
-    batch = await Batches.get_or_none(batch_id=batch_id)
-    if not batch:
+    changes = data.update.model_dump(exclude_unset=True, exclude={"version"})
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    reject_nulls(Batches, changes)
+    conditions = data.filter.model_dump(exclude_none=True) if data.filter else {}
+    if (data.ids is None) == (not conditions):
         raise HTTPException(
-            status_code=404,
-            detail=f"Batch with id {batch_id} not found"
+            status_code=400,
+            detail="Specify either ids or a non-empty filter"
         )
+    if data.ids == []:
+        return {"updated": 0, "ids": []}
+
+    postgres = Tortoise.get_connection("default").capabilities.dialect == "postgres"
+    values = []
+
+    def param(value) -> str:
+        values.append(value)
+        return f"${len(values)}" if postgres else "?"
+
+    assignments = ", ".join(f'"{field}" = {param(value)}' for field, value in changes.items())
+    # Массовое изменение тоже меняет версию, иначе его не заметят правки с If-Match
+    assignments += ', "version" = "version" + 1'
+    if data.ids is not None:
+        if postgres:
+            where = f"batch_id = ANY({param(data.ids)})"
+        else:
+            where = f"batch_id IN ({', '.join(param(batch_id) for batch_id in data.ids)})"
+    else:
+        where = " AND ".join(f'"{field}" = {param(value)}' for field, value in conditions.items())
+
+    async with in_transaction() as tx:
+        rows, old = await audit.update_rows(tx, "batches", "batch_id", assignments, where, values, list(changes))
+        ids = sorted(row["batch_id"] for row in rows)
+        if changes.get("completionDate") is not None:
+            await balance.fill_closed(tx, ids)
+    for row in rows:
+        audit.record("batches", row["batch_id"], "update", old[row["batch_id"]],
+                     {field: row[field] for field in changes})
+    return {"updated": len(ids), "ids": ids}
 
-    update_data = batch_data.model_dump(exclude_unset=True)
-    await batch.update_from_dict(update_data)
-    await batch.save()
 
-    return await BatchSchema.from_tortoise_orm(batch)
+@router.put("/{batch_id}", response_model=BatchSchema)
+async def update_batch(
+        batch_id: int,
+        batch_data: BatchUpdate,
+        if_match: Optional[str] = Header(None)
+):
+    """
+    Обновить информацию о партии. Если передана версия (If-Match или
+    поле version), изменение применяется только к этой версии, иначе 409.
+    При закрытии партии (completionDate) пустые accepted, acceptedPCS и
+    deviation заполняются из материального баланса
+    """
+    version = expected_version(if_match, batch_data.version)
+    update_data = batch_data.model_dump(exclude_unset=True, exclude={"version"})
+    await balance.fill_on_close(batch_id, update_data)
+    return await versioned_update(Batches, batch_id, update_data, version, BatchSchema, "Batch")
 
 
 @router.delete("/{batch_id}", response_model=dict)
@@ -88,8 +149,7 @@ async def delete_batch(batch_id: int):
     """
     Удалить партию по ID
     """
-    deleted_count = await Batches.filter(batch_id=batch_id).delete()
-    if not deleted_count:
+    if not await audit.delete_row(Batches, batch_id):
         raise HTTPException(
             status_code=404,
             detail=f"Batch with id {batch_id} not found"
@@ -98,7 +158,11 @@ async def delete_batch(batch_id: int):
 
 
 @router.get("/order/{order_id}", response_model=List[BatchSchema])
-async def get_batches_by_order(order_id: int):
+async def get_batches_by_order(
+        order_id: int,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
+):
     """
     Получить все партии для конкретного заказа
     """
@@ -108,5 +172,4 @@ async def get_batches_by_order(order_id: int):
             detail=f"Order with id {order_id} not found"
         )
 
-    batches = await Batches.filter(order_id=order_id)
-    return await BatchSchema.from_queryset(batches)
+    return await list_response(Batches.filter(order_id=order_id), BatchSchema, fields, count)
@@ -1,13 +1,19 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends, Header
 from typing import List, Optional
 from datetime import date
 
+from app import audit, norms
+from app.cachebus import invalidates
+from app.concurrency import expected_version, versioned_update
+from app.counts import count_requested
 from app.models import Cutting, Batches, Equipment
+from app.responses import list_response, row_response, model_response, selected_fields
 from app.schemas import CuttingSchema, CuttingCreate, CuttingUpdate
 
 router = APIRouter(
     prefix="/cutting",
-    tags=["cutting"]
+    tags=["cutting"],
+    dependencies=[Depends(invalidates("cutting"))]
 )
 
 
@@ -19,7 +25,9 @@ async def get_all_cuttings(
         start_date: Optional[date] = Query(None, description="Filter by start date"),
         end_date: Optional[date] = Query(None, description="Filter by end date"),
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     """
     Получить все записи резки с возможностью фильтрации:
@@ -42,18 +50,18 @@ async def get_all_cuttings(
     if end_date:
         query = query.filter(startDate__lte=end_date)
 
-    return await CuttingSchema.from_queryset(query)
+    return await list_response(query, CuttingSchema, fields, count)
 
 
 @router.get("/{cutting_id}", response_model=CuttingSchema)
-async def get_cutting(cutting_id: int):
-    cutting = await Cutting.get_or_none(cutting_ID=cutting_id).prefetch_related("batch", "equipment")
-    if not cutting:
+async def get_cutting(cutting_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Cutting.filter(cutting_ID=cutting_id), CuttingSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Cutting record with id {cutting_id} not found"
         )
-    return await CuttingSchema.from_tortoise_orm(cutting)
+    return response
 
 
 @router.post("/", response_model=CuttingSchema)
@@ -71,28 +79,32 @@ async def create_cutting(cutting: CuttingCreate):
             detail=f"Equipment with id {cutting.equipment_id} does not exist"
         )
 
+    # Без нормы подставляется рекомендованная по истории смен (app.norms)
+    if cutting.norm is None:
+        cutting.norm = await norms.default_norm("cutting", cutting.batch_id, cutting.equipment_id)
+        if cutting.norm is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"No recommended norm for equipment {cutting.equipment_id}, specify norm explicitly"
+            )
+
     cutting_dict = cutting.model_dump(exclude={"batch_id", "equipment_id"})
     cutting_obj = await Cutting.create(
         **cutting_dict,
         batch_id=cutting.batch_id,
         equipment_id=cutting.equipment_id
     )
-    return await CuttingSchema.from_tortoise_orm(cutting_obj)
+    return model_response(cutting_obj, CuttingSchema)
 
 
 @router.put("/{cutting_id}", response_model=CuttingSchema)
 async def update_cutting(
         cutting_id: int,
-        cutting_data: CuttingUpdate
+        cutting_data: CuttingUpdate,
+        if_match: Optional[str] = Header(None)
 ):
-    cutting = await Cutting.get_or_none(cutting_ID=cutting_id)
-    if not cutting:
-        raise HTTPException(
-            status_code=404,
-            detail=f"Cutting record with id {cutting_id} not found"
-        )
-
-    update_data = cutting_data.model_dump(exclude_unset=True)
+    version = expected_version(if_match, cutting_data.version)
+    update_data = cutting_data.model_dump(exclude_unset=True, exclude={"version"})
 
     # Проверяем обновление связанных записей
     if "batch_id" in update_data:
@@ -109,10 +121,8 @@ async def update_cutting(
                 detail=f"Equipment with id {update_data['equipment_id']} does not exist"
             )
 
-    await cutting.update_from_dict(update_data)
-    await cutting.save()
-
-    return await CuttingSchema.from_tortoise_orm(cutting)
+    # Проверка версии и запись одним запросом, без блокировки строки
+    return await versioned_update(Cutting, cutting_id, update_data, version, CuttingSchema, "Cutting record")
 
 
 @router.delete("/{cutting_id}", response_model=dict)
@@ -133,4 +143,5 @@ async def delete_cutting(cutting_id: int):
         )
 
     await cutting.delete()
+    audit.record_delete(cutting)
     return {"message": f"Cutting record {cutting_id} deleted successfully"}
@@ -0,0 +1,22 @@
+from typing import List
+
+from fastapi import APIRouter
+
+from app import slowlog
+from app.schemas import SlowQuerySchema
+
+router = APIRouter(
+    prefix="/debug",
+    tags=["debug"]
+)
+
+
+@router.get("/slow-queries", response_model=List[SlowQuerySchema])
+async def get_slow_queries():
+    return slowlog.entries()
+
+
+@router.delete("/slow-queries")
+async def clear_slow_queries():
+    slowlog.clear()
+    return {"message": "Slow query log cleared"}
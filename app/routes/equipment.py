@@ -1,19 +1,26 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends
+from typing import List, Optional
 
+from app import audit
+from app.cachebus import invalidates
+from app.counts import count_requested
 from app.models import Equipment
+from app.responses import list_response, row_response, model_response, selected_fields
 from app.schemas import EquipmentSchema, EquipmentCreate, EquipmentUpdate
 
 router = APIRouter(
     prefix="/equipment",
-    tags=["equipment"]
+    tags=["equipment"],
+    dependencies=[Depends(invalidates("equipment"))]
 )
 
 
 @router.get("/", response_model=List[EquipmentSchema])
 async def get_all_equipment(
         name: str = None,
-        description: str = None
+        description: str = None,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     query = Equipment.all()
 
@@ -22,18 +29,18 @@ async def get_all_equipment(
     if description:
         query = query.filter(description__icontains=description)
 
-    return await EquipmentSchema.from_queryset(query)
+    return await list_response(query, EquipmentSchema, fields, count)
 
 
 @router.get("/{equipment_id}", response_model=EquipmentSchema)
-async def get_equipment(equipment_id: int):
-    equipment = await Equipment.get_or_none(equipment_ID=equipment_id)
-    if not equipment:
+async def get_equipment(equipment_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Equipment.filter(equipment_ID=equipment_id), EquipmentSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Equipment with id {equipment_id} not found"
         )
-    return await EquipmentSchema.from_tortoise_orm(equipment)
+    return response
 
 
 @router.post("/", response_model=EquipmentSchema)
@@ -46,7 +53,7 @@ async def create_equipment(equipment: EquipmentCreate):
         )
 
     equipment_obj = await Equipment.create(**equipment.model_dump())
-    return await EquipmentSchema.from_tortoise_orm(equipment_obj)
+    return model_response(equipment_obj, EquipmentSchema)
 
 
 @router.put("/{equipment_id}", response_model=EquipmentSchema)
@@ -70,10 +77,12 @@ async def update_equipment(
             )
 
     update_data = equipment_data.model_dump(exclude_unset=True)
+    before = audit.snapshot(equipment, update_data)
     await equipment.update_from_dict(update_data)
     await equipment.save()
+    audit.record_update(equipment, before)
 
-    return await EquipmentSchema.from_tortoise_orm(equipment)
+    return model_response(equipment, EquipmentSchema)
 
 
 @router.delete("/{equipment_id}", response_model=dict)
@@ -93,8 +102,7 @@ async def delete_equipment(equipment_id: int):
             detail="Cannot delete equipment that is in use"
         )
 
-    deleted_count = await Equipment.filter(equipment_ID=equipment_id).delete()
-    if not deleted_count:
+    if not await audit.delete_row(Equipment, equipment_id):
         raise HTTPException(
             status_code=404,
             detail=f"Equipment with id {equipment_id} not found"
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import List, Optional
 from datetime import date
 
+from app import audit, balance
+from app.cachebus import invalidates
+from app.counts import count_requested
 from app.models import Extrusion, Winding, Workers
+from app.responses import list_response, row_response, model_response, selected_fields
 from app.schemas import ExtrusionSchema, ExtrusionCreate, ExtrusionUpdate
 
 router = APIRouter(
     prefix="/extrusion",
-    tags=["extrusion"]
+    tags=["extrusion"],
+    dependencies=[Depends(invalidates("extrusion"))]
 )
 
 
@@ -18,7 +23,9 @@ async def get_all_extrusions(
         start_date: Optional[date] = Query(None, description="Filter by start date"),
         end_date: Optional[date] = Query(None, description="Filter by end date"),
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     """
     Получить все записи экструзии с возможностью фильтрации:
@@ -38,18 +45,18 @@ async def get_all_extrusions(
     if end_date:
         query = query.filter(date__lte=end_date)
 
-    return await ExtrusionSchema.from_queryset(query)
+    return await list_response(query, ExtrusionSchema, fields, count)
 
 
 @router.get("/{extrusion_id}", response_model=ExtrusionSchema)
-async def get_extrusion(extrusion_id: int):
-    extrusion = await Extrusion.get_or_none(extrusion_ID=extrusion_id).prefetch_related("winding", "worker")
-    if not extrusion:
+async def get_extrusion(extrusion_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Extrusion.filter(extrusion_ID=extrusion_id), ExtrusionSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Extrusion record with id {extrusion_id} not found"
         )
-    return await ExtrusionSchema.from_tortoise_orm(extrusion)
+    return response
 
 
 @router.post("/", response_model=ExtrusionSchema)
@@ -73,7 +80,8 @@ async def create_extrusion(extrusion: ExtrusionCreate):
         winding_id=extrusion.winding_id,
         worker_id=extrusion.worker_id
     )
-    return await ExtrusionSchema.from_tortoise_orm(extrusion_obj)
+    await balance.forget_batches("extrusion", [extrusion_obj.winding_id])
+    return model_response(extrusion_obj, ExtrusionSchema)
 
 
 @router.put("/{extrusion_id}", response_model=ExtrusionSchema)
@@ -105,10 +113,14 @@ async def update_extrusion(
                 detail=f"Worker with id {update_data['worker_id']} does not exist"
             )
 
+    winding_id = extrusion.winding_id
+    before = audit.snapshot(extrusion, update_data)
     await extrusion.update_from_dict(update_data)
     await extrusion.save()
+    audit.record_update(extrusion, before)
+    await balance.forget_batches("extrusion", [winding_id, extrusion.winding_id])
 
-    return await ExtrusionSchema.from_tortoise_orm(extrusion)
+    return model_response(extrusion, ExtrusionSchema)
 
 
 @router.delete("/{extrusion_id}", response_model=dict)
@@ -129,4 +141,6 @@ async def delete_extrusion(extrusion_id: int):
         )
 
     await extrusion.delete()
+    audit.record_delete(extrusion)
+    await balance.forget_batches("extrusion", [extrusion.winding_id])
     return {"message": f"Extrusion record {extrusion_id} deleted successfully"}
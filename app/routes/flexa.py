@@ -1,13 +1,18 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import List, Optional
 from datetime import date
 
+from app import audit, balance
+from app.cachebus import invalidates
+from app.counts import count_requested
 from app.models import Flexa, Printing, Workers
+from app.responses import list_response, row_response, model_response, selected_fields
 from app.schemas import FlexaSchema, FlexaCreate, FlexaUpdate
 
 router = APIRouter(
     prefix="/flexa",
-    tags=["flexa"]
+    tags=["flexa"],
+    dependencies=[Depends(invalidates("flexa"))]
 )
 
 
@@ -18,7 +23,9 @@ async def get_all_flexa(
         date_from: Optional[date] = Query(None, description="Filter by date from"),
         date_to: Optional[date] = Query(None, description="Filter by date to"),
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     """
     Получить все записи флексопечати с возможностью фильтрации:
@@ -38,18 +45,18 @@ async def get_all_flexa(
     if date_to:
         query = query.filter(date__lte=date_to)
 
-    return await FlexaSchema.from_queryset(query)
+    return await list_response(query, FlexaSchema, fields, count)
 
 
 @router.get("/{flexa_id}", response_model=FlexaSchema)
-async def get_flexa(flexa_id: int):
-    flexa = await Flexa.get_or_none(flexa_ID=flexa_id).prefetch_related("printing", "worker")
-    if not flexa:
+async def get_flexa(flexa_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Flexa.filter(flexa_ID=flexa_id), FlexaSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Flexa record with id {flexa_id} not found"
         )
-    return await FlexaSchema.from_tortoise_orm(flexa)
+    return response
 
 
 @router.post("/", response_model=FlexaSchema)
@@ -73,7 +80,8 @@ async def create_flexa(flexa: FlexaCreate):
         printing_id=flexa.printing_id,
         worker_id=flexa.worker_id
     )
-    return await FlexaSchema.from_tortoise_orm(flexa_obj)
+    await balance.forget_batches("flexa", [flexa_obj.printing_id])
+    return model_response(flexa_obj, FlexaSchema)
 
 
 @router.put("/{flexa_id}", response_model=FlexaSchema)
@@ -105,18 +113,23 @@ async def update_flexa(
                 detail=f"Worker with id {update_data['worker_id']} does not exist"
             )
 
+    printing_id = flexa.printing_id
+    before = audit.snapshot(flexa, update_data)
     await flexa.update_from_dict(update_data)
     await flexa.save()
+    audit.record_update(flexa, before)
+    await balance.forget_batches("flexa", [printing_id, flexa.printing_id])
 
-    return await FlexaSchema.from_tortoise_orm(flexa)
+    return model_response(flexa, FlexaSchema)
 
 
 @router.delete("/{flexa_id}", response_model=dict)
 async def delete_flexa(flexa_id: int):
-    deleted_count = await Flexa.filter(flexa_ID=flexa_id).delete()
-    if not deleted_count:
+    row = await audit.delete_row(Flexa, flexa_id)
+    if not row:
         raise HTTPException(
             status_code=404,
             detail=f"Flexa record with id {flexa_id} not found"
         )
+    await balance.forget_batches("flexa", [row["printing_id"]])
     return {"message": f"Flexa record {flexa_id} deleted successfully"}
@@ -1,13 +1,18 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import List, Optional
 from datetime import date
 
+from app import audit, balance
+from app.cachebus import invalidates
+from app.counts import count_requested
 from app.models import FinishedProducts, Batches, Workers
+from app.responses import list_response, row_response, model_response, selected_fields
 from app.schemas import FinishedProductsSchema, FinishedProductsCreate, FinishedProductsUpdate
 
 router = APIRouter(
     prefix="/finished-products",
-    tags=["finished_products"]
+    tags=["finished_products"],
+    dependencies=[Depends(invalidates("finished_products"))]
 )
 
 
@@ -20,7 +25,9 @@ async def get_all_finished_products(
         min_quantity: Optional[int] = Query(None, description="Filter by minimum quantity"),
         max_quantity: Optional[int] = Query(None, description="Filter by maximum quantity"),
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     """
     Получить все записи готовой продукции с возможностью фильтрации:
@@ -45,19 +52,20 @@ async def get_all_finished_products(
     if max_quantity is not None:
         query = query.filter(quantity__lte=max_quantity)
 
-    return await FinishedProductsSchema.from_queryset(query)
+    return await list_response(query, FinishedProductsSchema, fields, count)
 
 
 @router.get("/{fproduct_id}", response_model=FinishedProductsSchema)
-async def get_finished_product(fproduct_id: int):
-    fproduct = await FinishedProducts.get_or_none(finishedProducts_ID=fproduct_id) \
-        .prefetch_related("batch", "worker")
-    if not fproduct:
+async def get_finished_product(fproduct_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(
+        FinishedProducts.filter(finishedProducts_ID=fproduct_id), FinishedProductsSchema
+    , fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Finished product with id {fproduct_id} not found"
         )
-    return await FinishedProductsSchema.from_tortoise_orm(fproduct)
+    return response
 
 
 @router.post("/", response_model=FinishedProductsSchema)
@@ -81,7 +89,8 @@ async def create_finished_product(fproduct: FinishedProductsCreate):
         batch_id=fproduct.batch_id,
         worker_id=fproduct.worker_id
     )
-    return await FinishedProductsSchema.from_tortoise_orm(fproduct_obj)
+    await balance.forget_batches("finished_products", [fproduct_obj.batch_id])
+    return model_response(fproduct_obj, FinishedProductsSchema)
 
 
 @router.put("/{fproduct_id}", response_model=FinishedProductsSchema)
@@ -113,18 +122,23 @@ async def update_finished_product(
                 detail=f"Worker with id {update_data['worker_id']} does not exist"
             )
 
+    batch_id = fproduct.batch_id
+    before = audit.snapshot(fproduct, update_data)
     await fproduct.update_from_dict(update_data)
     await fproduct.save()
+    audit.record_update(fproduct, before)
+    await balance.forget_batches("finished_products", [batch_id, fproduct.batch_id])
 
-    return await FinishedProductsSchema.from_tortoise_orm(fproduct)
+    return model_response(fproduct, FinishedProductsSchema)
 
 
 @router.delete("/{fproduct_id}", response_model=dict)
 async def delete_finished_product(fproduct_id: int):
-    deleted_count = await FinishedProducts.filter(finishedProducts_ID=fproduct_id).delete()
-    if not deleted_count:
+    row = await audit.delete_row(FinishedProducts, fproduct_id)
+    if not row:
         raise HTTPException(
             status_code=404,
             detail=f"Finished product with id {fproduct_id} not found"
         )
+    await balance.forget_batches("finished_products", [row["batch_id"]])
     return {"message": f"Finished product {fproduct_id} deleted successfully"}
@@ -1,30 +1,99 @@
-from fastapi import APIRouter, HTTPException
+from collections import Counter
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, UploadFile, Depends, Query
+from fastapi.responses import ORJSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from tortoise.transactions import in_transaction
+
+from app import archive, audit, balance, importer
+from app.cachebus import invalidates
+from app.counts import count_requested
+from app.forecast import RISKS, forecaster
 from app.models import Orders, Batches
-from app.schemas import OrderSchema, OrderCreate, OrderUpdate, BatchSchema
+from app.responses import (list_response, row_response, dict_response, rows_response, model_response,
+                           selected_fields)
+from app.schemas import (OrderSchema, OrderCreate, OrderUpdate, BatchSchema, OrderImportSchema,
+                         OrderBulkResultSchema, OrderForecastSchema, OrderBalanceSchema)
 
-router = APIRouter(prefix="/orders", tags=["Orders"])
+router = APIRouter(prefix="/orders", tags=["Orders"], dependencies=[Depends(invalidates("orders"))])
 
 
 # Получить все заказы
 @router.get("/", response_model=list[OrderSchema])
-async def get_orders():
-    return await Orders.all()
+async def get_orders(
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
+):
+    return await list_response(Orders.all(), OrderSchema, fields, count)
+
+
+# Прогноз завершения открытых заказов; объявлен до /{order_id}.
+# Отдаётся последний рассчитанный прогноз, см. app.forecast
+@router.get("/forecast", response_model=list[OrderForecastSchema])
+async def get_orders_forecast(
+        risk: Optional[str] = Query(None, pattern=f"^({'|'.join(RISKS)})$", description="Filter by risk")
+):
+    result = await forecaster.current()
+    headers = {"X-Forecast-Computed-At": forecaster.computed_at.isoformat()}
+    if risk is None:
+        return Response(forecaster.body, media_type="application/json", headers=headers)
+    return ORJSONResponse([row for row in result if row["risk"] == risk], headers=headers)
 
 
 # Получить заказ по ID
 @router.get("/{order_id}", response_model=OrderSchema)
-async def get_order(order_id: int):
-    order = await Orders.get_or_none(order_id=order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    return order
+async def get_order(order_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Orders.filter(order_id=order_id), OrderSchema, fields)
+    if response is None:
+        # Закрытые заказы могли быть перенесены в архив
+        archived = await run_in_threadpool(archive.find_records, "orders", order_id)
+        if not archived:
+            raise HTTPException(status_code=404, detail="Order not found")
+        return dict_response(archived[0], OrderSchema, fields)
+    return response
 
 
 # Создать новый заказ
 @router.post("/", response_model=OrderSchema)
 async def create_order(order_data: OrderCreate):
     order = await Orders.create(**order_data.model_dump())
-    return order
+    return model_response(order, OrderSchema)
+
+
+# Загрузить заказы из CSV/XLSX с колонками OrderBase. По умолчанию файл
+# загружается целиком или не загружается вовсе; с partial=true строки
+# с ошибками пропускаются, остальные сохраняются.
+@router.post("/import", response_model=OrderImportSchema)
+async def import_orders(file: UploadFile, partial: bool = False):
+    try:
+        async with in_transaction() as tx:
+            report = await importer.import_orders(tx, file.filename, file.file, partial)
+            if report["error_count"] and not partial:
+                raise HTTPException(status_code=422, detail=report)
+    except importer.READ_ERRORS as exc:
+        raise HTTPException(status_code=400, detail=f"Cannot import {file.filename}: {exc}")
+    return report
+
+
+# Создать или обновить заказы по orderNumber одним запросом на пачку.
+# Повторная отправка тех же данных ничего не меняет (unchanged).
+@router.put("/bulk", response_model=OrderBulkResultSchema)
+async def upsert_orders(orders: List[OrderCreate]):
+    duplicates = [number for number, count in Counter(order.orderNumber for order in orders).items()
+                  if count > 1]
+    if duplicates:
+        raise HTTPException(
+            status_code=400, detail=f"Duplicate orderNumber in request: {', '.join(duplicates)}"
+        )
+
+    updates = []
+    async with in_transaction() as tx:
+        result = await importer.upsert_orders(tx, orders, updates)
+    # В журнал - только зафиксированные изменения
+    for order_id, before, after in updates:
+        audit.record("orders", order_id, "update", before, after)
+    return result
 
 
 # Обновить заказ по ID
@@ -34,9 +103,12 @@ async def update_order(order_id: int, order_data: OrderUpdate):
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
 
-    await order.update_from_dict(order_data.model_dump(exclude_unset=True))
+    update_data = order_data.model_dump(exclude_unset=True)
+    before = audit.snapshot(order, update_data)
+    await order.update_from_dict(update_data)
     await order.save()
-    return order
+    audit.record_update(order, before)
+    return model_response(order, OrderSchema)
 
 
 # Удалить заказ по ID
@@ -47,15 +119,32 @@ async def delete_order(order_id: int):
         raise HTTPException(status_code=404, detail="Order not found")
 
     await order.delete()
+    audit.record_delete(order)
     return {"message": "Order deleted successfully"}
 
 
 # Получить все партии для заказа
 @router.get("/{order_id}/batches", response_model=list[BatchSchema])
-async def get_batches_by_order(order_id: int):
-    order = await Orders.get_or_none(order_id=order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-
-    batches = await order.batches.all()
-    return batches
+async def get_batches_by_order(
+        order_id: int,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
+):
+    if not await Orders.exists(order_id=order_id):
+        archived = await run_in_threadpool(archive.load_order_tree, [order_id])
+        if not archived["orders"]:
+            raise HTTPException(status_code=404, detail="Order not found")
+        return rows_response(archived["batches"], BatchSchema, fields)
+
+    return await list_response(Batches.filter(order_id=order_id), BatchSchema, fields, count)
+
+
+# Материальный баланс заказа по партиям, см. app.balance
+@router.get("/{order_id}/balance", response_model=OrderBalanceSchema)
+async def get_order_balance(order_id: int):
+    result = await balance.get_order_balance(order_id)
+    if result is None:
+        if not await Orders.exists(order_id=order_id):
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise HTTPException(status_code=404, detail=f"Order {order_id} has no batches")
+    return ORJSONResponse(result)
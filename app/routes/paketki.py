@@ -1,13 +1,18 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import List, Optional
 from datetime import date
 
+from app import audit, balance
+from app.cachebus import invalidates
+from app.counts import count_requested
 from app.models import Paketki, Extrusion, Cutting, Workers
+from app.responses import list_response, row_response, model_response, selected_fields
 from app.schemas import PaketkiSchema, PaketkiCreate, PaketkiUpdate
 
 router = APIRouter(
     prefix="/paketki",
-    tags=["paketki"]
+    tags=["paketki"],
+    dependencies=[Depends(invalidates("paketki"))]
 )
 
 
@@ -19,7 +24,9 @@ async def get_all_paketki(
         date_from: Optional[date] = Query(None, description="Filter by date from"),
         date_to: Optional[date] = Query(None, description="Filter by date to"),
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     """
     Получить все записи с возможностью фильтрации:
@@ -42,18 +49,18 @@ async def get_all_paketki(
     if date_to:
         query = query.filter(date__lte=date_to)
 
-    return await PaketkiSchema.from_queryset(query)
+    return await list_response(query, PaketkiSchema, fields, count)
 
 
 @router.get("/{paketki_id}", response_model=PaketkiSchema)
-async def get_paketki(paketki_id: int):
-    paketki = await Paketki.get_or_none(paketki_ID=paketki_id).prefetch_related("extrusion", "cutting", "worker")
-    if not paketki:
+async def get_paketki(paketki_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Paketki.filter(paketki_ID=paketki_id), PaketkiSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Paketki record with id {paketki_id} not found"
         )
-    return await PaketkiSchema.from_tortoise_orm(paketki)
+    return response
 
 
 @router.post("/", response_model=PaketkiSchema)
@@ -84,7 +91,8 @@ async def create_paketki(paketki: PaketkiCreate):
         cutting_id=paketki.cutting_id,
         worker_id=paketki.worker_id
     )
-    return await PaketkiSchema.from_tortoise_orm(paketki_obj)
+    await balance.forget_batches("paketki", [paketki_obj.cutting_id])
+    return model_response(paketki_obj, PaketkiSchema)
 
 
 @router.put("/{paketki_id}", response_model=PaketkiSchema)
@@ -123,18 +131,23 @@ async def update_paketki(
                 detail=f"Worker with id {update_data['worker_id']} does not exist"
             )
 
+    cutting_id = paketki.cutting_id
+    before = audit.snapshot(paketki, update_data)
     await paketki.update_from_dict(update_data)
     await paketki.save()
+    audit.record_update(paketki, before)
+    await balance.forget_batches("paketki", [cutting_id, paketki.cutting_id])
 
-    return await PaketkiSchema.from_tortoise_orm(paketki)
+    return model_response(paketki, PaketkiSchema)
 
 
 @router.delete("/{paketki_id}", response_model=dict)
 async def delete_paketki(paketki_id: int):
-    deleted_count = await Paketki.filter(paketki_ID=paketki_id).delete()
-    if not deleted_count:
+    row = await audit.delete_row(Paketki, paketki_id)
+    if not row:
         raise HTTPException(
             status_code=404,
             detail=f"Paketki record with id {paketki_id} not found"
         )
+    await balance.forget_batches("paketki", [row["cutting_id"]])
     return {"message": f"Paketki record {paketki_id} deleted successfully"}
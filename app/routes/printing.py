@@ -1,13 +1,18 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends
 from tortoise.expressions import Q
 from typing import List, Optional
 
+from app import audit
+from app.cachebus import invalidates
+from app.counts import count_requested
 from app.models import Printing, Batches
+from app.responses import list_response, row_response, model_response, selected_fields
 from app.schemas import PrintingSchema, PrintingCreate, PrintingUpdate
 
 router = APIRouter(
     prefix="/printing",
-    tags=["printing"]
+    tags=["printing"],
+    dependencies=[Depends(invalidates("printing"))]
 )
 
 
@@ -17,7 +22,9 @@ async def get_all_printings(
         printing_min: Optional[float] = Query(None, description="Filter by min printing value"),
         printing_max: Optional[float] = Query(None, description="Filter by max printing value"),
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     """
     Получить все записи печати с возможностью фильтрации:
@@ -34,18 +41,18 @@ async def get_all_printings(
     if printing_max is not None:
         query = query.filter(printing__lte=printing_max)
 
-    return await PrintingSchema.from_queryset(query)
+    return await list_response(query, PrintingSchema, fields, count)
 
 
 @router.get("/{printing_id}", response_model=PrintingSchema)
-async def get_printing(printing_id: int):
-    printing = await Printing.get_or_none(printing_ID=printing_id).prefetch_related("batch", "flexa")
-    if not printing:
+async def get_printing(printing_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Printing.filter(printing_ID=printing_id), PrintingSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Printing record with id {printing_id} not found"
         )
-    return await PrintingSchema.from_tortoise_orm(printing)
+    return response
 
 
 @router.post("/", response_model=PrintingSchema)
@@ -61,7 +68,7 @@ async def create_printing(printing: PrintingCreate):
         **printing.model_dump(exclude={"batch_id"}),
         batch_id=printing.batch_id
     )
-    return await PrintingSchema.from_tortoise_orm(printing_obj)
+    return model_response(printing_obj, PrintingSchema)
 
 
 @router.put("/{printing_id}", response_model=PrintingSchema)
@@ -86,10 +93,12 @@ async def update_printing(
                 detail=f"Batch with id {update_data['batch_id']} does not exist"
             )
 
+    before = audit.snapshot(printing, update_data)
     await printing.update_from_dict(update_data)
     await printing.save()
+    audit.record_update(printing, before)
 
-    return await PrintingSchema.from_tortoise_orm(printing)
+    return model_response(printing, PrintingSchema)
 
 
 @router.delete("/{printing_id}", response_model=dict)
@@ -110,4 +119,5 @@ async def delete_printing(printing_id: int):
         )
 
     await printing.delete()
+    audit.record_delete(printing)
     return {"message": f"Printing record {printing_id} deleted successfully"}
@@ -0,0 +1,120 @@
+from functools import partial
+from typing import Callable, List, NamedTuple, Optional, Type
+
+import orjson
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ValidationError
+from tortoise.exceptions import IntegrityError
+
+from app import cachebus, sync
+from app.routes import (orders, batches, equipment, workers, winding, extrusion, cutting, paketki,
+                        printing, flexa, fproducts)
+from app.schemas import (SyncChangesSchema, SyncPush, SyncPushResultSchema, OrderCreate, OrderUpdate,
+                         BatchCreate, BatchUpdate, EquipmentCreate, EquipmentUpdate, WorkerCreate,
+                         WorkerUpdate, WindingCreate, WindingUpdate, ExtrusionCreate, ExtrusionUpdate,
+                         CuttingCreate, CuttingUpdate, PaketkiCreate, PaketkiUpdate, PrintingCreate,
+                         PrintingUpdate, FlexaCreate, FlexaUpdate, FinishedProductsCreate,
+                         FinishedProductsUpdate)
+
+router = APIRouter(
+    prefix="/sync",
+    tags=["sync"]
+)
+
+
+class Handlers(NamedTuple):
+    create: Callable
+    create_schema: Type[BaseModel]
+    update: Callable
+    update_schema: Type[BaseModel]
+    delete: Callable
+
+
+# Отложенные изменения проходят через те же обработчики, что и обычные
+# запросы: с теми же проверками, нормами по умолчанию и версиями.
+# Версия для If-Match передаётся полем version в data.
+HANDLERS = {
+    "orders": Handlers(orders.create_order, OrderCreate, orders.update_order, OrderUpdate,
+                       orders.delete_order),
+    "batches": Handlers(batches.create_batch, BatchCreate, partial(batches.update_batch, if_match=None),
+                        BatchUpdate, batches.delete_batch),
+    "equipment": Handlers(equipment.create_equipment, EquipmentCreate, equipment.update_equipment,
+                          EquipmentUpdate, equipment.delete_equipment),
+    "workers": Handlers(workers.create_worker, WorkerCreate, workers.update_worker, WorkerUpdate,
+                        workers.delete_worker),
+    "winding": Handlers(winding.create_winding, WindingCreate, partial(winding.update_winding, if_match=None),
+                        WindingUpdate, winding.delete_winding),
+    "extrusion": Handlers(extrusion.create_extrusion, ExtrusionCreate, extrusion.update_extrusion,
+                          ExtrusionUpdate, extrusion.delete_extrusion),
+    "cutting": Handlers(cutting.create_cutting, CuttingCreate, partial(cutting.update_cutting, if_match=None),
+                        CuttingUpdate, cutting.delete_cutting),
+    "paketki": Handlers(paketki.create_paketki, PaketkiCreate, paketki.update_paketki, PaketkiUpdate,
+                        paketki.delete_paketki),
+    "printing": Handlers(printing.create_printing, PrintingCreate, printing.update_printing,
+                         PrintingUpdate, printing.delete_printing),
+    "flexa": Handlers(flexa.create_flexa, FlexaCreate, flexa.update_flexa, FlexaUpdate, flexa.delete_flexa),
+    "finished_products": Handlers(fproducts.create_finished_product, FinishedProductsCreate,
+                                  fproducts.update_finished_product, FinishedProductsUpdate,
+                                  fproducts.delete_finished_product),
+}
+
+
+@router.get("", response_model=SyncChangesSchema)
+async def get_changes(
+        since: Optional[str] = Query(None, description="Token from the previous sync, empty for the first one"),
+        resources: Optional[str] = Query(None, description="Comma-separated resources, all by default"),
+        limit: int = Query(sync.SYNC_PAGE_SIZE, ge=1, le=50_000, description="Rows per resource per page")
+):
+    """
+    Строки, изменённые после since, и удалённые идентификаторы по всем
+    ресурсам; при more: true следующая страница запрашивается с token
+    """
+    names = [name.strip() for name in resources.split(",") if name.strip()] if resources else None
+    return ORJSONResponse(await sync.changes(since, names, limit))
+
+
+async def apply(operation) -> dict:
+    resource = sync.resource_name(operation.resource)
+    handlers = HANDLERS[resource]
+    if operation.action != "create" and operation.id is None:
+        raise HTTPException(status_code=400, detail=f"Operation {operation.action} needs id")
+
+    if operation.action == "create":
+        response = await handlers.create(handlers.create_schema.model_validate(operation.data or {}))
+    elif operation.action == "update":
+        response = await handlers.update(operation.id, handlers.update_schema.model_validate(operation.data or {}))
+    else:
+        response = await handlers.delete(operation.id)
+
+    if isinstance(response, Response):
+        return {"status": response.status_code, "body": orjson.loads(response.body)}
+    return {"status": 200, "body": response}
+
+
+@router.post("", response_model=SyncPushResultSchema)
+async def push_changes(push: SyncPush):
+    """
+    Изменения, накопленные планшетом без связи, по порядку. Каждое
+    применяется отдельно, как обычный запрос к ресурсу; ошибка одного не
+    останавливает следующие, результат - по каждому в том же порядке
+    """
+    results: List[dict] = []
+    touched = []
+    for operation in push.operations:
+        try:
+            result = await apply(operation)
+        except HTTPException as exc:
+            result = {"status": exc.status_code, "detail": exc.detail}
+        except ValidationError as exc:
+            result = {"status": 422, "detail": exc.errors(include_url=False, include_context=False)}
+        except IntegrityError as exc:
+            result = {"status": 409, "detail": str(exc)}
+        else:
+            touched.append(sync.resource_name(operation.resource))
+        results.append(result)
+
+    # Обработчики вызваны напрямую, мимо зависимостей их роутеров
+    if touched:
+        await cachebus.publish(*dict.fromkeys(touched))
+    return ORJSONResponse({"results": results})
@@ -0,0 +1,137 @@
+from typing import Dict, List
+
+from fastapi import APIRouter, HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app import archive, replicas
+from app.schemas import TraceSchema
+from app.trace import load_order_tree, load_workers
+
+router = APIRouter(
+    prefix="/trace",
+    tags=["trace"]
+)
+
+# Запрос, поднимающийся от записи к заказу(ам) по цепочке внешних ключей.
+# Пакеты связаны с заказом двумя путями: через резку и через экструзию.
+RESOLVE_SQL = {
+    "orders": 'SELECT order_id FROM orders WHERE order_id = $1',
+    "batches": 'SELECT order_id FROM batches WHERE batch_id = $1',
+    "winding": '''
+        SELECT b.order_id FROM winding w
+        JOIN batches b ON b.batch_id = w.batch_id
+        WHERE w."winding_ID" = $1''',
+    "cutting": '''
+        SELECT b.order_id FROM cutting c
+        JOIN batches b ON b.batch_id = c.batch_id
+        WHERE c."cutting_ID" = $1''',
+    "printing": '''
+        SELECT b.order_id FROM printing p
+        JOIN batches b ON b.batch_id = p.batch_id
+        WHERE p."printing_ID" = $1''',
+    "finished_products": '''
+        SELECT b.order_id FROM finished_products f
+        JOIN batches b ON b.batch_id = f.batch_id
+        WHERE f."finishedProducts_ID" = $1''',
+    "extrusion": '''
+        SELECT b.order_id FROM extrusion e
+        JOIN winding w ON w."winding_ID" = e.winding_id
+        JOIN batches b ON b.batch_id = w.batch_id
+        WHERE e."extrusion_ID" = $1''',
+    "flexa": '''
+        SELECT b.order_id FROM flexa f
+        JOIN printing p ON p."printing_ID" = f.printing_id
+        JOIN batches b ON b.batch_id = p.batch_id
+        WHERE f."flexa_ID" = $1''',
+    "paketki": '''
+        SELECT b.order_id FROM paketki pk
+        JOIN cutting c ON c."cutting_ID" = pk.cutting_id
+        JOIN batches b ON b.batch_id = c.batch_id
+        WHERE pk."paketki_ID" = $1
+        UNION
+        SELECT b.order_id FROM paketki pk
+        JOIN extrusion e ON e."extrusion_ID" = pk.extrusion_id
+        JOIN winding w ON w."winding_ID" = e.winding_id
+        JOIN batches b ON b.batch_id = w.batch_id
+        WHERE pk."paketki_ID" = $1''',
+}
+
+# Первичный ключ каждой таблицы и ссылки на родительские записи
+PRIMARY_KEYS = {
+    "orders": "order_id",
+    "batches": "batch_id",
+    "winding": "winding_ID",
+    "extrusion": "extrusion_ID",
+    "cutting": "cutting_ID",
+    "paketki": "paketki_ID",
+    "printing": "printing_ID",
+    "flexa": "flexa_ID",
+    "finished_products": "finishedProducts_ID",
+}
+
+PARENTS = {
+    "batches": [("orders", "order_id")],
+    "winding": [("batches", "batch_id")],
+    "cutting": [("batches", "batch_id")],
+    "printing": [("batches", "batch_id")],
+    "finished_products": [("batches", "batch_id")],
+    "extrusion": [("winding", "winding_id")],
+    "paketki": [("extrusion", "extrusion_id"), ("cutting", "cutting_id")],
+    "flexa": [("printing", "printing_id")],
+}
+
+
+def trace_path(tree: Dict[str, List[dict]], resource: str, record_id: int) -> Dict[str, List[int]]:
+    """Идентификаторы всех предков записи вплоть до заказа."""
+    index = {
+        name: {row[pk]: row for row in tree[name]}
+        for name, pk in PRIMARY_KEYS.items()
+    }
+    path = {resource: [record_id]}
+    pending = [(resource, record_id)]
+    while pending:
+        name, pk = pending.pop()
+        row = index[name].get(pk)
+        if row is None:
+            continue
+        for parent, fk in PARENTS.get(name, []):
+            parent_id = row[fk]
+            if parent_id not in path.setdefault(parent, []):
+                path[parent].append(parent_id)
+                pending.append((parent, parent_id))
+    return path
+
+
+@router.get("/{resource}/{record_id}", response_model=TraceSchema)
+async def trace_record(resource: str, record_id: int):
+    """
+    Прослеживаемость записи: цепочка до заказа (path) и всё дерево заказа —
+    партии, планы, смены и работники
+    """
+    resource = resource.replace("-", "_")
+    if resource not in RESOLVE_SQL:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown resource {resource}"
+        )
+
+    rows = await replicas.read_connection().execute_query_dict(RESOLVE_SQL[resource], [record_id])
+    if rows:
+        tree = await load_order_tree([row["order_id"] for row in rows])
+    else:
+        # Запись могла уйти в архив вместе с закрытым заказом
+        order_ids = await run_in_threadpool(archive.find_order_ids, resource, record_id)
+        if not order_ids:
+            raise HTTPException(
+                status_code=404,
+                detail=f"{resource} record with id {record_id} not found"
+            )
+        tree = await run_in_threadpool(archive.load_order_tree, order_ids)
+        tree["workers"] = await load_workers(tree)
+
+    return {
+        "resource": resource,
+        "id": record_id,
+        "path": trace_path(tree, resource, record_id),
+        **tree,
+    }
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Depends, Header
 from typing import List, Optional
 
+from app import audit, norms
+from app.cachebus import invalidates
+from app.concurrency import expected_version, versioned_update
+from app.counts import count_requested
 from app.models import Winding, Batches, Equipment
+from app.responses import list_response, row_response, model_response, selected_fields
 from app.schemas import WindingSchema, WindingCreate, WindingUpdate
 
 router = APIRouter(
     prefix="/winding",
-    tags=["winding"]
+    tags=["winding"],
+    dependencies=[Depends(invalidates("winding"))]
 )
 
 
@@ -16,7 +22,9 @@ async def get_all_windings(
         equipment_id: Optional[int] = Query(None, description="Filter by equipment ID"),
         status: Optional[str] = Query(None, description="Filter by status"),
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     query = Winding.all().offset(skip).limit(limit)
 
@@ -27,18 +35,18 @@ async def get_all_windings(
     if status:
         query = query.filter(status__icontains=status)
 
-    return await WindingSchema.from_queryset(query)
+    return await list_response(query, WindingSchema, fields, count)
 
 
 @router.get("/{winding_id}", response_model=WindingSchema)
-async def get_winding(winding_id: int):
-    winding = await Winding.get_or_none(winding_ID=winding_id).prefetch_related("batch", "equipment")
-    if not winding:
+async def get_winding(winding_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Winding.filter(winding_ID=winding_id), WindingSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Winding record with id {winding_id} not found"
         )
-    return await WindingSchema.from_tortoise_orm(winding)
+    return response
 
 
 @router.post("/", response_model=WindingSchema)
@@ -56,28 +64,32 @@ async def create_winding(winding: WindingCreate):
             detail=f"Equipment with id {winding.equipment_id} does not exist"
         )
 
+    # Без нормы подставляется рекомендованная по истории смен (app.norms)
+    if winding.norm is None:
+        winding.norm = await norms.default_norm("winding", winding.batch_id, winding.equipment_id)
+        if winding.norm is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"No recommended norm for equipment {winding.equipment_id}, specify norm explicitly"
+            )
+
     winding_dict = winding.model_dump(exclude={"batch_id", "equipment_id"})
     winding_obj = await Winding.create(
         **winding_dict,
         batch_id=winding.batch_id,
         equipment_id=winding.equipment_id
     )
-    return await WindingSchema.from_tortoise_orm(winding_obj)
+    return model_response(winding_obj, WindingSchema)
 
 
 @router.put("/{winding_id}", response_model=WindingSchema)
 async def update_winding(
         winding_id: int,
-        winding_data: WindingUpdate
+        winding_data: WindingUpdate,
+        if_match: Optional[str] = Header(None)
 ):
-    winding = await Winding.get_or_none(winding_ID=winding_id)
-    if not winding:
-        raise HTTPException(
-            status_code=404,
-            detail=f"Winding record with id {winding_id} not found"
-        )
-
-    update_data = winding_data.model_dump(exclude_unset=True)
+    version = expected_version(if_match, winding_data.version)
+    update_data = winding_data.model_dump(exclude_unset=True, exclude={"version"})
 
     # Проверяем обновление связанных записей
     if "batch_id" in update_data:
@@ -94,10 +106,8 @@ async def update_winding(
                 detail=f"Equipment with id {update_data['equipment_id']} does not exist"
             )
 
-    await winding.update_from_dict(update_data)
-    await winding.save()
-
-    return await WindingSchema.from_tortoise_orm(winding)
+    # Проверка версии и запись одним запросом, без блокировки строки
+    return await versioned_update(Winding, winding_id, update_data, version, WindingSchema, "Winding record")
 
 
 @router.delete("/{winding_id}", response_model=dict)
@@ -118,4 +128,5 @@ async def delete_winding(winding_id: int):
         )
 
     await winding.delete()
+    audit.record_delete(winding)
     return {"message": f"Winding record {winding_id} deleted successfully"}
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import List, Optional
 
+from app import audit
+from app.cachebus import invalidates
+from app.counts import count_requested
 from app.models import Workers
-from app.schemas import WorkerSchema, WorkerCreate, WorkerUpdate
+from app.ranking import current_period, get_ranking
+from app.responses import list_response, row_response, model_response, selected_fields
+from app.schemas import WorkerSchema, WorkerCreate, WorkerUpdate, WorkerRankingSchema
 
 router = APIRouter(
     prefix="/workers",
-    tags=["workers"]
+    tags=["workers"],
+    dependencies=[Depends(invalidates("workers"))]
 )
 
 
@@ -14,25 +20,42 @@ router = APIRouter(
 async def get_all_workers(
         fio: Optional[str] = None,
         skip: int = 0,
-        limit: int = 100
+        limit: int = 100,
+        fields: Optional[List[str]] = Depends(selected_fields),
+        count: bool = Depends(count_requested)
 ):
     query = Workers.all().offset(skip).limit(limit)
 
     if fio:
         query = query.filter(FIO__icontains=fio)
 
-    return await WorkerSchema.from_queryset(query)
+    return await list_response(query, WorkerSchema, fields, count)
+
+
+@router.get("/ranking", response_model=List[WorkerRankingSchema])
+async def get_workers_ranking(
+        period: Optional[str] = Query(
+            None,
+            pattern=r"^\d{4}-(0[1-9]|1[0-2])$",
+            description="Period in YYYY-MM format, current month by default"
+        )
+):
+    """
+    Рейтинг работников за месяц: выработка экструзии, пакетов и флексопечати
+    относительно сменной нормы, плюс упакованная готовая продукция
+    """
+    return await get_ranking(period or current_period())
 
 
 @router.get("/{worker_id}", response_model=WorkerSchema)
-async def get_worker(worker_id: int):
-    worker = await Workers.get_or_none(worker_ID=worker_id)
-    if not worker:
+async def get_worker(worker_id: int, fields: Optional[List[str]] = Depends(selected_fields)):
+    response = await row_response(Workers.filter(worker_ID=worker_id), WorkerSchema, fields)
+    if response is None:
         raise HTTPException(
             status_code=404,
             detail=f"Worker with id {worker_id} not found"
         )
-    return await WorkerSchema.from_tortoise_orm(worker)
+    return response
 
 
 @router.post("/", response_model=WorkerSchema)
@@ -45,7 +68,7 @@ async def create_worker(worker: WorkerCreate):
         )
 
     worker_obj = await Workers.create(**worker.model_dump())
-    return await WorkerSchema.from_tortoise_orm(worker_obj)
+    return model_response(worker_obj, WorkerSchema)
 
 
 @router.put("/{worker_id}", response_model=WorkerSchema)
@@ -69,10 +92,12 @@ async def update_worker(
             )
 
     update_data = worker_data.model_dump(exclude_unset=True)
+    before = audit.snapshot(worker, update_data)
     await worker.update_from_dict(update_data)
     await worker.save()
+    audit.record_update(worker, before)
 
-    return await WorkerSchema.from_tortoise_orm(worker)
+    return model_response(worker, WorkerSchema)
 
 
 @router.delete("/{worker_id}", response_model=dict)
@@ -96,4 +121,5 @@ async def delete_worker(worker_id: int):
         )
 
     await worker.delete()
+    audit.record_delete(worker)
     return {"message": f"Worker {worker_id} deleted successfully"}
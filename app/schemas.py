@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from datetime import date
-from typing import Optional, List
+from datetime import date, datetime
+from typing import Any, Literal, Optional, List, Dict
 from pydantic import ConfigDict
 
 
@@ -87,11 +87,30 @@ class BatchUpdate(BaseModel):
     accepted: Optional[float] = None
     acceptedPCS: Optional[int] = None
     deviation: Optional[float] = None
+    # Версия, которую видел клиент; вместо заголовка If-Match
+    version: Optional[int] = None
+
+
+class BatchBulkFilter(BaseModel):
+    order_id: Optional[int] = None
+    batchStatus: Optional[str] = None
+
+
+class BatchBulkUpdate(BaseModel):
+    ids: Optional[List[int]] = None
+    filter: Optional[BatchBulkFilter] = None
+    update: BatchUpdate
+
+
+class BatchBulkResultSchema(BaseModel):
+    updated: int
+    ids: List[int]
 
 
 class BatchSchema(BatchBase):
     batch_id: int
     order_id: int
+    version: int
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -141,6 +160,69 @@ class WorkerSchema(WorkerBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class WorkerRankingSchema(BaseModel):
+    rank: int
+    worker_ID: int
+    FIO: str
+    shifts: int
+    output: float
+    norm: float
+    performance: Optional[float] = None
+    finishedQuantity: int
+    finishedWeight: float
+
+
+class OrderForecastSchema(BaseModel):
+    order_id: int
+    orderNumber: str
+    client: str
+    desiredCompletionDate: Optional[date] = None
+    projectedCompletionDate: Optional[date] = None
+    remainingHours: Optional[float] = None
+    slackDays: Optional[int] = None
+    risk: str
+
+
+class BalanceTotalsSchema(BaseModel):
+    plannedWeight: float
+    plannedGross: float
+    extruded: float
+    extrusionDefects: float
+    printed: float
+    printDefects: float
+    cut: float
+    cuttingDefects: float
+    finishedWeight: float
+    finishedQuantity: int
+    losses: float
+    deviation: Optional[float] = None
+
+
+class BatchBalanceSchema(BalanceTotalsSchema):
+    batch_id: int
+    order_id: int
+    orderNumber: str
+    batchNumber: str
+    closed: bool
+
+
+class OrderBalanceSchema(BalanceTotalsSchema):
+    order_id: int
+    orderNumber: str
+    batchCount: int
+    closedBatches: int
+    # Заказ перенесён в архив, баланс посчитан по архиву
+    archived: bool = False
+    batches: Optional[List[BatchBalanceSchema]] = None
+
+
+class PlantBalanceSchema(BaseModel):
+    totals: BalanceTotalsSchema
+    orders: List[OrderBalanceSchema]
+    # Итоги только по рабочим таблицам: архивные заказы в них не входят
+    archiveIncluded: bool = False
+
+
 class WindingBase(BaseModel):
     priority: int
     status: str
@@ -154,6 +236,8 @@ class WindingBase(BaseModel):
 
 
 class WindingCreate(WindingBase):
+    # Не передана - берётся рекомендуемая норма, см. app.norms
+    norm: Optional[float] = None
     batch_id: int
     equipment_id: int
 
@@ -170,12 +254,14 @@ class WindingUpdate(BaseModel):
     weightCheck: Optional[float] = None
     batch_id: Optional[int] = None
     equipment_id: Optional[int] = None
+    version: Optional[int] = None
 
 
 class WindingSchema(WindingBase):
     winding_ID: int
     batch_id: int
     equipment_id: int
+    version: int
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -231,6 +317,7 @@ class CuttingBase(BaseModel):
 
 
 class CuttingCreate(CuttingBase):
+    norm: Optional[float] = None
     batch_id: int
     equipment_id: int
 
@@ -248,12 +335,14 @@ class CuttingUpdate(BaseModel):
     PSCCheck: Optional[int] = None
     batch_id: Optional[int] = None
     equipment_id: Optional[int] = None
+    version: Optional[int] = None
 
 
 class CuttingSchema(CuttingBase):
     cutting_ID: int
     batch_id: int
     equipment_id: int
+    version: int
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -381,3 +470,95 @@ class FinishedProductsSchema(FinishedProductsBase):
     batch_id: int
     worker_id: int
     model_config = ConfigDict(from_attributes=True)
+
+
+class TraceSchema(BaseModel):
+    resource: str
+    id: int
+    path: Dict[str, List[int]]
+    orders: List[OrderSchema]
+    batches: List[BatchSchema]
+    winding: List[WindingSchema]
+    extrusion: List[ExtrusionSchema]
+    cutting: List[CuttingSchema]
+    paketki: List[PaketkiSchema]
+    printing: List[PrintingSchema]
+    flexa: List[FlexaSchema]
+    finished_products: List[FinishedProductsSchema]
+    workers: List[WorkerSchema]
+
+
+class SlowQuerySchema(BaseModel):
+    at: str
+    route: str
+    operation: str
+    duration_ms: float
+    sql: str
+    params: list
+    plan: Optional[str] = None
+
+
+class ImportErrorSchema(BaseModel):
+    row: int
+    errors: List[str]
+
+
+class OrderImportSchema(BaseModel):
+    rows: int
+    imported: int
+    error_count: int
+    errors: List[ImportErrorSchema]
+
+
+class OrderBulkResultSchema(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+
+
+class SyncResourceChangesSchema(BaseModel):
+    columns: List[str]
+    rows: List[List[Any]]
+
+
+class SyncChangesSchema(BaseModel):
+    token: str
+    more: bool
+    changes: Dict[str, SyncResourceChangesSchema]
+    deleted: Dict[str, List[int]]
+
+
+class SyncOperation(BaseModel):
+    resource: str
+    action: Literal["create", "update", "delete"]
+    # Для update и delete
+    id: Optional[int] = None
+    # Тело create или update, как в запросах к самому ресурсу
+    data: Optional[Dict[str, Any]] = None
+
+
+class SyncPush(BaseModel):
+    operations: List[SyncOperation]
+
+
+class SyncOperationResultSchema(BaseModel):
+    status: int
+    body: Optional[Any] = None
+    detail: Optional[Any] = None
+
+
+class SyncPushResultSchema(BaseModel):
+    results: List[SyncOperationResultSchema]
+
+
+class AuditEntrySchema(BaseModel):
+    # None - запись ещё в очереди и не попала в audit_log
+    id: Optional[int] = None
+    at: datetime
+    resource: str
+    record_id: int
+    action: str
+    actor: Optional[str] = None
+    # Изменённые поля: прежние и новые значения; у удаления - вся запись в before
+    before: Optional[Dict[str, Any]] = None
+    after: Optional[Dict[str, Any]] = None
@@ -0,0 +1,45 @@
+"""
+Запуск API в несколько процессов.
+
+    python -m app.serve [--workers N] [--host 0.0.0.0] [--port 8080]
+
+Число процессов по умолчанию - WEB_CONCURRENCY или число ядер. Процессы
+запускает uvicorn и перезапускает упавшие. Метрики Prometheus собираются
+в общем каталоге PROMETHEUS_MULTIPROC_DIR, и /metrics любого процесса
+отдаёт сумму по всем; каталог очищается при запуске. Кэши процессов
+согласуются через app.cachebus. Схема должна быть создана заранее:
+python -m app.migrate.
+"""
+import argparse
+import glob
+import os
+import tempfile
+
+import uvicorn
+
+
+def prepare_metrics_dir() -> None:
+    directory = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "cronck-metrics")
+    )
+    os.makedirs(directory, exist_ok=True)
+    # Файлы прошлого запуска дали бы счётчики мёртвых процессов
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.unlink(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        prepare_metrics_dir()
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
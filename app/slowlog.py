@@ -0,0 +1,120 @@
+"""
+Журнал медленных запросов.
+
+Запрос к базе дольше SLOW_QUERY_MS попадает в кольцевой буфер на
+SLOW_QUERY_LOG_SIZE записей вместе с маршрутом, из которого он вызван,
+параметрами и планом EXPLAIN (строковые значения скрыты в обоих). План снимается
+фоновой задачей уже после ответа, так что медленный запрос не становится
+ещё медленнее. Буфер отдаётся в /debug/slow-queries.
+"""
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from datetime import date, datetime
+from typing import Deque, List, Optional
+
+from tortoise import Tortoise
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+# Один и тот же текст запроса не объясняется чаще, чем раз в столько секунд
+EXPLAIN_INTERVAL = 60.0
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+_entries: Deque[dict] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_plans: dict = {}
+_tasks: set = set()
+_explaining: contextvars.ContextVar[bool] = contextvars.ContextVar("explaining", default=False)
+
+
+def enabled() -> bool:
+    return SLOW_QUERY_MS >= 0 and SLOW_QUERY_LOG_SIZE > 0
+
+
+def redact(value):
+    """Строки могут содержать персональные данные; числа и даты нужны для плана."""
+    if value is None or isinstance(value, (bool, int, float, date, datetime)):
+        return value if not isinstance(value, (date, datetime)) else value.isoformat()
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return f"<{type(value).__name__}>"
+
+
+def redact_plan(plan: str, values: Optional[list]) -> str:
+    """Postgres подставляет значения параметров в текст плана литералами."""
+    for value in values or []:
+        if isinstance(value, str) and value:
+            plan = plan.replace("'" + value.replace("'", "''") + "'", "'<redacted>'")
+    return plan
+
+
+def record(operation: str, args: tuple, seconds: float, route: str) -> None:
+    """Вызывается обёрткой app.metrics.instrument_db после каждого запроса."""
+    if not enabled() or _explaining.get() or seconds * 1000 < SLOW_QUERY_MS or not args:
+        return
+
+    query = args[0]
+    values = args[1] if len(args) > 1 else None
+    if operation == "execute_many":
+        # План один на все строки пакета, берём первую
+        values = values[0] if values else None
+
+    entry = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "route": route,
+        "operation": operation,
+        "duration_ms": round(seconds * 1000, 3),
+        "sql": query,
+        "params": redact(list(values)) if values else [],
+        "plan": None,
+    }
+    _entries.append(entry)
+
+    if operation == "execute_script" or not query.lstrip().upper().startswith(EXPLAINABLE):
+        return
+    cached = _plans.get(query)
+    if cached and time.monotonic() - cached[0] < EXPLAIN_INTERVAL:
+        entry["plan"] = cached[1]
+        return
+
+    try:
+        task = asyncio.get_running_loop().create_task(capture_plan(entry, query, values))
+    except RuntimeError:
+        return
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def capture_plan(entry: dict, query: str, values: Optional[list]) -> None:
+    _explaining.set(True)
+    conn = Tortoise.get_connection("default")
+    if conn.capabilities.dialect == "postgres":
+        explain = f"EXPLAIN (ANALYZE off) {query}"
+    else:
+        explain = f"EXPLAIN QUERY PLAN {query}"
+
+    try:
+        _, rows = await conn.execute_query(explain, list(values) if values else None)
+        plan = redact_plan("\n".join(str(list(dict(row).values())[-1]) for row in rows), values)
+    except Exception as exc:
+        plan = redact_plan(f"EXPLAIN failed: {exc}", values)
+
+    entry["plan"] = plan
+    _plans[query] = (time.monotonic(), plan)
+    if len(_plans) > SLOW_QUERY_LOG_SIZE:
+        _plans.pop(next(iter(_plans)))
+
+
+def entries() -> List[dict]:
+    """Записи буфера, новые первыми."""
+    return list(reversed(_entries))
+
+
+def clear() -> None:
+    _entries.clear()
+    _plans.clear()
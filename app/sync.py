@@ -0,0 +1,247 @@
+"""
+Синхронизация изменений для планшетов на линиях.
+
+Планшет, потерявший связь, не скачивает списки заново, а запрашивает
+GET /sync?since=<token> - строки всех ресурсов, изменённые после
+token, и идентификаторы удалённых. Время изменения строки (updated_at) и
+надгробия удалённых (sync_tombstones) ставятся триггерами базы, см.
+миграцию 0006_sync_tracking.
+
+Ответ компактный: у каждого ресурса список колонок один раз и строки
+массивами значений. Сначала применяются удаления, затем строки (как
+вставка или замена по первичному ключу). Первая синхронизация - без
+since, она отдаёт все строки.
+
+Строки отдаются страницами по SYNC_PAGE_SIZE на ресурс в порядке
+(updated_at, первичный ключ). Если отдано не всё, в ответе more: true, а
+token продолжает с того же места - его передают в следующий запрос с теми
+же resources, пока more не станет false.
+
+Токен следующей синхронизации - время начала первой страницы минус
+SYNC_LAG секунд. Транзакция, начатая раньше, могла записать строку с
+более ранним updated_at и закоммитить её уже после запроса; запас SYNC_LAG
+(дольше любой пишущей транзакции) не даёт такой строке потеряться, а
+строки из этого окна просто приходят повторно. Поэтому читается всегда
+основная база: на отстающей реплике строки могут появиться позже запаса.
+
+Надгробия хранятся SYNC_TOMBSTONE_DAYS дней; более старый token получает
+410, и планшет синхронизируется с начала. Записи, перенесённые в архив
+(app.archive), тоже приходят как удалённые.
+"""
+import asyncio
+import base64
+import binascii
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple, Type
+
+import orjson
+from fastapi import HTTPException
+from pydantic import BaseModel
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.models import Model
+
+from app.models import (Orders, Batches, Equipment, Workers, Winding, Extrusion, Cutting,
+                        Paketki, Printing, Flexa, FinishedProducts)
+from app.schemas import (OrderSchema, BatchSchema, EquipmentSchema, WorkerSchema, WindingSchema,
+                         ExtrusionSchema, CuttingSchema, PaketkiSchema, PrintingSchema, FlexaSchema,
+                         FinishedProductsSchema)
+
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "5000"))
+SYNC_LAG = float(os.getenv("SYNC_LAG", "5"))
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", "30"))
+# Старые надгробия удаляются не чаще раза в SYNC_PURGE_INTERVAL секунд
+SYNC_PURGE_INTERVAL = 3600
+
+UPDATED_FIELD = "updated_at"
+# Поток надгробий в курсорах токена
+DELETED = "deleted"
+
+# Ресурс (имя таблицы) -> модель и схема, колонки которой отдаются
+RESOURCES: Dict[str, Tuple[Type[Model], Type[BaseModel]]] = {
+    "orders": (Orders, OrderSchema),
+    "batches": (Batches, BatchSchema),
+    "equipment": (Equipment, EquipmentSchema),
+    "workers": (Workers, WorkerSchema),
+    "winding": (Winding, WindingSchema),
+    "extrusion": (Extrusion, ExtrusionSchema),
+    "cutting": (Cutting, CuttingSchema),
+    "paketki": (Paketki, PaketkiSchema),
+    "printing": (Printing, PrintingSchema),
+    "flexa": (Flexa, FlexaSchema),
+    "finished_products": (FinishedProducts, FinishedProductsSchema),
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_purged_at = 0.0
+
+
+def resource_name(name: str) -> str:
+    resource = name.replace("-", "_")
+    if resource not in RESOURCES:
+        raise HTTPException(status_code=400, detail=f"Unknown resource {name}")
+    return resource
+
+
+def to_micros(value) -> int:
+    if isinstance(value, str):
+        # SQLite возвращает время строкой
+        value = datetime.fromisoformat(value)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def db_time(conn: BaseDBAsyncClient, micros: int):
+    """Параметр запроса для сравнения с updated_at: в SQLite - строка в формате Tortoise."""
+    moment = from_micros(micros)
+    if conn.capabilities.dialect == "postgres":
+        return moment
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f+00:00")
+
+
+async def db_now(conn: BaseDBAsyncClient) -> int:
+    """Текущее время по часам, которыми триггеры ставят updated_at."""
+    if conn.capabilities.dialect == "postgres":
+        rows = await conn.execute_query_dict("SELECT clock_timestamp() AS now")
+        return to_micros(rows[0]["now"])
+    return to_micros(datetime.now(timezone.utc))
+
+
+def encode_token(state: dict) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(state)).rstrip(b"=").decode()
+
+
+def decode_token(token: str) -> dict:
+    try:
+        state = orjson.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(state, dict):
+            raise ValueError
+        # since пуст только у продолжения первой синхронизации
+        if not isinstance(state.get("s"), int) and not (state.get("s") is None and "c" in state):
+            raise ValueError
+        if "c" in state and not (isinstance(state["c"], dict) and isinstance(state.get("n"), int)):
+            raise ValueError
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail=f"Invalid sync token: {token}")
+    return state
+
+
+def keyset(conn: BaseDBAsyncClient, column: str, pk: str, since: Optional[int],
+           cursor: Optional[list]) -> Tuple[str, list]:
+    """Условие «после курсора, а без него - после since» и его параметры."""
+    if cursor is not None:
+        return f'WHERE ({column}, "{pk}") > ($1, $2)', [db_time(conn, cursor[0]), cursor[1]]
+    if since is not None:
+        return f"WHERE {column} > $1", [db_time(conn, since)]
+    return "", []
+
+
+async def changed_rows(conn: BaseDBAsyncClient, resource: str, since: Optional[int],
+                       cursor: Optional[list], limit: int) -> Tuple[List[str], List[list], Optional[list]]:
+    """Колонки, страница изменённых строк ресурса и курсор продолжения (None - отдано всё)."""
+    model, schema = RESOURCES[resource]
+    pk = model._meta.db_pk_column
+    columns = list(schema.model_fields)
+    where, values = keyset(conn, UPDATED_FIELD, pk, since, cursor)
+    names = ", ".join(f'"{column}"' for column in columns)
+    _, rows = await conn.execute_query(
+        f'SELECT {names}, {UPDATED_FIELD} FROM "{model._meta.db_table}" {where} '
+        f'ORDER BY {UPDATED_FIELD}, "{pk}" LIMIT {limit}',
+        values
+    )
+    page = [list(row) for row in rows]
+    for row in page:
+        row.pop()
+    following = None
+    if len(rows) == limit:
+        following = [to_micros(rows[-1][-1]), rows[-1][columns.index(pk)]]
+    return columns, page, following
+
+
+async def deleted_rows(conn: BaseDBAsyncClient, resources: List[str], since: Optional[int],
+                       cursor: Optional[list], limit: int) -> Tuple[Dict[str, List[int]], Optional[list]]:
+    """Удалённые идентификаторы по ресурсам и курсор продолжения."""
+    if since is None and cursor is None:
+        # Первой синхронизации удалять нечего
+        return {}, None
+    where, values = keyset(conn, "deleted_at", "id", since, cursor)
+    start = len(values) + 1
+    placeholders = ", ".join(f"${index}" for index in range(start, start + len(resources)))
+    rows = await conn.execute_query_dict(
+        f"SELECT id, resource, record_id, deleted_at FROM sync_tombstones {where} "
+        f"{'AND' if where else 'WHERE'} resource IN ({placeholders}) "
+        f"ORDER BY deleted_at, id LIMIT {limit}",
+        values + resources
+    )
+    deleted: Dict[str, List[int]] = {}
+    for row in rows:
+        deleted.setdefault(row["resource"], []).append(row["record_id"])
+    following = None
+    if len(rows) == limit:
+        following = [to_micros(rows[-1]["deleted_at"]), rows[-1]["id"]]
+    return deleted, following
+
+
+async def purge_tombstones(conn: BaseDBAsyncClient, now: int) -> None:
+    global _purged_at
+    if time.monotonic() - _purged_at < SYNC_PURGE_INTERVAL:
+        return
+    _purged_at = time.monotonic()
+    cutoff = now - SYNC_TOMBSTONE_DAYS * 86400 * 10 ** 6
+    await conn.execute_query("DELETE FROM sync_tombstones WHERE deleted_at < $1", [db_time(conn, cutoff)])
+
+
+async def changes(token: Optional[str], resources: Optional[List[str]] = None,
+                  limit: int = SYNC_PAGE_SIZE) -> dict:
+    """Изменения после token (None - всё) по ресурсам resources (None - по всем)."""
+    names = [resource_name(name) for name in resources] if resources else list(RESOURCES)
+    # Реплика может отставать больше SYNC_LAG, поэтому только основная база
+    conn = Tortoise.get_connection("default")
+    now = await db_now(conn)
+
+    state = decode_token(token) if token else {"s": None}
+    since = state["s"]
+    cursors = state.get("c")
+    if cursors is None:
+        # Новая синхронизация: все потоки с начала, итоговый токен - от текущего времени
+        if since is not None and since < now - SYNC_TOMBSTONE_DAYS * 86400 * 10 ** 6:
+            raise HTTPException(
+                status_code=410,
+                detail=f"Sync token is older than {SYNC_TOMBSTONE_DAYS} days, sync again without since"
+            )
+        final = max(since or 0, now - int(SYNC_LAG * 10 ** 6))
+        pending = {name: None for name in [*names, DELETED]}
+    else:
+        final = state["n"]
+        pending = {name: cursor for name, cursor in cursors.items() if name in names or name == DELETED}
+    await purge_tombstones(conn, now)
+
+    streams = [name for name in pending if name != DELETED]
+    queries = [changed_rows(conn, name, since, pending[name], limit) for name in streams]
+    if DELETED in pending:
+        queries.append(deleted_rows(conn, names, since, pending[DELETED], limit))
+    pages = await asyncio.gather(*queries)
+    deleted, deleted_cursor = pages.pop() if DELETED in pending else ({}, None)
+
+    result = {"changes": {}, "deleted": deleted}
+    following = {}
+    for name, (columns, rows, cursor) in zip(streams, pages):
+        if rows:
+            result["changes"][name] = {"columns": columns, "rows": rows}
+        if cursor is not None:
+            following[name] = cursor
+    if deleted_cursor is not None:
+        following[DELETED] = deleted_cursor
+
+    if following:
+        result["token"] = encode_token({"s": since, "n": final, "c": following})
+    else:
+        result["token"] = encode_token({"s": final})
+    result["more"] = bool(following)
+    return result
@@ -0,0 +1,52 @@
+"""
+Загрузка дерева заказа из рабочих таблиц: заказ, партии, планы, смены,
+готовая продукция и работники. Используется прослеживаемостью
+(/trace) и переносом заказов в архив (app.archive).
+"""
+import asyncio
+from typing import Dict, List
+
+from tortoise.expressions import Q
+
+from app.models import (Orders, Batches, Winding, Extrusion, Cutting, Paketki,
+                        Printing, Flexa, FinishedProducts, Workers)
+
+
+async def load_order_tree(order_ids: List[int]) -> Dict[str, List[dict]]:
+    """
+    Все записи заказов вместе с работниками, которые их касались.
+    Фиксированное число запросов независимо от размера дерева.
+    """
+    queries = {
+        "orders": Orders.filter(order_id__in=order_ids),
+        "batches": Batches.filter(order_id__in=order_ids),
+        "winding": Winding.filter(batch__order_id__in=order_ids),
+        "extrusion": Extrusion.filter(winding__batch__order_id__in=order_ids),
+        "cutting": Cutting.filter(batch__order_id__in=order_ids),
+        "printing": Printing.filter(batch__order_id__in=order_ids),
+        "finished_products": FinishedProducts.filter(batch__order_id__in=order_ids),
+    }
+    results = await asyncio.gather(*(query.values() for query in queries.values()))
+    tree = dict(zip(queries.keys(), results))
+
+    # Пакеты и флексопечать выбираются по уже найденным ключам, чтобы
+    # запрос шёл по индексам внешних ключей, а не через OR по соединениям
+    cutting_ids = [row["cutting_ID"] for row in tree["cutting"]]
+    extrusion_ids = [row["extrusion_ID"] for row in tree["extrusion"]]
+    printing_ids = [row["printing_ID"] for row in tree["printing"]]
+    tree["paketki"], tree["flexa"] = await asyncio.gather(
+        Paketki.filter(Q(cutting_id__in=cutting_ids) | Q(extrusion_id__in=extrusion_ids)).values(),
+        Flexa.filter(printing_id__in=printing_ids).values(),
+    )
+
+    tree["workers"] = await load_workers(tree)
+    return tree
+
+
+async def load_workers(tree: Dict[str, List[dict]]) -> List[dict]:
+    worker_ids = {
+        row["worker_id"]
+        for resource in ("extrusion", "paketki", "flexa", "finished_products")
+        for row in tree[resource]
+    }
+    return await Workers.filter(worker_ID__in=worker_ids).values() if worker_ids else []
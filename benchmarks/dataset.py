@@ -0,0 +1,356 @@
+"""
+Генератор синтетических данных производства.
+
+    python -m benchmarks.dataset --db-url postgres://... --orders 100000 --seed 1
+
+Данные детерминированы зерном --seed и согласованы по ссылкам: у каждого
+заказа есть партии, у партии - планы намотки, резки и печати, у планов -
+сменные записи экструзии, пакетов и флексопечати, датированные после даты
+заказа. Идентификаторы задаются явно, начиная с 1, поэтому база должна быть
+пустой. В Postgres строки грузятся через COPY (asyncpg
+copy_records_to_table), в SQLite - многострочными вставками, по транзакции на
+пачку. --orders 100000 даёт около 8 млн строк.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import date, timedelta
+from functools import cached_property
+from typing import Callable, Dict, Iterator, List, NamedTuple
+
+from tortoise import Tortoise
+from tortoise.backends.base.client import BaseDBAsyncClient
+from tortoise.transactions import in_transaction
+
+from app import migrate
+
+log = logging.getLogger(__name__)
+
+BATCHES_PER_ORDER = 3
+EXTRUSION_PER_WINDING = 8
+FLEXA_PER_PRINTING = 4
+FINISHED_PER_BATCH = 3
+CHUNK = 20_000
+
+STATUSES = ("new", "work", "done")
+# Порядок загрузки: таблица грузится после тех, на которые ссылается.
+# paketki -> extrusion не проверяется базой (extrusion секционирована),
+# поэтому paketki идёт вместе с extrusion.
+LEVELS = [
+    ("workers", "equipment", "orders"),
+    ("batches",),
+    ("winding", "cutting", "printing"),
+    ("extrusion", "paketki", "flexa", "finished_products"),
+]
+
+START = date(2023, 1, 1)
+DELTAS = [timedelta(days=day) for day in range(100)]
+
+
+class Table(NamedTuple):
+    name: str
+    columns: List[str]
+    count: int
+    rows: Callable[[], Iterator[tuple]]
+
+
+class Generator:
+    """
+    Строки всех таблиц по порядку зависимостей. Значения, которые нужны
+    дочерним таблицам (дата заказа партии, число экструзий), вычисляются
+    из номера строки, а не хранятся, так что память не растёт с объёмом.
+    """
+
+    def __init__(self, orders: int, seed: int = 1, years: int = 2,
+                 workers: int = 300, equipment: int = 40):
+        self.orders = orders
+        self.seed = seed
+        self.days = years * 365
+        self.workers = workers
+        self.equipment = equipment
+        self.batches = orders * BATCHES_PER_ORDER
+        self.extrusions = self.batches * EXTRUSION_PER_WINDING
+        self.flexa = self.batches * FLEXA_PER_PRINTING
+        self.finished = self.batches * FINISHED_PER_BATCH
+
+    def rnd(self, table: str) -> random.Random:
+        # Своё зерно на таблицу: любая таблица воспроизводится независимо
+        return random.Random(f"{self.seed}:{table}")
+
+    @cached_property
+    def order_days(self) -> List[date]:
+        rnd = self.rnd("orderDate")
+        days = [START + timedelta(days=day) for day in range(self.days)]
+        return [days[int(rnd.random() * self.days)] for _ in range(self.orders + 1)]
+
+    def batch_day(self, batch_id: int) -> date:
+        return self.order_days[(batch_id - 1) // BATCHES_PER_ORDER + 1]
+
+    @staticmethod
+    def after(day: date, low: int, high: int, rnd: random.Random) -> date:
+        return day + DELTAS[low + int(rnd.random() * (high - low + 1))]
+
+    def tables(self) -> List[Table]:
+        return [
+            Table("workers", ["worker_ID", "FIO"], self.workers, self.worker_rows),
+            Table("equipment", ["equipment_ID", "name", "description"], self.equipment,
+                  self.equipment_rows),
+            Table("orders", [
+                "order_id", "client", "orderStatus", "orderNumber", "productName", "sleeveName",
+                "orderDate", "desiredCompletionDate", "quantity", "orderWeight", "productType",
+                "pack", "packaging", "comments", "width", "length", "thickness", "widthSquared",
+                "lengthSquared", "thicknessSquared", "density", "weightWithoutCutting",
+                "weightWithCutting",
+            ], self.orders, self.order_rows),
+            Table("batches", [
+                "batch_id", "order_id", "batchNumber", "batchStatus", "labelName",
+                "completionDate", "shipment", "print", "accepted", "acceptedPCS", "deviation",
+            ], self.batches, self.batch_rows),
+            Table("winding", [
+                "winding_ID", "batch_id", "equipment_id", "priority", "status", "cuttingDate",
+                "norm", "days", "winding", "requiredToWind", "remainToWind", "weightCheck",
+            ], self.batches, self.winding_rows),
+            Table("cutting", [
+                "cutting_ID", "batch_id", "equipment_id", "priority", "status", "cutting",
+                "cuttingPSC", "remainToCut", "remainToCutPSC", "days", "norm", "startDate",
+                "PSCCheck",
+            ], self.batches, self.cutting_rows),
+            Table("printing", ["printing_ID", "batch_id", "printing", "remainToPrint"],
+                  self.batches, self.printing_rows),
+            Table("extrusion", [
+                "extrusion_ID", "winding_id", "date", "equipmentOperatinTime", "shiftNorm",
+                "totalShift", "whiteDefective", "transparentDefective", "coloredDefective",
+                "hourlyProduction", "seasonal", "worker_id",
+            ], self.extrusions, self.extrusion_rows),
+            Table("paketki", [
+                "paketki_ID", "extrusion_id", "cutting_id", "date", "operatinTime", "shiftNorm",
+                "totalShift", "whiteDefective", "transparentDefective", "coloredDefective",
+                "hourlyProduction", "seasonal", "worker_id",
+            ], self.extrusions, self.paketki_rows),
+            Table("flexa", [
+                "flexa_ID", "printing_id", "date", "operatinTime", "shiftNorm", "totalShift",
+                "whiteDefective", "printDefective", "coloredDefective", "hourlyProduction",
+                "remark", "worker_id",
+            ], self.flexa, self.flexa_rows),
+            Table("finished_products", [
+                "finishedProducts_ID", "batch_id", "date", "quantity", "weight", "worker_id",
+            ], self.finished, self.finished_rows),
+        ]
+
+    def worker_rows(self) -> Iterator[tuple]:
+        for i in range(1, self.workers + 1):
+            yield i, f"Worker {i}"
+
+    def equipment_rows(self) -> Iterator[tuple]:
+        for i in range(1, self.equipment + 1):
+            yield i, f"Line {i}", None
+
+    def order_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("orders")
+        for i in range(1, self.orders + 1):
+            ordered = self.order_days[i]
+            width, length, thickness = rnd.uniform(20, 60), rnd.uniform(30, 80), rnd.uniform(10, 60)
+            weight = rnd.uniform(100, 5000)
+            yield (
+                i, f"Client {rnd.randrange(500)}", rnd.choice(STATUSES), f"ORD-{i:08d}",
+                f"Bag {rnd.randrange(200)}", "sleeve", ordered,
+                ordered + timedelta(days=rnd.randint(14, 60)), rnd.randint(1000, 50000), weight,
+                rnd.choice(("bag", "film", "sleeve")), 100, 10, None, width, length, thickness,
+                width * width, length * length, thickness * thickness, 0.92, weight * 0.97, weight,
+            )
+
+    def batch_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("batches")
+        for i in range(1, self.batches + 1):
+            status = rnd.choice(STATUSES)
+            done = status == "done"
+            yield (
+                i, (i - 1) // BATCHES_PER_ORDER + 1, f"B-{i}", status, None,
+                self.batch_day(i) + timedelta(days=rnd.randint(20, 70)) if done else None,
+                done, None, rnd.uniform(50, 2000) if done else None,
+                rnd.randint(100, 20000) if done else None, rnd.uniform(-3, 3) if done else None,
+            )
+
+    def winding_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("winding")
+        for i in range(1, self.batches + 1):
+            required = rnd.uniform(200, 2000)
+            wound = rnd.uniform(0, required)
+            yield (
+                i, i, rnd.randint(1, self.equipment), rnd.randint(1, 5), rnd.choice(STATUSES),
+                self.batch_day(i) + timedelta(days=rnd.randint(5, 30)), rnd.uniform(80, 120),
+                rnd.uniform(1, 5), wound, required, required - wound, None,
+            )
+
+    def cutting_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("cutting")
+        for i in range(1, self.batches + 1):
+            total = rnd.uniform(200, 2000)
+            cut = rnd.uniform(0, total)
+            pieces = rnd.randint(1000, 20000)
+            cut_pieces = int(pieces * cut / total)
+            yield (
+                i, i, rnd.randint(1, self.equipment), rnd.randint(1, 5), rnd.choice(STATUSES),
+                cut, cut_pieces, total - cut, pieces - cut_pieces, rnd.uniform(1, 5),
+                rnd.uniform(60, 100), self.batch_day(i) + timedelta(days=rnd.randint(3, 20)), None,
+            )
+
+    def printing_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("printing")
+        for i in range(1, self.batches + 1):
+            total = rnd.uniform(100, 1500)
+            printed = rnd.uniform(0, total)
+            yield i, i, printed, total - printed
+
+    def _shift(self, rnd: random.Random, norm: float) -> tuple:
+        total = norm * (0.6 + 0.7 * rnd.random())
+        return norm, total, 3 * rnd.random(), 3 * rnd.random(), 3 * rnd.random(), total / 8
+
+    def _worker(self, rnd: random.Random) -> int:
+        return int(rnd.random() * self.workers) + 1
+
+    def extrusion_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("extrusion")
+        for i in range(1, self.extrusions + 1):
+            winding = (i - 1) // EXTRUSION_PER_WINDING + 1
+            day = self.after(self.batch_day(winding), 1, 40, rnd)
+            yield (i, winding, day, 6 + 6 * rnd.random(), *self._shift(rnd, 100.0),
+                   0.9 + 0.2 * rnd.random(), self._worker(rnd))
+
+    def paketki_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("paketki")
+        for i in range(1, self.extrusions + 1):
+            cutting = (i - 1) // EXTRUSION_PER_WINDING + 1
+            day = self.after(self.batch_day(cutting), 2, 45, rnd)
+            yield (i, i, cutting, day, 6 + 6 * rnd.random(), *self._shift(rnd, 90.0),
+                   0.9 + 0.2 * rnd.random(), self._worker(rnd))
+
+    def flexa_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("flexa")
+        for i in range(1, self.flexa + 1):
+            printing = (i - 1) // FLEXA_PER_PRINTING + 1
+            day = self.after(self.batch_day(printing), 1, 30, rnd)
+            norm, total, white, printed, colored, hourly = self._shift(rnd, 60.0)
+            yield (i, printing, day, 6 + 6 * rnd.random(), norm, total, white, printed, colored,
+                   hourly, None, self._worker(rnd))
+
+    def finished_rows(self) -> Iterator[tuple]:
+        rnd = self.rnd("finished_products")
+        for i in range(1, self.finished + 1):
+            batch = (i - 1) // FINISHED_PER_BATCH + 1
+            day = self.after(self.batch_day(batch), 10, 60, rnd)
+            yield (i, batch, day, int(100 + 4900 * rnd.random()), 10 + 490 * rnd.random(),
+                   self._worker(rnd))
+
+
+def chunks(rows: Iterator[tuple], size: int) -> Iterator[List[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def disable_triggers(raw) -> None:
+    """
+    Ссылки согласованы генератором, поэтому построчные проверки внешних
+    ключей при COPY не нужны. Отключить их может только суперпользователь,
+    для остальных загрузка просто идёт медленнее.
+    """
+    from asyncpg.exceptions import InsufficientPrivilegeError
+
+    try:
+        await raw.execute("SET session_replication_role = replica")
+    except InsufficientPrivilegeError:
+        log.warning("Not a superuser: foreign key triggers stay on during COPY")
+
+
+async def copy_table(conn: BaseDBAsyncClient, table: Table) -> None:
+    if conn.capabilities.dialect == "postgres":
+        async with conn.acquire_connection() as raw:
+            await disable_triggers(raw)
+            try:
+                for chunk in chunks(table.rows(), CHUNK):
+                    await raw.copy_records_to_table(table.name, records=chunk, columns=table.columns)
+                # Идентификаторы заданы явно, последовательность догоняет их
+                await raw.execute(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', '{table.columns[0]}'), "
+                    f"GREATEST($1::bigint, 1))",
+                    table.count
+                )
+            finally:
+                # Соединение возвращается в пул, проверки ключей должны снова работать
+                await raw.execute("RESET session_replication_role")
+        return
+
+    columns = ", ".join(f'"{column}"' for column in table.columns)
+    placeholders = ", ".join("?" for _ in table.columns)
+    query = f'INSERT INTO "{table.name}" ({columns}) VALUES ({placeholders})'
+    for chunk in chunks(table.rows(), CHUNK):
+        async with in_transaction() as tx:
+            await tx.execute_many(query, chunk)
+
+
+async def load_table(conn: BaseDBAsyncClient, table: Table, verbose: bool) -> None:
+    started = time.perf_counter()
+    await copy_table(conn, table)
+    if verbose:
+        elapsed = time.perf_counter() - started
+        print(f"{table.name:<18} {table.count:>10} rows {elapsed:7.1f} s "
+              f"({table.count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+async def seed(orders: int, seed_value: int = 1, verbose: bool = False, **options) -> Dict[str, int]:
+    """
+    Заполнить пустую базу и вернуть число строк каждой таблицы. В Postgres
+    таблицы одного уровня грузятся параллельно по разным соединениям пула:
+    пока сервер разбирает COPY одной таблицы, генерируются строки другой.
+    """
+    generator = Generator(orders, seed_value, **options)
+    tables = {table.name: table for table in generator.tables()}
+    conn = Tortoise.get_connection("default")
+
+    for level in LEVELS:
+        if conn.capabilities.dialect == "postgres":
+            await asyncio.gather(*(load_table(conn, tables[name], verbose) for name in level))
+        else:
+            for name in level:
+                await load_table(conn, tables[name], verbose)
+
+    if conn.capabilities.dialect == "postgres":
+        await conn.execute_script("ANALYZE")
+    return {name: table.count for name, table in tables.items()}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic production dataset")
+    parser.add_argument("--db-url", default=os.getenv("DATABASE_URL", "sqlite://bench.sqlite3"))
+    parser.add_argument("--orders", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=300)
+    parser.add_argument("--equipment", type=int, default=40)
+    args = parser.parse_args()
+
+    await Tortoise.init(db_url=args.db_url, modules={"models": ["app.models"]})
+    await migrate.upgrade()
+
+    started = time.perf_counter()
+    counts = await seed(
+        args.orders, args.seed, verbose=True,
+        years=args.years, workers=args.workers, equipment=args.equipment
+    )
+    total = sum(counts.values())
+    print(f"{'total':<18} {total:>10} rows {time.perf_counter() - started:7.1f} s")
+
+
+if __name__ == "__main__":
+    from tortoise import run_async
+
+    run_async(main())
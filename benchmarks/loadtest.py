@@ -0,0 +1,309 @@
+"""
+Нагрузочный тест всего API.
+
+    python -m benchmarks.loadtest --db-url sqlite://bench.sqlite3 --orders 500 \
+        --mix all --concurrency 32 --duration 30 --output bench-results.json
+
+Приложение поднимается в этом же процессе через uvicorn, пустая база
+заполняется benchmarks.dataset, затем asyncio-клиент httpx гоняет выбранную
+смесь запросов. Для Postgres --reset пересоздаёт схему public перед
+заполнением. Результат - JSON с p50/p95/p99, пропускной способностью и
+числом запросов к базе по каждому эндпоинту (из заголовков X-DB-Queries и
+X-DB-Time-Ms, см. app.metrics); его удобно сравнивать между версиями
+обычным diff.
+
+Клиенту нужен httpx: pip install -r benchmarks/requirements.txt
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+import uvicorn
+
+from benchmarks import dataset
+
+
+class Call(NamedTuple):
+    weight: int
+    label: str
+    method: str
+    path: Callable[["Scenario"], str]
+    body: Optional[Callable[["Scenario"], dict]] = None
+
+
+class Scenario:
+    def __init__(self, counts: Dict[str, int], rnd: random.Random):
+        self.counts = counts
+        self.rnd = rnd
+
+    def id(self, table: str) -> int:
+        return self.rnd.randint(1, max(self.counts[table], 1))
+
+    def day(self) -> date:
+        return dataset.START + timedelta(days=self.rnd.randrange(730))
+
+    def period(self) -> str:
+        return self.day().strftime("%Y-%m")
+
+    def window(self, days: int = 30) -> tuple:
+        start = self.day()
+        return start, start + timedelta(days=days)
+
+    def shift(self) -> dict:
+        return {
+            "date": self.day().isoformat(), "shiftNorm": 100.0,
+            "totalShift": self.rnd.uniform(60, 130), "whiteDefective": 1.0,
+            "coloredDefective": 0.5, "hourlyProduction": 12.0,
+            "worker_id": self.id("workers"),
+        }
+
+
+def _extrusion(s: Scenario) -> dict:
+    return {**s.shift(), "winding_id": s.id("winding"), "equipmentOperatinTime": 8.0,
+            "transparentDefective": 0.2, "seasonal": 1.0}
+
+
+def _paketki(s: Scenario) -> dict:
+    return {**s.shift(), "extrusion_id": s.id("extrusion"), "cutting_id": s.id("cutting"),
+            "operatinTime": 8.0, "transparentDefective": 0.2, "seasonal": 1.0}
+
+
+def _flexa(s: Scenario) -> dict:
+    return {**s.shift(), "printing_id": s.id("printing"), "operatinTime": 8.0,
+            "printDefective": 0.3}
+
+
+def _finished(s: Scenario) -> dict:
+    return {"batch_id": s.id("batches"), "worker_id": s.id("workers"),
+            "date": s.day().isoformat(), "quantity": s.rnd.randint(100, 5000),
+            "weight": s.rnd.uniform(10, 500)}
+
+
+def _date_range(name_from: str, name_to: str) -> Callable[[Scenario], str]:
+    def query(s: Scenario) -> str:
+        start, end = s.window()
+        return f"?{name_from}={start}&{name_to}={end}&limit=1000"
+    return query
+
+
+_extrusion_range = _date_range("start_date", "end_date")
+_shift_range = _date_range("date_from", "date_to")
+
+# Закрытие смены: операторы вносят выработку и обновляют остатки планов
+SHIFT_CLOSE = [
+    Call(3, "POST /extrusion/", "POST", lambda s: "/extrusion/", _extrusion),
+    Call(3, "POST /paketki/", "POST", lambda s: "/paketki/", _paketki),
+    Call(2, "POST /flexa/", "POST", lambda s: "/flexa/", _flexa),
+    Call(2, "POST /finished-products/", "POST", lambda s: "/finished-products/", _finished),
+    Call(2, "PUT /winding/{id}", "PUT", lambda s: f"/winding/{s.id('winding')}",
+         lambda s: {"remainToWind": s.rnd.uniform(0, 500)}),
+    Call(2, "PUT /cutting/{id}", "PUT", lambda s: f"/cutting/{s.id('cutting')}",
+         lambda s: {"remainToCut": s.rnd.uniform(0, 500)}),
+    Call(1, "PUT /printing/{id}", "PUT", lambda s: f"/printing/{s.id('printing')}",
+         lambda s: {"remainToPrint": s.rnd.uniform(0, 500)}),
+    Call(2, "GET /winding/{id}", "GET", lambda s: f"/winding/{s.id('winding')}"),
+    Call(1, "GET /cutting/{id}", "GET", lambda s: f"/cutting/{s.id('cutting')}"),
+]
+
+# Табло в цехах, которые опрашивают сервер по таймеру
+DASHBOARD = [
+    Call(2, "GET /workers/ranking", "GET", lambda s: "/workers/ranking"),
+    Call(3, "GET /batches/?batch_status", "GET", lambda s: "/batches/?batch_status=work"),
+    Call(3, "GET /winding/?status", "GET", lambda s: "/winding/?status=work"),
+    Call(2, "GET /cutting/?status", "GET", lambda s: "/cutting/?status=work"),
+    Call(2, "GET /orders/{id}", "GET", lambda s: f"/orders/{s.id('orders')}"),
+    Call(1, "GET /batches/{id}", "GET", lambda s: f"/batches/{s.id('batches')}"),
+    Call(1, "GET /equipment/", "GET", lambda s: "/equipment/"),
+    Call(1, "GET /equipment/{id}", "GET", lambda s: f"/equipment/{s.id('equipment')}"),
+    Call(1, "GET /workers/", "GET", lambda s: "/workers/"),
+    Call(1, "GET /workers/{id}", "GET", lambda s: f"/workers/{s.id('workers')}"),
+    Call(1, "GET /printing/?batch_id", "GET", lambda s: f"/printing/?batch_id={s.id('batches')}"),
+]
+
+# Отчёты: большие выборки, диапазоны дат и прослеживаемость
+REPORTS = [
+    Call(1, "GET /orders/", "GET", lambda s: "/orders/"),
+    Call(2, "GET /extrusion/?dates", "GET", lambda s: "/extrusion/" + _extrusion_range(s)),
+    Call(2, "GET /paketki/?dates", "GET", lambda s: "/paketki/" + _shift_range(s)),
+    Call(1, "GET /flexa/?dates", "GET", lambda s: "/flexa/" + _shift_range(s)),
+    Call(1, "GET /finished-products/?dates", "GET", lambda s: "/finished-products/" + _shift_range(s)),
+    Call(2, "GET /trace/paketki/{id}", "GET", lambda s: f"/trace/paketki/{s.id('paketki')}"),
+    Call(1, "GET /trace/orders/{id}", "GET", lambda s: f"/trace/orders/{s.id('orders')}"),
+    Call(2, "GET /workers/ranking?period", "GET", lambda s: f"/workers/ranking?period={s.period()}"),
+    Call(1, "GET /orders/{id}/batches", "GET", lambda s: f"/orders/{s.id('orders')}/batches"),
+    Call(1, "GET /batches/order/{id}", "GET", lambda s: f"/batches/order/{s.id('orders')}"),
+    Call(1, "GET /extrusion/{id}", "GET", lambda s: f"/extrusion/{s.id('extrusion')}"),
+    Call(1, "GET /paketki/{id}", "GET", lambda s: f"/paketki/{s.id('paketki')}"),
+    Call(1, "GET /flexa/{id}", "GET", lambda s: f"/flexa/{s.id('flexa')}"),
+    Call(1, "GET /finished-products/{id}", "GET",
+         lambda s: f"/finished-products/{s.id('finished_products')}"),
+    Call(1, "GET /printing/{id}", "GET", lambda s: f"/printing/{s.id('printing')}"),
+]
+
+MIXES = {
+    "shift-close": SHIFT_CLOSE,
+    "dashboard": DASHBOARD,
+    "reports": REPORTS,
+    "all": SHIFT_CLOSE + DASHBOARD + REPORTS,
+}
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[tuple], elapsed: float) -> dict:
+    latencies = [sample[0] for sample in samples]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample[1] >= 400),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "db_queries_avg": round(sum(sample[2] for sample in samples) / len(samples), 2),
+        "db_ms_avg": round(sum(sample[3] for sample in samples) / len(samples), 3),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def prepare_database(args) -> Dict[str, int]:
+    from tortoise import Tortoise
+
+    from app import migrate
+    from app.archive import MODELS
+    from app.models import Equipment, Workers
+
+    conn = Tortoise.get_connection("default")
+    if args.reset and conn.capabilities.dialect == "postgres":
+        await conn.execute_script("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+    await migrate.upgrade()
+
+    models = {**MODELS, "workers": Workers, "equipment": Equipment}
+    if await models["orders"].exists():
+        return {table: await model.all().count() for table, model in models.items()}
+    return await dataset.seed(args.orders, args.seed)
+
+
+async def drive(base_url: str, calls: List[Call], scenario: Scenario,
+                concurrency: int, duration: float) -> tuple:
+    samples: Dict[str, List[tuple]] = defaultdict(list)
+    weights = [call.weight for call in calls]
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(
+            base_url=base_url, timeout=60,
+            limits=httpx.Limits(max_connections=concurrency)
+    ) as client:
+        async def user() -> None:
+            while time.perf_counter() < deadline:
+                call = scenario.rnd.choices(calls, weights)[0]
+                body = call.body(scenario) if call.body else None
+                started = time.perf_counter()
+                response = await client.request(call.method, call.path(scenario), json=body)
+                await response.aread()
+                samples[call.label].append((
+                    time.perf_counter() - started,
+                    response.status_code,
+                    int(response.headers.get("x-db-queries", 0)),
+                    float(response.headers.get("x-db-time-ms", 0.0)),
+                ))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        return samples, time.perf_counter() - started
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test for the Cronck API")
+    parser.add_argument("--db-url", default="sqlite://bench.sqlite3")
+    parser.add_argument("--reset", action="store_true", help="recreate the Postgres schema")
+    parser.add_argument("--orders", type=int, default=500, help="dataset size in orders")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="all")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench-results.json")
+    args = parser.parse_args()
+
+    if args.db_url.startswith("sqlite://") and args.reset:
+        path = args.db_url[len("sqlite://"):]
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    # app.database читает DATABASE_URL при импорте
+    os.environ["DATABASE_URL"] = args.db_url
+    from tortoise import Tortoise
+    from app.main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    try:
+        rnd = random.Random(args.seed)
+        counts = await prepare_database(args)
+
+        samples, elapsed = await drive(
+            f"http://127.0.0.1:{port}", MIXES[args.mix], Scenario(counts, rnd),
+            args.concurrency, args.duration
+        )
+    finally:
+        server.should_exit = True
+        await serving
+        await Tortoise.close_connections()
+
+    every_sample = [sample for label in samples for sample in samples[label]]
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "db": args.db_url.split("://")[0],
+            "mix": args.mix,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 2),
+            "dataset": counts,
+        },
+        "total": summarize(every_sample, elapsed),
+        "endpoints": {label: summarize(samples[label], elapsed) for label in sorted(samples)},
+    }
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2, sort_keys=True)
+        output.write("\n")
+
+    print(f"{'endpoint':<36} {'req':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'q/req':>6}")
+    for label, row in [*report["endpoints"].items(), ("TOTAL", report["total"])]:
+        print(f"{label:<36} {row['requests']:>6} {row['errors']:>5} {row['throughput_rps']:>8} "
+              f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['db_queries_avg']:>6}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""
+Размер ответа и время до первого байта для больших списков.
+
+    python -m benchmarks.payload --db-url postgres://... --orders 20000 \
+        [--paths /orders/ "/extrusion/?limit=20000"] [--repeat 3]
+
+Приложение поднимается в этом же процессе через uvicorn (база готовится
+так же, как в benchmarks.loadtest). Каждый путь запрашивается с
+Accept-Encoding identity, gzip, br и zstd - дважды: одним ответом
+(LIST_STREAM_CHUNK=0, как раньше) и потоком. Для каждого сочетания
+печатаются байты на проводе, время до первого байта тела (TTFB) и полное
+время, медиана по --repeat запросам.
+
+Клиенту нужен httpx: pip install -r benchmarks/requirements.txt
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import List
+
+import httpx
+import uvicorn
+
+from benchmarks.loadtest import free_port, prepare_database
+
+ENCODINGS = ("identity", "gzip", "br", "zstd")
+
+
+async def measure(client: httpx.AsyncClient, path: str, encoding: str) -> tuple:
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    async with client.stream("GET", path, headers={"accept-encoding": encoding}) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            if first_byte is None:
+                first_byte = time.perf_counter()
+            size += len(chunk)
+        served = response.headers.get("content-encoding", "identity")
+    finished = time.perf_counter()
+    return served, size, (first_byte or finished) - started, finished - started
+
+
+async def run(base_url: str, paths: List[str], repeat: int) -> None:
+    from app import responses
+
+    stream_chunk = responses.LIST_STREAM_CHUNK
+    print(f"{'path':<28} {'mode':<7} {'encoding':<9} {'bytes':>12} {'ttfb ms':>9} {'total ms':>9}")
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        for path in paths:
+            for mode, chunk in (("single", 0), ("stream", stream_chunk)):
+                responses.LIST_STREAM_CHUNK = chunk
+                for encoding in ENCODINGS:
+                    samples = [await measure(client, path, encoding) for _ in range(repeat)]
+                    print(f"{path:<28} {mode:<7} {samples[0][0]:<9} {samples[0][1]:>12,} "
+                          f"{statistics.median(s[2] for s in samples) * 1000:>9.1f} "
+                          f"{statistics.median(s[3] for s in samples) * 1000:>9.1f}")
+    responses.LIST_STREAM_CHUNK = stream_chunk
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Payload size and TTFB of large list responses")
+    parser.add_argument("--db-url", default="sqlite://bench.sqlite3")
+    parser.add_argument("--reset", action="store_true", help="recreate the Postgres schema")
+    parser.add_argument("--orders", type=int, default=10_000, help="dataset size in orders")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--paths", nargs="+", default=["/orders/", "/extrusion/?limit=20000"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # app.database читает DATABASE_URL при импорте
+    os.environ["DATABASE_URL"] = args.db_url
+    from tortoise import Tortoise
+    from app.main import app
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    try:
+        await prepare_database(args)
+        await run(f"http://127.0.0.1:{port}", args.paths, args.repeat)
+    finally:
+        server.should_exit = True
+        await serving
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Сравнение старого и нового пути сериализации списков на 10k строк экструзии.
+
+    python -m benchmarks.serialization [--rows 10000] [--repeat 5]
+
+По умолчанию используется SQLite в памяти; BENCH_DB_URL задаёт другую базу.
+"before" повторяет прежнюю цепочку: ORM-объекты, схема на каждую строку и
+повторная проверка по response_model в FastAPI с json.dumps. "after" -
+.values(), один TypeAdapter на список и orjson.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import date, timedelta
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+from tortoise import Tortoise, run_async
+
+from app import migrate
+from app.models import Orders, Batches, Equipment, Workers, Winding, Extrusion
+from app.responses import list_adapter, schema_fields
+from app.schemas import ExtrusionSchema
+
+DB_URL = os.getenv("BENCH_DB_URL", "sqlite://:memory:")
+
+
+async def seed(rows: int) -> None:
+    order = await Orders.create(
+        client="bench", orderStatus="open", orderNumber="BENCH-1", productName="bag",
+        sleeveName="sleeve", orderDate=date(2024, 1, 1), quantity=1, orderWeight=1.0,
+        productType="bag", pack=1, packaging=1, width=1.0, length=1.0, thickness=1.0,
+        widthSquared=1.0, lengthSquared=1.0, thicknessSquared=1.0, density=1.0,
+        weightWithoutCutting=1.0, weightWithCutting=1.0
+    )
+    batch = await Batches.create(order=order, batchNumber="1", batchStatus="open")
+    equipment = await Equipment.create(name="bench")
+    worker = await Workers.create(FIO="bench")
+    winding = await Winding.create(
+        batch=batch, equipment=equipment, priority=1, status="open", norm=1.0, days=1.0,
+        winding=1.0, requiredToWind=1.0, remainToWind=1.0
+    )
+    await Extrusion.bulk_create([
+        Extrusion(
+            winding=winding, worker=worker, date=date(2024, 1, 1) + timedelta(days=i % 365),
+            equipmentOperatinTime=8.0, shiftNorm=100.0, totalShift=90.0 + i % 20,
+            whiteDefective=1.0, transparentDefective=0.5, coloredDefective=0.0,
+            hourlyProduction=12.5, seasonal=1.0
+        )
+        for i in range(rows)
+    ], batch_size=1000)
+
+
+async def before() -> bytes:
+    objects = await Extrusion.all()
+    content = [ExtrusionSchema.model_validate(obj) for obj in objects]
+    # FastAPI: model_dump, проверка по response_model, сериализация и json.dumps
+    adapter = TypeAdapter(List[ExtrusionSchema])
+    dumped = [item.model_dump() for item in content]
+    value = adapter.validate_python(dumped)
+    return json.dumps(adapter.dump_python(value, mode="json")).encode()
+
+
+async def after() -> bytes:
+    rows = await Extrusion.all().values(*schema_fields(ExtrusionSchema))
+    list_adapter(ExtrusionSchema).validate_python(rows)
+    return orjson.dumps(rows)
+
+
+async def measure(label: str, func, repeat: int) -> float:
+    await func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await func()
+        timings.append(time.perf_counter() - started)
+    best = min(timings)
+    print(f"{label:>7}: best {best * 1000:8.1f} ms, {len(body) / 1024:8.1f} KiB")
+    return best
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    await Tortoise.init(db_url=DB_URL, modules={"models": ["app.models"]})
+    await migrate.upgrade()
+    await seed(args.rows)
+
+    print(f"{args.rows} extrusion rows, {DB_URL}")
+    old = await measure("before", before, args.repeat)
+    new = await measure("after", after, args.repeat)
+    print(f"speedup: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    run_async(main())
@@ -0,0 +1,74 @@
+"""
+Проверка бюджета холодного старта приложения.
+
+    python -m benchmarks.startup [--budget-ms 1500] [--runs 5]
+
+Каждый прогон - отдельный процесс Python: импорт app.main и обработчики
+startup (открытие соединения с базой), то есть то, что происходит до
+первого ответа при перезапуске. Берётся медиана; если она больше бюджета,
+скрипт завершается с кодом 1. База берётся из DATABASE_URL, схема должна
+быть создана заранее (python -m app.migrate). Тот же замер с бюджетом
+проверяет tests/test_startup.py на временной базе SQLite.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+PROBE = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def run():
+    await app.router.startup()
+    ready = time.perf_counter()
+    await app.router.shutdown()
+    from tortoise import Tortoise
+    await Tortoise.close_connections()
+    return ready
+
+ready = asyncio.run(run())
+print(json.dumps({"import_ms": (imported - started) * 1000, "total_ms": (ready - started) * 1000}))
+"""
+
+
+def probe() -> dict:
+    """Один холодный старт в отдельном процессе: {"import_ms", "total_ms"}."""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True,
+        cwd=ROOT, env={**os.environ, "PYTHONPATH": ROOT}
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int) -> dict:
+    """Медианы import_ms и total_ms по runs прогонам probe()."""
+    samples = [probe() for _ in range(runs)]
+    return {key: statistics.median(sample[key] for sample in samples) for key in ("import_ms", "total_ms")}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cold start budget check")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault("DATABASE_URL", "sqlite://bench.sqlite3")
+    medians = measure(args.runs)
+
+    print(f"import app.main  {medians['import_ms']:8.1f} ms")
+    print(f"ready to serve   {medians['total_ms']:8.1f} ms  (budget {args.budget_ms:.0f} ms)")
+    if medians["total_ms"] > args.budget_ms:
+        print("Startup budget exceeded")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""Бюджет холодного старта (benchmarks/startup.py) на временной базе SQLite."""
+import os
+import subprocess
+import sys
+
+from benchmarks.startup import ROOT, STARTUP_BUDGET_MS, measure
+
+RUNS = 5
+
+
+def test_startup_within_budget(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite://{tmp_path / 'startup.sqlite3'}")
+    subprocess.run([sys.executable, "-m", "app.migrate"], cwd=ROOT, check=True, capture_output=True,
+                   env={**os.environ, "PYTHONPATH": ROOT})
+
+    medians = measure(RUNS)
+
+    assert medians["total_ms"] <= STARTUP_BUDGET_MS, (
+        f"Median cold start {medians['total_ms']:.0f} ms exceeds {STARTUP_BUDGET_MS:.0f} ms "
+        f"(import app.main {medians['import_ms']:.0f} ms)"
+    )